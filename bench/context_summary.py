@@ -0,0 +1,99 @@
+"""Benchmark: queries and latency per message for the user context summary
+
+Compares the original implementation (four queries, every task row loaded)
+with the aggregate query and the cached path. Runs against a local SQLite
+database by default; pass a SQLAlchemy URL to use another database.
+
+    python -m bench.context_summary [--tasks 500] [--messages 200] [--db-url URL]
+"""
+from flask import Flask
+from sqlalchemy import event
+from datetime import datetime, timedelta
+import argparse
+import tempfile
+import time
+import os
+
+from src.models.user import db, User, Chat, Task
+from src.routes.chat import get_user_context_summary
+from src.services.context_cache import context_cache
+
+def legacy_context_summary(user_id):
+    """The summary as it was computed before the cache and aggregate query"""
+    user = User.query.get(user_id)
+    completed_tasks = Task.query.filter_by(user_id=user_id, completed=True).all()
+    pending_tasks = Task.query.filter_by(user_id=user_id, completed=False).all()
+    first_chat = Chat.query.filter_by(user_id=user_id).order_by(Chat.timestamp.asc()).first()
+    first_interaction_date = first_chat.timestamp if first_chat else datetime.utcnow()
+    days_since_first = (datetime.utcnow() - first_interaction_date).days
+    context = [f"User has been interacting with you for {days_since_first} days."]
+    if completed_tasks:
+        completion_rate = len(completed_tasks) / (len(completed_tasks) + len(pending_tasks)) * 100 if pending_tasks else 100
+        context.append(f"User has completed {len(completed_tasks)} tasks with a {completion_rate:.0f}% completion rate.")
+    if pending_tasks:
+        context.append(f"User currently has {len(pending_tasks)} pending tasks.")
+        context.extend(f"- {task.description} (due {task.deadline.strftime('%Y-%m-%d')})" for task in pending_tasks[:3])
+    return "\n".join(context)
+
+def seed(tasks):
+    user = User(email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    db.session.add(Chat(user_id=user.id, message='hi', response='hello', timestamp=now - timedelta(days=30)))
+    db.session.add_all(Task(
+        user_id=user.id,
+        description=f"Task number {i} with a reasonably long description to load",
+        deadline=now + timedelta(days=i % 14),
+        completed=i % 3 == 0
+    ) for i in range(tasks))
+    db.session.commit()
+    return user.id
+
+def measure(label, fn, user_id, messages, counter):
+    db.session.expire_all()
+    counter['n'] = 0
+    started = time.perf_counter()
+    for _ in range(messages):
+        fn(user_id)
+        db.session.expire_all()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {counter['n'] / messages:>8.2f} queries/msg {elapsed / messages * 1000:>9.3f} ms/msg")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--db-url')
+    args = parser.parse_args()
+    
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.db_url or f"sqlite:///{db_path}"
+    db.init_app(app)
+    
+    with app.app_context():
+        db.create_all()
+        user_id = seed(args.tasks)
+        
+        counter = {'n': 0}
+        def count_query(*_):
+            counter['n'] += 1
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+        
+        print(f"{args.tasks} tasks, {args.messages} messages")
+        measure('before (legacy)', legacy_context_summary, user_id, args.messages, counter)
+        
+        def uncached(uid):
+            context_cache.clear()
+            return get_user_context_summary(uid)
+        measure('after, cache miss', uncached, user_id, args.messages, counter)
+        
+        context_cache.clear()
+        measure('after, cache hit', get_user_context_summary, user_id, args.messages, counter)
+        
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
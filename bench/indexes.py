@@ -0,0 +1,110 @@
+"""Benchmark: hot-path query plans and timings before and after the index migrations
+
+Seeds a large dataset, drops the hot-path indexes, records EXPLAIN output
+and timings, applies the migrations and records them again.
+
+    python -m bench.indexes [--users 2000] [--chats 200000] [--tasks 50000] [--db-url URL]
+"""
+from flask import Flask
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import argparse
+import tempfile
+import random
+import time
+import os
+
+from src.models.user import db, User, Chat, Task
+from src.migrations import upgrade, MIGRATIONS_TABLE
+
+INDEXES = ['ix_chats_user_id_timestamp', 'ix_tasks_user_id_completed_deadline',
+           'ix_users_last_login', 'ix_tasks_pending_deadline']
+
+QUERIES = {
+    'recent chats for user': ("SELECT id, message, response, timestamp FROM chats WHERE user_id = :user_id "
+                              "ORDER BY timestamp DESC, id DESC LIMIT 50"),
+    'pending tasks for user': ("SELECT id, description, deadline FROM tasks WHERE user_id = :user_id "
+                               "AND completed = false ORDER BY deadline"),
+    'pending tasks by deadline': ("SELECT id, user_id, deadline FROM tasks WHERE completed = false "
+                                  "AND deadline < :now ORDER BY deadline LIMIT 100"),
+    'active users (24h)': "SELECT count(*) FROM users WHERE last_login >= :since",
+}
+
+def seed(users, chats, tasks):
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    db.session.execute(User.__table__.insert(), [{
+        'email': f"user{i}@example.com", 'password_hash': 'x', 'created_at': now - timedelta(days=90),
+        'last_login': now - timedelta(hours=rng.randint(0, 24 * 60)), 'is_admin': False
+    } for i in range(users)])
+    for start in range(0, chats, 20000):
+        db.session.execute(Chat.__table__.insert(), [{
+            'user_id': rng.randint(1, users), 'message': 'message text', 'response': 'response text',
+            'timestamp': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90)), 'is_system_message': False
+        } for _ in range(start, min(start + 20000, chats))])
+    db.session.execute(Task.__table__.insert(), [{
+        'user_id': rng.randint(1, users), 'description': 'task description',
+        'deadline': now + timedelta(hours=rng.randint(-24 * 30, 24 * 7)), 'completed': rng.random() < 0.7,
+        'created_at': now - timedelta(days=rng.randint(0, 90))
+    } for _ in range(tasks)])
+    db.session.commit()
+
+def explain(connection, sql, params):
+    if connection.dialect.name == 'postgresql':
+        rows = connection.execute(text(f"EXPLAIN ANALYZE {sql}"), params)
+        return [row[0] for row in rows]
+    rows = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params)
+    return [row[-1] for row in rows]
+
+def report(label, params, repeat):
+    print(f"\n=== {label} ===")
+    with db.engine.connect() as connection:
+        for name, sql in QUERIES.items():
+            plan = explain(connection, sql, params)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(text(sql), params).fetchall()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            print(f"{name:<28} {elapsed:>9.3f} ms")
+            for line in plan:
+                print(f"    {line}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=200000)
+    parser.add_argument('--tasks', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--db-url')
+    args = parser.parse_args()
+    
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.db_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    db.init_app(app)
+    
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE IF EXISTS {MIGRATIONS_TABLE}"))
+            for index in INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+        
+        print(f"Seeding {args.users} users, {args.chats} chats, {args.tasks} tasks...")
+        seed(args.users, args.chats, args.tasks)
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        
+        now = datetime.utcnow()
+        params = {'user_id': args.users // 2, 'now': now, 'since': now - timedelta(days=1)}
+        
+        report('before migrations', params, args.repeat)
+        print(f"\nApplied migrations: {upgrade(db.engine)}")
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+        report('after migrations', params, args.repeat)
+        
+        db.drop_all()
+
+if __name__ == '__main__':
+    main()
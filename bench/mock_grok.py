@@ -0,0 +1,156 @@
+"""Local mock of the Grok chat completions API for load tests
+
+Injects a configurable latency distribution, error rate and streaming
+speed. Point the app at it with GROK_API_URL=http://host:port/v1/chat/completions.
+
+    python -m bench.mock_grok [--port 8099] [--latency lognormal:-0.5,0.5] [--error-rate 0.02]
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import threading
+import random
+import json
+import time
+import sys
+
+REPLIES = [
+    "Listen paaru, no excuses today. Report back when it is done, samjha?",
+    "You are slacking. Finish what I gave you before asking for more.",
+    "Good. Now do better tomorrow, paaru.",
+]
+
+TASK_BLOCK = '```json\n{"tasks": [{"description": "Walk 5000 steps before dinner", "deadline_days": 1}]}\n```'
+
+def parse_latency(spec):
+    """Build a sampler from 'fixed:S', 'uniform:A,B', 'normal:MEAN,SD' or 'lognormal:MU,SIGMA' (seconds)"""
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal':
+        return lambda: random.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class MockGrokHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    # Set by make_server
+    latency = staticmethod(lambda: 0.0)
+    error_rate = 0.0
+    task_rate = 0.3
+    token_delay = 0.01
+    
+    requests_served = 0
+    _lock = threading.Lock()
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            payload = {}
+        
+        with MockGrokHandler._lock:
+            MockGrokHandler.requests_served += 1
+        
+        time.sleep(self.latency())
+        
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500, 503])
+            body = json.dumps({'error': 'injected failure'}).encode()
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        
+        text = random.choice(REPLIES)
+        if random.random() < self.task_rate:
+            text = f"{text} {TASK_BLOCK}"
+        prompt_tokens = sum(len(message.get('content', '')) for message in payload.get('messages', [])) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(text) // 4,
+                 'total_tokens': prompt_tokens + len(text) // 4}
+        
+        if payload.get('stream'):
+            self._stream(text, usage)
+        else:
+            body = json.dumps({
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': usage
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    
+    def _stream(self, text, usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        
+        def send(data):
+            frame = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(frame):X}\r\n".encode() + frame + b"\r\n")
+            self.wfile.flush()
+        
+        words = text.split(' ')
+        for index, word in enumerate(words):
+            piece = word if index == 0 else f" {word}"
+            send(json.dumps({'choices': [{'index': 0, 'delta': {'content': piece}}]}))
+            time.sleep(self.token_delay)
+        send(json.dumps({'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}))
+        send('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+
+class MockGrokServer(ThreadingHTTPServer):
+    daemon_threads = True
+    
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected during load tests
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+def make_server(host='127.0.0.1', port=0, latency='fixed:0.2', error_rate=0.0, task_rate=0.3, token_delay=0.01):
+    """Create (but do not start) a mock server; returns (server, completions_url)"""
+    handler = type('ConfiguredMockGrokHandler', (MockGrokHandler,), {
+        'latency': staticmethod(parse_latency(latency)),
+        'error_rate': error_rate,
+        'task_rate': task_rate,
+        'token_delay': token_delay
+    })
+    server = MockGrokServer((host, port), handler)
+    url = f"http://{host}:{server.server_address[1]}/v1/chat/completions"
+    return server, url
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', default='fixed:0.2', help="fixed:S, uniform:A,B, normal:MEAN,SD or lognormal:MU,SIGMA")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--task-rate', type=float, default=0.3)
+    parser.add_argument('--token-delay', type=float, default=0.01, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+    
+    server, url = make_server(args.host, args.port, args.latency, args.error_rate, args.task_rate, args.token_delay)
+    print(f"Mock Grok API listening on {url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
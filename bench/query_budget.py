@@ -0,0 +1,113 @@
+"""Benchmark: SQL queries per route against the declared query budgets
+
+Seeds a user with a long chat history and many tasks, requests every page and
+JSON endpoint with the Flask test client in strict budget mode and prints the
+number of queries each one ran, then revalidates the cacheable pages with
+their ETag. Exits non-zero if any route breaks its budget, shows an N+1
+pattern or is not answered with 304 when unchanged.
+
+    python -m bench.query_budget [--chats 500] [--tasks 200]
+"""
+from datetime import datetime, timedelta
+import argparse
+import tempfile
+import sys
+import os
+
+def seed(db, user_id, chats, tasks):
+    from sqlalchemy import insert
+    from src.models.user import Chat, Task
+    
+    now = datetime.utcnow()
+    db.session.execute(insert(Chat), [{
+        'user_id': user_id, 'message': f"message {i}", 'response': f"response {i}",
+        'timestamp': now - timedelta(minutes=chats - i), 'is_system_message': False
+    } for i in range(chats)])
+    db.session.execute(insert(Task), [{
+        'user_id': user_id, 'description': f"task {i}", 'deadline': now + timedelta(days=i % 10 - 3),
+        'completed': i % 3 == 0, 'completed_at': now if i % 3 == 0 else None, 'created_at': now
+    } for i in range(tasks)])
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--tasks', type=int, default=200)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='query-budget-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['QUERY_BUDGET_MODE'] = 'strict'
+    os.environ['CHAT_WORKER_THREADS'] = '0'
+    
+    from src.main import app
+    from src.models.user import db, User, Chat, Task
+    from src.services.query_budget import count_queries, QueryBudgetExceeded
+    from src.migrations import upgrade, seed_admin
+    from src.services.stats import ensure_stats_built
+    
+    with app.app_context():
+        upgrade(db.engine)
+        seed_admin()
+        ensure_stats_built()
+    
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    client = app.test_client()
+    admin = app.test_client()
+    client.post('/signup', data={'email': 'bench@example.com', 'password': 'bench'})
+    client.post('/login', data={'email': 'bench@example.com', 'password': 'bench'})
+    admin.post('/login', data={'email': 'admin@example.com', 'password': 'admin123'})
+    
+    with app.app_context():
+        user_id = User.query.filter_by(email='bench@example.com').one().id
+        seed(db, user_id, args.chats, args.tasks)
+        chat_id = db.session.query(db.func.max(Chat.id)).scalar()
+        task_id = Task.query.filter_by(user_id=user_id, completed=False).first().id
+    
+    routes = [
+        (client, 'GET', '/profile', None),
+        (client, 'GET', '/chat/', None),
+        (client, 'GET', '/chat/history', None),
+        (client, 'POST', '/chat/send', {'message': 'Plan my week'}),
+        (client, 'GET', f"/chat/result/{chat_id}", None),
+        (client, 'GET', '/task/', None),
+        (client, 'GET', '/task/api', None),
+        (client, 'GET', '/events/?wait=0', None),
+        (client, 'POST', '/task/add', {'description': 'Bench task', 'days': '2'}),
+        (client, 'POST', f"/task/complete/{task_id}", None),
+        (admin, 'GET', '/admin/', None),
+        (admin, 'GET', '/admin/users', None),
+        (admin, 'GET', '/admin/system-prompt', None),
+        (admin, 'GET', '/admin/api/users', None),
+        (admin, 'GET', f"/admin/user/{user_id}", None),
+        (admin, 'GET', f"/admin/api/user/{user_id}/chats", None),
+        (admin, 'GET', f"/admin/api/user/{user_id}/archive", None),
+        (admin, 'GET', '/admin/search?q=message', None),
+        (admin, 'GET', '/admin/api/search?q=task&type=tasks', None),
+        (admin, 'POST', f"/admin/user/{user_id}/assign-task", {'description': 'Admin task', 'days': '1'}),
+    ]
+    
+    failures = 0
+    print(f"{'route':<40} {'status':>6} {'queries':>8}")
+    for route_client, method, path, data in routes:
+        try:
+            with count_queries() as log:
+                response = route_client.open(path, method=method, data=data)
+            print(f"{method + ' ' + path:<40} {response.status_code:>6} {log.count:>8}")
+        except QueryBudgetExceeded as e:
+            failures += 1
+            print(f"{method + ' ' + path:<40} {'FAIL':>6}\n{e}")
+    
+    # A page the browser already has costs only its data version query
+    for path in ['/chat/', '/chat/history', '/task/', '/task/api']:
+        etag = client.get(path).headers['ETag']
+        with count_queries() as log:
+            response = client.get(path, headers={'If-None-Match': etag})
+        print(f"{'GET ' + path + ' (revalidated)':<40} {response.status_code:>6} {log.count:>8}")
+        if response.status_code != 304:
+            failures += 1
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
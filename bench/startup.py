@@ -0,0 +1,104 @@
+"""Benchmark: cold start and time to first request
+
+Measures how long importing the app takes and how many database connections
+and queries that makes, then starts gunicorn with and without --preload and
+times how long it takes until the first request is answered.
+
+    python -m bench.startup [--runs 5] [--workers 4] [--db-url URL]
+"""
+from bench.loadtest import free_port
+import statistics
+import subprocess
+import argparse
+import tempfile
+import requests
+import json
+import time
+import sys
+import os
+
+# Run in a fresh interpreter so nothing is imported yet
+IMPORT_PROBE = """
+import json, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+counts = {'connections': 0, 'queries': 0}
+event.listen(Pool, 'connect', lambda *args: counts.__setitem__('connections', counts['connections'] + 1))
+event.listen(Engine, 'before_cursor_execute', lambda *args: counts.__setitem__('queries', counts['queries'] + 1))
+started = time.perf_counter()
+import src.main
+counts['seconds'] = time.perf_counter() - started
+print(json.dumps(counts))
+"""
+
+def time_import(env):
+    """Import the app in a new interpreter; returns seconds, connections and queries"""
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], env=env, capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+def time_first_request(env, workers, preload, log):
+    """Start gunicorn and return the seconds until /login first answers"""
+    port = free_port()
+    env = dict(env, GUNICORN_PRELOAD='true' if preload else 'false')
+    command = [sys.executable, '-m', 'gunicorn', '-b', f'127.0.0.1:{port}', '-w', str(workers), 'src.main:app']
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        while time.perf_counter() - started < 60:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited during startup, see {log.name}")
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/login", timeout=5).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("gunicorn did not answer within 60s")
+    finally:
+        process.terminate()
+        process.wait(30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--db-url', help="SQLAlchemy URL; defaults to a fresh SQLite file")
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': args.db_url or f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'SECRET_KEY': 'startup-bench',
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'metrics')
+    })
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+    log = open(os.path.join(workdir, 'app.log'), 'w')
+    
+    # The release step runs once per deploy, outside the measured startup
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.main', 'db', 'setup'], env=env, stdout=log,
+                   stderr=subprocess.STDOUT, check=True)
+    
+    imports = [time_import(env) for _ in range(args.runs)]
+    print(f"{'measurement':<34} {'median ms':>10} {'min ms':>9} {'max ms':>9}")
+    for label, values in [
+        ('import src.main', [run['seconds'] for run in imports]),
+        ('interpreter + import', [run['process_seconds'] for run in imports]),
+    ]:
+        print(f"{label:<34} {statistics.median(values) * 1000:>10.1f} {min(values) * 1000:>9.1f} {max(values) * 1000:>9.1f}")
+    
+    for preload in (False, True):
+        values = [time_first_request(env, args.workers, preload, log) for _ in range(args.runs)]
+        label = f"first request, {args.workers} workers{', preload' if preload else ''}"
+        print(f"{label:<34} {statistics.median(values) * 1000:>10.1f} {min(values) * 1000:>9.1f} {max(values) * 1000:>9.1f}")
+    
+    print(f"\nDatabase work while importing the app: {imports[-1]['connections']} connections, "
+          f"{imports[-1]['queries']} queries")
+    print(f"Logs in {workdir}")
+
+if __name__ == '__main__':
+    main()
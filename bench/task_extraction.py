@@ -0,0 +1,65 @@
+"""Micro-benchmarks for task extraction on short, long and adversarial responses
+
+Compares the original uncompiled regex extraction with extract_tasks() and
+the incremental TaskStreamParser.
+
+    python -m bench.task_extraction [--repeat 200]
+"""
+import argparse
+import json
+import re
+import timeit
+
+from src.services.task_extraction import extract_tasks, TaskStreamParser
+
+TASK_BLOCK = '```json\n{"tasks": [{"description": "Do 20 pushups before breakfast", "deadline_days": 1}]}\n```'
+
+CASES = {
+    'short': f"Listen paaru, you will do this today. {TASK_BLOCK}",
+    'long': ("Samjha? " + "You will follow my instructions without excuses. " * 400) + TASK_BLOCK,
+    'long, no block': "Samjha? " + "You will follow my instructions without excuses. " * 400,
+    # Many 'task' mentions and no colon: the old fallback regex rescans to the end for each one
+    'adversarial': "task " * 4000,
+    'many blocks': " ".join(f"Step {i}. {TASK_BLOCK}" for i in range(50)),
+}
+
+def legacy_extract(assistant_response):
+    """The extraction as it was done inline in send_message"""
+    json_pattern = r'```json\s*(.*?)\s*```'
+    json_matches = re.findall(json_pattern, assistant_response, re.DOTALL)
+    tasks = []
+    if json_matches:
+        try:
+            json_data = json.loads(json_matches[0])
+            clean_response = re.sub(json_pattern, '', assistant_response, flags=re.DOTALL).strip()
+            if 'tasks' in json_data and isinstance(json_data['tasks'], list):
+                tasks = [task for task in json_data['tasks'] if 'description' in task]
+            assistant_response = clean_response
+        except json.JSONDecodeError:
+            pass
+    else:
+        task_pattern = r'task.*?:\s*(.*?)(?:\.|\n|$)'
+        tasks = [task for task in re.findall(task_pattern, assistant_response, re.IGNORECASE) if len(task.strip()) > 10]
+    return assistant_response, tasks
+
+def streamed_extract(text, chunk_size=8):
+    parser = TaskStreamParser()
+    for start in range(0, len(text), chunk_size):
+        parser.feed(text[start:start + chunk_size])
+    return parser.finish()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    
+    print(f"{'case':<18} {'chars':>7} {'legacy':>12} {'extract':>12} {'streamed':>12}")
+    for name, text in CASES.items():
+        timings = []
+        for fn in (legacy_extract, extract_tasks, streamed_extract):
+            seconds = timeit.timeit(lambda: fn(text), number=args.repeat)
+            timings.append(f"{seconds / args.repeat * 1e6:>9.1f} us")
+        print(f"{name:<18} {len(text):>7} {timings[0]:>12} {timings[1]:>12} {timings[2]:>12}")
+
+if __name__ == '__main__':
+    main()
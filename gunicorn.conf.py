@@ -0,0 +1,45 @@
+# Gunicorn settings, loaded automatically from the working directory
+import os
+import tempfile
+
+# Threads per worker (gunicorn switches to the gthread worker when this is
+# above 1). Open live-update streams and long polls may wait on at most half
+# of them (EVENTS_MAX_WAITING), for EVENTS_HOLD_SECONDS each, so the other
+# half is always free for page and API requests.
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+
+# Import the app once in the master and fork workers from it, so each worker
+# starts warm. Creating the app opens no database connections, so nothing
+# unsafe is inherited by the forks
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Metrics from all workers are aggregated through files in this directory
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+
+def on_starting(server):
+    # Start each deploy with an empty metrics directory
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+def post_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    # Connections must never be shared across processes; drop any the master opened
+    from src.main import app
+    from src.models.user import db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def post_worker_init(worker):
+    # Threads do not survive a fork, so each worker starts its own chat workers
+    from src.main import start_background_workers
+    start_background_workers(worker.wsgi)
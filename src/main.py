@@ -7,6 +7,16 @@ from src.routes.auth import auth_bp
 from src.routes.chat import chat_bp
 from src.routes.task import task_bp
 from src.routes.admin import admin_bp
+from src.routes.events import events_bp
+from src.services.job_queue import start_chat_workers
+from src.services.stats import register_stats_commands
+from src.services.retention import register_retention_commands
+from src.services.deadlines import register_deadline_commands
+from src.services.metrics import init_metrics
+from src.services.query_budget import init_query_budget
+from src.services.database import configure_database, init_replica_routing
+from src.services.http_cache import init_http_cache
+from src.migrations import register_migration_commands
 import logging
 
 # Set up logging
@@ -22,11 +32,28 @@ def create_app():
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24))
     
-    # Database configuration with better error handling
-    db_uri = f"postgresql://{os.getenv('DB_USERNAME', 'postgres')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'postgres')}"
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    # Database configuration with better error handling. DATABASE_URL (e.g. a local
+    # SQLite file for benchmarks) takes precedence over the DB_* variables.
+    db_uri = os.getenv('DATABASE_URL') or f"postgresql://{os.getenv('DB_USERNAME', 'postgres')}:{os.getenv('DB_PASSWORD', 'password')}@{os.getenv('DB_HOST', 'localhost')}:{os.getenv('DB_PORT', '5432')}/{os.getenv('DB_NAME', 'postgres')}"
+    if db_uri.startswith('postgres://'):
+        db_uri = db_uri.replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Pool sizing, pre-ping, statement timeouts and the optional read replica (DB_* variables)
+    configure_database(app, db_uri)
+    
+    # By default /chat/send streams the reply token by token, holding a web thread
+    # for the length of the completion. CHAT_QUEUE_ENABLED=true queues the Grok call
+    # for worker threads instead, which frees web threads but shows progress only
+    # through polling. Set CHAT_WORKER_THREADS=0 when running a separate
+    # `python -m src.worker` process.
+    app.config['CHAT_QUEUE_ENABLED'] = os.environ.get('CHAT_QUEUE_ENABLED', 'false').lower() == 'true'
+    app.config['CHAT_WORKER_THREADS'] = int(os.environ.get('CHAT_WORKER_THREADS', '2'))
+    
+    # Per-request query budgets: 'log' warns about requests over budget or with
+    # N+1 patterns, 'strict' turns them into errors (for tests), 'off' disables counting
+    app.config['QUERY_BUDGET_MODE'] = os.environ.get('QUERY_BUDGET_MODE', 'log')
+    
     # Log database connection details (without password)
     safe_db_uri = db_uri.replace(os.getenv('DB_PASSWORD', 'password'), '********')
     logger.info(f"Connecting to database: {safe_db_uri}")
@@ -39,30 +66,24 @@ def create_app():
     app.register_blueprint(chat_bp, url_prefix='/chat')
     app.register_blueprint(task_bp, url_prefix='/task')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(events_bp, url_prefix='/events')
+    
+    # Request, database and Grok API metrics, exposed at /metrics
+    init_metrics(app)
+    init_query_budget(app)
+    init_replica_routing(app)
     
-    # Create database tables with error handling
-    with app.app_context():
-        try:
-            logger.info("Attempting to create database tables...")
-            db.create_all()
-            logger.info("Database tables created successfully")
-            
-            # Create admin user if not exists
-            from src.models.user import User
-            admin = User.query.filter_by(email='admin@example.com').first()
-            if not admin:
-                admin = User(email='admin@example.com', is_admin=True)
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
-                logger.info("Admin user created: admin@example.com / admin123")
-            else:
-                logger.info("Admin user already exists")
-        except Exception as e:
-            logger.error(f"Error during database initialization: {str(e)}")
-            logger.error("Database connection failed. Please check your environment variables and database configuration.")
-            # Continue execution to allow the app to start even if DB fails
-            # This prevents the app from getting stuck in a loading state
+    # ETags, static asset fingerprints and response compression
+    init_http_cache(app)
+    
+    # CLI commands
+    register_migration_commands(app)
+    register_stats_commands(app)
+    register_retention_commands(app)
+    register_deadline_commands(app)
+    
+    # Creating the app makes no database round trips: the schema and the admin user
+    # come from `flask db setup`, run once per deploy
     
     @app.route('/')
     def index():
@@ -80,10 +101,19 @@ def create_app():
     
     return app
 
+def start_background_workers(app):
+    """Start the in-process chat workers; called once per serving process, after any fork"""
+    if app.config['CHAT_QUEUE_ENABLED']:
+        start_chat_workers(app, app.config['CHAT_WORKER_THREADS'])
+    elif app.config['CHAT_WORKER_THREADS'] > 0:
+        # Without the queue one thread still runs the periodic maintenance
+        start_chat_workers(app, 1, take_jobs=False)
+
 app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    start_background_workers(app)
     logger.info(f"Starting application on port {port}")
     app.run(host='0.0.0.0', port=port, debug=False)
 else:
@@ -0,0 +1,410 @@
+"""Versioned schema migrations, run once per deploy as a release step:
+
+    flask --app src.main db setup      (upgrade, seed the admin user, build the stats rollups)
+    flask --app src.main db upgrade
+    flask --app src.main db status
+"""
+from src.models.user import db
+from sqlalchemy import (text, inspect, select, MetaData, Table, Column, Index, ForeignKey, Integer, BigInteger,
+                        String, Text, Boolean, DateTime, Date, Float, LargeBinary)
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+# Seeded by `flask db seed`; change the password after the first login
+DEFAULT_ADMIN_EMAIL = 'admin@example.com'
+DEFAULT_ADMIN_PASSWORD = 'admin123'
+
+def _create_initial_schema(connection):
+    """Baseline tables, frozen as they were when migrations were introduced.
+    
+    Later schema changes get their own migrations, so this never follows the models.
+    """
+    metadata = MetaData()
+    Table('users', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('email', String(120), unique=True, nullable=False),
+          Column('password_hash', String(256), nullable=False),
+          Column('created_at', DateTime),
+          Column('last_login', DateTime),
+          Column('is_admin', Boolean),
+          Index('ix_users_last_login', 'last_login'))
+    Table('chats', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('message', Text, nullable=False),
+          Column('response', Text, nullable=False),
+          Column('timestamp', DateTime),
+          Column('is_system_message', Boolean),
+          Index('ix_chats_user_id_timestamp', 'user_id', 'timestamp'))
+    Table('tasks', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('description', Text, nullable=False),
+          Column('deadline', DateTime, nullable=False),
+          Column('completed', Boolean),
+          Column('created_at', DateTime),
+          Column('completed_at', DateTime),
+          Index('ix_tasks_user_id_completed_deadline', 'user_id', 'completed', 'deadline'),
+          Index('ix_tasks_pending_deadline', 'deadline',
+                postgresql_where=text('completed = false'), sqlite_where=text('completed = false')))
+    Table('chat_jobs', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('chat_id', Integer, ForeignKey('chats.id'), unique=True, nullable=False),
+          Column('user_id', Integer, ForeignKey('users.id'), nullable=False),
+          Column('status', String(20), nullable=False, index=True),
+          Column('attempts', Integer, nullable=False),
+          Column('partial_response', Text),
+          Column('tasks_added', Integer, nullable=False),
+          Column('error', Text),
+          Column('created_at', DateTime),
+          Column('started_at', DateTime),
+          Column('finished_at', DateTime))
+    Table('stat_counters', metadata,
+          Column('name', String(50), primary_key=True),
+          Column('value', BigInteger, nullable=False))
+    Table('daily_stats', metadata,
+          Column('day', Date, primary_key=True),
+          Column('metric', String(50), primary_key=True),
+          Column('value', BigInteger, nullable=False))
+    Table('daily_active_users', metadata,
+          Column('day', Date, primary_key=True),
+          Column('user_id', Integer, primary_key=True))
+    metadata.create_all(bind=connection)
+
+def _create_table(connection, *columns_and_indexes, name, references=()):
+    """Create one frozen table if it is missing.
+    
+    `references` names existing tables its foreign keys point at; they are only
+    declared so the keys resolve and are never created here.
+    """
+    metadata = MetaData()
+    for referenced in references:
+        Table(referenced, metadata, Column('id', Integer, primary_key=True))
+    table = Table(name, metadata, *columns_and_indexes)
+    table.create(bind=connection, checkfirst=True)
+
+def _create_hot_path_indexes(connection):
+    """Composite indexes for the per-user chat and task queries and the login scan"""
+    concurrently = 'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    statements = [
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_chats_user_id_timestamp ON chats (user_id, timestamp)",
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_tasks_user_id_completed_deadline ON tasks (user_id, completed, deadline)",
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_users_last_login ON users (last_login)",
+        # Only pending tasks are scanned by deadline, so keep completed ones out of the index
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_tasks_pending_deadline ON tasks (deadline) WHERE completed = false"
+    ]
+    for statement in statements:
+        connection.execute(text(statement))
+
+def _create_conversation_summaries(connection):
+    """Rolling per-user summaries of older chat history"""
+    _create_table(connection,
+                  Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+                  Column('summary', Text, nullable=False),
+                  Column('covered_chat_id', Integer, nullable=False),
+                  Column('updated_at', DateTime),
+                  name='conversation_summaries', references=['users'])
+
+def _add_user_auth_version(connection):
+    """Per-user version stamped into sessions so role changes revoke them"""
+    columns = {column['name'] for column in inspect(connection).get_columns('users')}
+    if 'auth_version' not in columns:
+        connection.execute(text("ALTER TABLE users ADD COLUMN auth_version INTEGER NOT NULL DEFAULT 0"))
+
+def _create_chat_rate_limits(connection):
+    """Per-user token buckets and in-flight leases for /chat/send"""
+    _create_table(connection,
+                  Column('user_id', Integer, ForeignKey('users.id'), primary_key=True),
+                  Column('tokens', Float, nullable=False),
+                  Column('refilled_at', DateTime, nullable=False),
+                  Column('inflight_until', DateTime),
+                  name='chat_rate_limits', references=['users'])
+
+def _create_bulk_operations(connection):
+    """Background broadcast and bulk task assignment jobs"""
+    _create_table(connection,
+                  Column('id', Integer, primary_key=True),
+                  Column('kind', String(20), nullable=False),
+                  Column('payload', Text, nullable=False),
+                  Column('target', Text, nullable=False),
+                  Column('status', String(20), nullable=False),
+                  Column('total', Integer),
+                  Column('processed', Integer, nullable=False),
+                  Column('cursor', Integer, nullable=False),
+                  Column('error', Text),
+                  Column('created_by', Integer),
+                  Column('created_at', DateTime),
+                  Column('started_at', DateTime),
+                  Column('updated_at', DateTime),
+                  Column('finished_at', DateTime),
+                  name='bulk_operations')
+
+def _create_chat_archive(connection):
+    """Compressed cold storage for chats past the retention age"""
+    _create_table(connection,
+                  Column('id', Integer, primary_key=True),
+                  Column('user_id', Integer, nullable=False),
+                  Column('first_chat_id', Integer, nullable=False),
+                  Column('last_chat_id', Integer, nullable=False),
+                  Column('first_timestamp', DateTime),
+                  Column('last_timestamp', DateTime),
+                  Column('message_count', Integer, nullable=False),
+                  Column('data', LargeBinary, nullable=False),
+                  Column('created_at', DateTime),
+                  Index('ix_chat_archive_segments_user_id_id', 'user_id', 'id'),
+                  name='chat_archive_segments')
+
+def _create_search_indexes(connection):
+    """Full-text search: GIN expression indexes on PostgreSQL, FTS5 tables on SQLite"""
+    from src.services.search import document_vector, fts5_statements
+    if connection.dialect.name == 'postgresql':
+        # Expression indexes avoid rewriting the chats table to add a tsvector column
+        for kind in ('chats', 'tasks'):
+            connection.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_{kind}_search ON {kind} USING GIN (({document_vector(kind)}))"
+            ))
+    elif connection.dialect.name == 'sqlite':
+        for kind in ('chats', 'tasks'):
+            for statement in fts5_statements(kind):
+                connection.execute(text(statement))
+
+def _add_task_overdue_state(connection):
+    """Overdue timestamp on tasks and the partial index the deadline sweep scans"""
+    columns = {column['name'] for column in inspect(connection).get_columns('tasks')}
+    if 'overdue_at' not in columns:
+        connection.execute(text("ALTER TABLE tasks ADD COLUMN overdue_at TIMESTAMP"))
+    concurrently = 'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    connection.execute(text(
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_tasks_unswept_deadline ON tasks (deadline) "
+        "WHERE completed = false AND overdue_at IS NULL"
+    ))
+
+def _create_user_events(connection):
+    """Outbox of task and message deltas pushed to the browser"""
+    _create_table(connection,
+                  Column('id', Integer, primary_key=True),
+                  Column('user_id', Integer, nullable=False),
+                  Column('kind', String(40), nullable=False),
+                  Column('data', Text, nullable=False),
+                  Column('created_at', DateTime, index=True),
+                  Index('ix_user_events_user_id_id', 'user_id', 'id'),
+                  name='user_events')
+
+def _create_system_prompts(connection):
+    """Versioned system prompt, replacing the per-node config file"""
+    _create_table(connection,
+                  Column('id', Integer, primary_key=True),
+                  Column('version', Integer, unique=True, nullable=False),
+                  Column('content', Text, nullable=False),
+                  Column('created_at', DateTime),
+                  Column('created_by', Integer),
+                  Column('note', String(200)),
+                  name='system_prompts')
+
+def _add_chat_job_heartbeats(connection):
+    """Lease heartbeat and claim token on chat jobs"""
+    columns = {column['name'] for column in inspect(connection).get_columns('chat_jobs')}
+    if 'heartbeat_at' not in columns:
+        connection.execute(text("ALTER TABLE chat_jobs ADD COLUMN heartbeat_at TIMESTAMP"))
+    if 'claim_token' not in columns:
+        connection.execute(text("ALTER TABLE chat_jobs ADD COLUMN claim_token VARCHAR(32)"))
+
+def _shard_stat_rollups(connection):
+    """Add a shard key to the rollup counters, keeping the current values in shard 0"""
+    sharded = {
+        'stat_counters': [
+            Column('name', String(50), primary_key=True),
+            Column('shard', Integer, primary_key=True),
+            Column('value', BigInteger, nullable=False)
+        ],
+        'daily_stats': [
+            Column('day', Date, primary_key=True),
+            Column('metric', String(50), primary_key=True),
+            Column('shard', Integer, primary_key=True),
+            Column('value', BigInteger, nullable=False)
+        ]
+    }
+    for name, columns in sharded.items():
+        table = Table(name, MetaData(), *columns)
+        existing = {column['name'] for column in inspect(connection).get_columns(name)}
+        if 'shard' in existing:
+            continue
+        # The primary key changes, so the small rollup tables are recreated with their rows copied over
+        old_columns = [column for column in table.c if column.name != 'shard']
+        rows = [dict(row, shard=0) for row in connection.execute(select(*old_columns)).mappings()]
+        connection.execute(text(f"DROP TABLE {name}"))
+        table.create(bind=connection)
+        if rows:
+            connection.execute(table.insert(), rows)
+
+def _create_data_version_indexes(connection):
+    """Indexes that let the per-user ETag version skip the table rows"""
+    postgresql = connection.dialect.name == 'postgresql'
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    connection.execute(text(
+        f"CREATE INDEX {concurrently}IF NOT EXISTS ix_chats_user_id_pending_reply ON chats (user_id) "
+        "WHERE response = 'Processing your request...'"
+    ))
+    if not postgresql:
+        # SQLite indexes already end with the rowid, which is the id
+        return
+    # Rebuild the per-user indexes with the id as a covering column, swapping them in by name
+    for name, table, columns in [('ix_chats_user_id_timestamp', 'chats', 'user_id, timestamp'),
+                                 ('ix_tasks_user_id_completed_deadline', 'tasks', 'user_id, completed, deadline')]:
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name}_covering ON {table} ({columns}) INCLUDE (id)"))
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        connection.execute(text(f"ALTER INDEX {name}_covering RENAME TO {name}"))
+
+def _create_maintenance_runs(connection):
+    """Last run of each periodic maintenance task, shared by all processes"""
+    _create_table(connection,
+                  Column('name', String(50), primary_key=True),
+                  Column('last_run_at', DateTime, nullable=False),
+                  Column('holder', String(100)),
+                  name='maintenance_runs')
+
+def _add_bulk_operation_claims(connection):
+    """Claim token on bulk operations, fencing off a thread whose run was resumed elsewhere"""
+    columns = {column['name'] for column in inspect(connection).get_columns('bulk_operations')}
+    if 'claim_token' not in columns:
+        connection.execute(text("ALTER TABLE bulk_operations ADD COLUMN claim_token VARCHAR(32)"))
+
+def _create_chat_timestamp_index(connection):
+    """Index the archiver walks to find chats past the retention cutoff"""
+    concurrently = 'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    connection.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS ix_chats_timestamp ON chats (timestamp)"))
+
+# (version, name, function, transactional). Never edit or reorder an applied
+# migration; add a new one instead.
+MIGRATIONS = [
+    (1, 'initial schema', _create_initial_schema, True),
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction on PostgreSQL
+    (2, 'hot path indexes', _create_hot_path_indexes, False),
+    (3, 'conversation summaries', _create_conversation_summaries, True),
+    (4, 'user auth version', _add_user_auth_version, True),
+    (5, 'chat rate limits', _create_chat_rate_limits, True),
+    (6, 'bulk operations', _create_bulk_operations, True),
+    (7, 'chat archive', _create_chat_archive, True),
+    (8, 'full text search', _create_search_indexes, False),
+    (9, 'task overdue state', _add_task_overdue_state, False),
+    (10, 'user events', _create_user_events, True),
+    (11, 'system prompts', _create_system_prompts, True),
+    (12, 'chat job heartbeats', _add_chat_job_heartbeats, True),
+    (13, 'sharded stat rollups', _shard_stat_rollups, True),
+    (14, 'data version indexes', _create_data_version_indexes, False),
+    (15, 'maintenance runs', _create_maintenance_runs, True),
+    (16, 'bulk operation claims', _add_bulk_operation_claims, True),
+    (17, 'chat timestamp index', _create_chat_timestamp_index, False),
+]
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+def applied_versions(engine):
+    """Return the set of migration versions already applied"""
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        return {row[0] for row in connection.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+def _record(connection, version, name):
+    connection.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {'version': version, 'name': name, 'applied_at': datetime.utcnow()}
+    )
+
+def upgrade(engine):
+    """Apply every pending migration in order and return the versions applied"""
+    done = applied_versions(engine)
+    applied = []
+    
+    for version, name, migrate, transactional in MIGRATIONS:
+        if version in done:
+            continue
+        
+        logger.info(f"Applying migration {version}: {name}")
+        postgresql = engine.dialect.name == 'postgresql'
+        if transactional:
+            with engine.begin() as connection:
+                if postgresql:
+                    # Backfills may run longer than the request statement timeout
+                    connection.execute(text("SET LOCAL statement_timeout = 0"))
+                migrate(connection)
+                _record(connection, version, name)
+        else:
+            # Statements must be idempotent: a failure part-way is retried on the next run
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                if postgresql:
+                    # Index builds may run longer than the request statement timeout
+                    connection.execute(text("SET statement_timeout = 0"))
+                try:
+                    migrate(connection)
+                finally:
+                    if postgresql:
+                        connection.execute(text("RESET statement_timeout"))
+            with engine.begin() as connection:
+                _record(connection, version, name)
+        applied.append(version)
+    
+    return applied
+
+def seed_admin():
+    """Create the default admin user if it does not exist yet; returns True if it was created"""
+    from src.models.user import User
+    if User.query.filter_by(email=DEFAULT_ADMIN_EMAIL).first():
+        return False
+    admin = User(email=DEFAULT_ADMIN_EMAIL, is_admin=True)
+    admin.set_password(DEFAULT_ADMIN_PASSWORD)
+    db.session.add(admin)
+    db.session.commit()
+    logger.info(f"Admin user created: {DEFAULT_ADMIN_EMAIL} / {DEFAULT_ADMIN_PASSWORD}")
+    return True
+
+def register_migration_commands(app):
+    """Add `flask db upgrade`, `seed`, `setup` and `status` to the app CLI"""
+    import click
+    
+    @app.cli.group('db')
+    def db_group():
+        """Database schema migrations."""
+    
+    @db_group.command('upgrade')
+    def upgrade_command():
+        """Apply pending schema migrations."""
+        applied = upgrade(db.engine)
+        if applied:
+            click.echo(f"Applied migrations: {', '.join(str(version) for version in applied)}")
+        else:
+            click.echo('Database schema is up to date')
+    
+    @db_group.command('seed')
+    def seed_command():
+        """Create the default admin user if it is missing."""
+        if seed_admin():
+            click.echo(f"Created admin user {DEFAULT_ADMIN_EMAIL}")
+        else:
+            click.echo('Admin user already exists')
+    
+    @db_group.command('setup')
+    @click.pass_context
+    def setup_command(ctx):
+        """Apply pending migrations, seed the admin user and build the stats rollups; run once per deploy."""
+        from src.services.stats import ensure_stats_built
+        ctx.invoke(upgrade_command)
+        ctx.invoke(seed_command)
+        # The full-table scan runs here rather than in the first dashboard request
+        if ensure_stats_built():
+            click.echo('Built the activity rollups')
+    
+    @db_group.command('status')
+    def status_command():
+        """Show which migrations have been applied."""
+        done = applied_versions(db.engine)
+        for version, name, _, _ in MIGRATIONS:
+            click.echo(f"{'[x]' if version in done else '[ ]'} {version:04d} {name}")
@@ -1,11 +1,18 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.services.passwords import hash_password, verify_password
+from src.services.database import RoutingSession
 from datetime import datetime
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Placeholder stored on a chat row until the assistant response arrives
+PROCESSING_PLACEHOLDER = "Processing your request..."
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_last_login', 'last_login'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -13,6 +20,8 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
     is_admin = db.Column(db.Boolean, default=False)
+    # Bumped when the role changes; sessions stamped with an older version are rejected
+    auth_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relationship with Chat
     chats = db.relationship('Chat', backref='user', lazy=True)
@@ -21,10 +30,13 @@ class User(db.Model):
     tasks = db.relationship('Task', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-        
+        self.password_hash = hash_password(password)
+    
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        valid, new_hash = verify_password(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return valid
     
     def __repr__(self):
         return f'<User {self.email}>'
@@ -32,6 +44,16 @@ class User(db.Model):
 
 class Chat(db.Model):
     __tablename__ = 'chats'
+    __table_args__ = (
+        # Carries the id on PostgreSQL so per-user counts and newest ids are index-only
+        db.Index('ix_chats_user_id_timestamp', 'user_id', 'timestamp', postgresql_include=['id']),
+        # Lets the archiver take the oldest chats of all users without scanning the table
+        db.Index('ix_chats_timestamp', 'timestamp'),
+        # Rows still waiting for their reply; a handful at most
+        db.Index('ix_chats_user_id_pending_reply', 'user_id',
+                 postgresql_where=db.text(f"response = '{PROCESSING_PLACEHOLDER}'"),
+                 sqlite_where=db.text(f"response = '{PROCESSING_PLACEHOLDER}'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -46,6 +68,17 @@ class Chat(db.Model):
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_user_id_completed_deadline', 'user_id', 'completed', 'deadline', postgresql_include=['id']),
+        # Partial index over pending tasks only
+        db.Index('ix_tasks_pending_deadline', 'deadline',
+                 postgresql_where=db.text('completed = false'),
+                 sqlite_where=db.text('completed = false')),
+        # Pending tasks the deadline sweep has not marked overdue yet
+        db.Index('ix_tasks_unswept_deadline', 'deadline',
+                 postgresql_where=db.text('completed = false AND overdue_at IS NULL'),
+                 sqlite_where=db.text('completed = false AND overdue_at IS NULL')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -54,6 +87,184 @@ class Task(db.Model):
     completed = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
+    # Set by the deadline sweep when the task was marked overdue and the user reminded
+    overdue_at = db.Column(db.DateTime, nullable=True)
+    
+    @property
+    def is_overdue(self):
+        # The deadline check covers the gap until the next sweep
+        return not self.completed and (self.overdue_at is not None or self.deadline < datetime.utcnow())
     
     def __repr__(self):
         return f'<Task {self.id}>'
+
+
+class ChatJob(db.Model):
+    __tablename__ = 'chat_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chats.id'), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    partial_response = db.Column(db.Text, nullable=True)
+    tasks_added = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    # Refreshed while a worker streams the response; the lease is measured from it
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    # Set by each claim; only the worker holding the current token may write the job
+    claim_token = db.Column(db.String(32), nullable=True)
+    
+    # Relationship with Chat
+    chat = db.relationship('Chat')
+    
+    def __repr__(self):
+        return f'<ChatJob {self.id} {self.status}>'
+
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    
+    # A total is the sum of its shard rows; shard 0 holds the value from the last rebuild
+    name = db.Column(db.String(50), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.name}[{self.shard}]={self.value}>'
+
+
+class DailyStat(db.Model):
+    __tablename__ = 'daily_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(50), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, default=0)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<DailyStat {self.day} {self.metric}[{self.shard}]={self.value}>'
+
+
+class DailyActiveUser(db.Model):
+    __tablename__ = 'daily_active_users'
+    
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    
+    def __repr__(self):
+        return f'<DailyActiveUser {self.day} {self.user_id}>'
+
+
+class ConversationSummary(db.Model):
+    __tablename__ = 'conversation_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    covered_chat_id = db.Column(db.Integer, nullable=False, default=0)  # Last chat folded into the summary
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ConversationSummary {self.user_id}>'
+
+
+class ChatRateLimit(db.Model):
+    __tablename__ = 'chat_rate_limits'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)  # Token bucket level as of refilled_at
+    refilled_at = db.Column(db.DateTime, nullable=False)
+    inflight_until = db.Column(db.DateTime, nullable=True)  # Lease on the user's single in-flight completion
+    
+    def __repr__(self):
+        return f'<ChatRateLimit {self.user_id} tokens={self.tokens:.2f}>'
+
+
+class BulkOperation(db.Model):
+    __tablename__ = 'bulk_operations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # message, task
+    payload = db.Column(db.Text, nullable=False)  # JSON: message text or task description and days
+    target = db.Column(db.Text, nullable=False)  # JSON: user filter or list of emails
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done, failed
+    total = db.Column(db.Integer, nullable=True)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    cursor = db.Column(db.Integer, default=0, nullable=False)  # Last user id (filters) or email index (CSV) done
+    error = db.Column(db.Text, nullable=True)
+    created_by = db.Column(db.Integer, nullable=True)  # Admin user id; kept if the admin is deleted
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)  # Last progress; stale running operations can be resumed
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Set by each claim; only the thread holding the current token may record progress
+    claim_token = db.Column(db.String(32), nullable=True)
+    
+    def __repr__(self):
+        return f'<BulkOperation {self.id} {self.kind} {self.status}>'
+
+
+class ChatArchiveSegment(db.Model):
+    __tablename__ = 'chat_archive_segments'
+    __table_args__ = (
+        db.Index('ix_chat_archive_segments_user_id_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    first_chat_id = db.Column(db.Integer, nullable=False)
+    last_chat_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    message_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON lines, oldest chat first
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ChatArchiveSegment {self.id} user={self.user_id} chats={self.message_count}>'
+
+
+class UserEvent(db.Model):
+    __tablename__ = 'user_events'
+    __table_args__ = (
+        db.Index('ix_user_events_user_id_id', 'user_id', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(40), nullable=False)  # task.created, task.completed, task.deleted, task.overdue, chat.message
+    data = db.Column(db.Text, nullable=False)  # JSON payload
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<UserEvent {self.id} {self.kind} user={self.user_id}>'
+
+
+class SystemPrompt(db.Model):
+    __tablename__ = 'system_prompts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, unique=True, nullable=False)  # Highest version is the active prompt
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.Integer, nullable=True)  # Admin user id; no foreign key so history outlives the admin
+    note = db.Column(db.String(200), nullable=True)  # e.g. "Rolled back to version 3"
+    
+    def __repr__(self):
+        return f'<SystemPrompt v{self.version}>'
+
+
+class MaintenanceRun(db.Model):
+    __tablename__ = 'maintenance_runs'
+    
+    # One row per periodic task; claiming a run moves last_run_at forward
+    name = db.Column(db.String(50), primary_key=True)
+    last_run_at = db.Column(db.DateTime, nullable=False)
+    holder = db.Column(db.String(100), nullable=True)  # host:pid of the process that ran it last
+    
+    def __repr__(self):
+        return f'<MaintenanceRun {self.name} {self.last_run_at}>'
@@ -1,10 +1,36 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-from src.models.user import db, User, Chat, Task
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, Response, abort, stream_with_context
+from src.models.user import db, User, Chat, Task, ChatJob, BulkOperation
+from src.services.context_cache import invalidate_user_context
+from src.services.principals import session_is_current, restamp_legacy_session, invalidate_principal
+from src.services.bulk_ops import (create_bulk_operation, start_bulk_operation, can_resume, operation_to_dict,
+                                   parse_email_csv, task_assigned_message, USER_FILTERS)
+from src.services.stats import get_counters, get_daily_series, DAILY_METRICS
+from src.services.pagination import encode_cursor, decode_cursor, chat_history_page, chat_to_dict, CHAT_PAGE_SIZE, CHAT_MAX_PAGE_SIZE
+from src.services.query_budget import blueprint_query_budget, query_budget
+from src.services.database import replica_reads
+from src.services.http_cache import conditional_get, user_data_version
+from src.services.retention import delete_user_data, archived_message_count, archive_page
+from src.services.export import export_stream, export_filename, EXPORT_FIELDS, EXPORT_FORMATS
+from src.services.search import search, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE
+from src.services.events import publish_event, publish_events, task_to_dict, system_message_dict
+from src.services.system_prompt import (current_prompt_version, load_prompt, save_system_prompt, rollback_system_prompt,
+                                        prompt_history, PromptVersionConflict)
 from functools import wraps
-from datetime import datetime, timedelta
+from sqlalchemy import func, select, or_, and_
+from datetime import datetime, timedelta, date
 import json
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+blueprint_query_budget(admin_bp, 8)
+
+# User listing page sizes and sortable columns
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+USER_SORT_COLUMNS = {
+    'last_login': User.last_login,
+    'created_at': User.created_at,
+    'email': User.email
+}
 
 # Admin authentication decorator
 def admin_required(f):
@@ -13,53 +39,243 @@ def admin_required(f):
         if 'user_id' not in session:
             return redirect(url_for('auth.login'))
         
-        user = User.query.get(session['user_id'])
-        if not user or not user.is_admin:
+        # Sessions signed before the role stamp get it from the database once
+        if not restamp_legacy_session(session):
+            session.clear()
+            flash('Your session has expired. Please log in again.', 'info')
+            return redirect(url_for('auth.login'))
+        
+        # Role comes from the signed session stamp, checked against the cached principal
+        if not session.get('is_admin'):
             flash('Admin access required', 'error')
             return redirect(url_for('chat.index'))
-            
+        if not session_is_current(session):
+            session.clear()
+            flash('Your session has expired. Please log in again.', 'info')
+            return redirect(url_for('auth.login'))
+        
         return f(*args, **kwargs)
     return decorated_function
 
 @admin_bp.route('/')
 @admin_required
+@replica_reads
 def index():
-    # Dashboard statistics
-    total_users = User.query.count()
-    total_chats = Chat.query.count()
-    total_tasks = Task.query.count()
+    # Dashboard statistics come from the rollup tables instead of full-table counts.
+    # They are built by `flask db setup`; until then the totals show as not built yet.
+    counters = get_counters()
     
-    # Active users in last 24 hours
+    # Daily trends for the charts
+    daily_series = get_daily_series(days=14)
+    
+    # Users who logged in within the last 24 hours, counted from ix_users_last_login
     yesterday = datetime.utcnow() - timedelta(days=1)
-    active_users = User.query.filter(User.last_login >= yesterday).count()
+    active_users = db.session.query(func.count(User.id)).filter(User.last_login >= yesterday).scalar()
+    chart_max = {metric: max([point[metric] for point in daily_series] + [1]) for metric in DAILY_METRICS}
     
     # Recent users
     recent_users = User.query.order_by(User.last_login.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
-                          total_users=total_users,
-                          total_chats=total_chats,
-                          total_tasks=total_tasks,
+                          stats_built=counters is not None,
+                          total_users=counters['users'] if counters else None,
+                          total_chats=counters['chats'] if counters else None,
+                          total_tasks=counters['tasks'] if counters else None,
                           active_users=active_users,
-                          recent_users=recent_users)
+                          recent_users=recent_users,
+                          daily_series=daily_series,
+                          chart_max=chart_max)
+
+def query_user_listing(sort='last_login', direction='desc', cursor=None, limit=USERS_PAGE_SIZE):
+    """Return one page of users with their chat and task counts, plus the next cursor.
+    
+    Counts come from correlated subqueries evaluated only for the rows on the
+    page, and pages are addressed by keyset (sort column, id) with NULLs last.
+    """
+    if sort not in USER_SORT_COLUMNS:
+        sort = 'last_login'
+    column = USER_SORT_COLUMNS[sort]
+    descending = direction != 'asc'
+    
+    chat_count = select(func.count(Chat.id)).where(Chat.user_id == User.id).correlate(User).scalar_subquery()
+    task_count = select(func.count(Task.id)).where(Task.user_id == User.id).correlate(User).scalar_subquery()
+    
+    query = db.session.query(User, chat_count.label('chat_count'), task_count.label('task_count'))
+    
+    if cursor is not None:
+        value, row_id = cursor
+        id_after = User.id < row_id if descending else User.id > row_id
+        if value is None:
+            query = query.filter(column.is_(None), id_after)
+        else:
+            value_after = column < value if descending else column > value
+            query = query.filter(or_(value_after, and_(column == value, id_after), column.is_(None)))
+    
+    ordering = column.desc() if descending else column.asc()
+    id_ordering = User.id.desc() if descending else User.id.asc()
+    rows = query.order_by(ordering.nulls_last(), id_ordering).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_user = rows[-1][0]
+        next_cursor = encode_cursor(getattr(last_user, sort), last_user.id)
+    
+    return rows, next_cursor
+
+def user_listing_args():
+    """Read sort, direction, cursor and page size from the query string"""
+    sort = request.args.get('sort', 'last_login')
+    if sort not in USER_SORT_COLUMNS:
+        sort = 'last_login'
+    direction = 'asc' if request.args.get('direction') == 'asc' else 'desc'
+    cursor = decode_cursor(request.args.get('after'), is_datetime=sort in ('last_login', 'created_at'))
+    limit = min(max(request.args.get('limit', USERS_PAGE_SIZE, type=int), 1), USERS_MAX_PAGE_SIZE)
+    return sort, direction, cursor, limit
 
 @admin_bp.route('/users')
 @admin_required
+@replica_reads
 def users():
-    all_users = User.query.all()
-    return render_template('admin/users.html', users=all_users)
+    sort, direction, cursor, limit = user_listing_args()
+    rows, next_cursor = query_user_listing(sort, direction, cursor, limit)
+    return render_template('admin/users.html', rows=rows, next_cursor=next_cursor, filters=USER_FILTERS,
+                          sort=sort, direction=direction, limit=limit, is_first_page=cursor is None)
+
+@admin_bp.route('/api/users')
+@admin_required
+@replica_reads
+def users_json():
+    """JSON variant of the user listing for paging through large user bases"""
+    sort, direction, cursor, limit = user_listing_args()
+    rows, next_cursor = query_user_listing(sort, direction, cursor, limit)
+    return jsonify({
+        'users': [{
+            'id': user.id,
+            'email': user.email,
+            'is_admin': user.is_admin,
+            'created_at': user.created_at.isoformat() if user.created_at else None,
+            'last_login': user.last_login.isoformat() if user.last_login else None,
+            'chat_count': chat_count,
+            'task_count': task_count
+        } for user, chat_count, task_count in rows],
+        'next_cursor': next_cursor
+    })
 
 @admin_bp.route('/user/<int:user_id>')
 @admin_required
+@replica_reads
 def user_detail(user_id):
     user = User.query.get_or_404(user_id)
-    chats = Chat.query.filter_by(user_id=user_id).order_by(Chat.timestamp.asc()).all()
+    
+    # Only the most recent messages are rendered; older pages load from user_chats_json
+    chats, older_cursor = chat_history_page(user_id)
+    total_chats = db.session.query(func.count(Chat.id)).filter(Chat.user_id == user_id).scalar()
+    archived_chats = archived_message_count(user_id)
     tasks = Task.query.filter_by(user_id=user_id).order_by(Task.deadline.asc()).all()
     
-    return render_template('admin/user_detail.html', user=user, chats=chats, tasks=tasks)
+    return render_template('admin/user_detail.html', user=user, chats=chats, tasks=tasks,
+                          total_chats=total_chats, archived_chats=archived_chats,
+                          older_cursor=older_cursor, now=datetime.utcnow())
+
+@admin_bp.route('/api/user/<int:user_id>/chats')
+@admin_required
+@replica_reads
+@conditional_get(lambda user_id: user_data_version(user_id, chats=True))
+def user_chats_json(user_id):
+    """Older pages of a user's chat history for the admin detail view"""
+    before = decode_cursor(request.args.get('before'), is_datetime=True)
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), CHAT_MAX_PAGE_SIZE)
+    chats, older_cursor = chat_history_page(user_id, before, limit)
+    
+    return jsonify({
+        'chats': [chat_to_dict(chat) for chat in chats],
+        'older_cursor': older_cursor
+    })
+
+@admin_bp.route('/api/user/<int:user_id>/archive')
+@admin_required
+def user_archive_json(user_id):
+    """Archived chat history, one compressed segment per page, newest first"""
+    chats, older_cursor = archive_page(user_id, request.args.get('before', type=int))
+    return jsonify({
+        'chats': chats,
+        'older_cursor': older_cursor
+    })
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+def search_args():
+    """Read the search query, filters and page from the query string"""
+    return {
+        'q': (request.args.get('q') or '').strip(),
+        'type': 'tasks' if request.args.get('type') == 'tasks' else 'chats',
+        'user_id': request.args.get('user_id', type=int),
+        'email': (request.args.get('email') or '').strip(),
+        'from': parse_date(request.args.get('from')),
+        'to': parse_date(request.args.get('to')),
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'limit': min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+    }
+
+def run_search(args):
+    """Search with the parsed arguments; an unknown email matches nothing"""
+    if not args['q']:
+        return [], False
+    user_id = args['user_id']
+    if user_id is None and args['email']:
+        user = User.query.filter_by(email=args['email']).first()
+        if user is None:
+            return [], False
+        user_id = user.id
+    return search(args['type'], args['q'], user_id=user_id, start=args['from'], end=args['to'],
+                  page=args['page'], limit=args['limit'])
+
+@admin_bp.route('/search')
+@admin_required
+def search_page():
+    """Full-text search over chats and tasks"""
+    args = search_args()
+    results, has_more = run_search(args)
+    return render_template('admin/search.html', args=args, results=results, has_more=has_more)
+
+@admin_bp.route('/api/search')
+@admin_required
+def search_json():
+    """JSON variant of the search page"""
+    args = search_args()
+    results, has_more = run_search(args)
+    return jsonify({
+        'results': results,
+        'page': args['page'],
+        'has_more': has_more
+    })
+
+@admin_bp.route('/export')
+@admin_required
+def export():
+    """Stream chats or tasks of one user, a user filter or everyone as CSV or JSON lines"""
+    dataset = request.args.get('dataset', 'chats')
+    fmt = request.args.get('format', 'csv')
+    user_id = request.args.get('user_id', type=int)
+    cohort = request.args.get('filter') or None
+    compress = request.args.get('gzip') == '1'
+    if dataset not in EXPORT_FIELDS or fmt not in EXPORT_FORMATS or (cohort and cohort not in USER_FILTERS):
+        abort(400)
+    
+    # Rows are read and sent while the response streams, outside the request's query budget
+    filename = export_filename(dataset, fmt, user_id, cohort, compress)
+    return Response(stream_with_context(export_stream(dataset, fmt, user_id, cohort, compress)),
+                    mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @admin_bp.route('/user/<int:user_id>/delete', methods=['POST'])
 @admin_required
+@query_budget(100)
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
     
@@ -68,14 +284,13 @@ def delete_user(user_id):
         flash('You cannot delete your own account', 'error')
         return redirect(url_for('admin.users'))
     
-    # Delete all user data
-    Chat.query.filter_by(user_id=user_id).delete()
-    Task.query.filter_by(user_id=user_id).delete()
-    
-    db.session.delete(user)
-    db.session.commit()
+    # Delete all user data in small batches so heavy users do not lock the tables
+    email = user.email
+    delete_user_data(user_id)
+    invalidate_user_context(user_id)
+    invalidate_principal(user_id)
     
-    flash(f'User {user.email} has been deleted', 'success')
+    flash(f'User {email} has been deleted', 'success')
     return redirect(url_for('admin.users'))
 
 @admin_bp.route('/chat/<int:chat_id>/delete', methods=['POST'])
@@ -84,6 +299,7 @@ def delete_chat(chat_id):
     chat = Chat.query.get_or_404(chat_id)
     user_id = chat.user_id
     
+    ChatJob.query.filter_by(chat_id=chat_id).delete()
     db.session.delete(chat)
     db.session.commit()
     
@@ -93,32 +309,48 @@ def delete_chat(chat_id):
 @admin_bp.route('/system-prompt', methods=['GET', 'POST'])
 @admin_required
 def system_prompt():
-    from src.routes.chat import ASSISTANT_PERSONA
-    
     if request.method == 'POST':
-        new_prompt = request.form.get('system_prompt')
+        new_prompt = request.form.get('system_prompt', '').strip()
+        base_version = request.form.get('base_version', type=int)
         
-        # Update the system prompt in a config file
-        with open('src/config/system_prompt.txt', 'w') as f:
-            f.write(new_prompt)
+        if not new_prompt:
+            flash('The system prompt cannot be empty', 'error')
+            return redirect(url_for('admin.system_prompt'))
         
-        flash('System prompt updated successfully', 'success')
+        try:
+            prompt = save_system_prompt(new_prompt, session['user_id'], base_version=base_version)
+        except PromptVersionConflict as e:
+            # Show the admin their text again so the edit is not lost
+            return prompt_conflict(new_prompt, e.current_version)
+        
+        flash(f'System prompt saved as version {prompt.version}', 'success')
         return redirect(url_for('admin.system_prompt'))
     
-    # Create the config directory and file if it doesn't exist
-    import os
-    os.makedirs('src/config', exist_ok=True)
-    
+    current_version = current_prompt_version()
+    return render_template('admin/system_prompt.html', current_prompt=load_prompt(current_version),
+                           current_version=current_version, history=prompt_history())
+
+def prompt_conflict(content, current_version):
+    """Render the editor with `content` after another admin saved a newer version"""
+    flash(f'Another admin saved version {current_version} while you were editing. '
+          'Review it and save again.', 'error')
+    return render_template('admin/system_prompt.html', current_prompt=content,
+                           current_version=current_version, conflict_version=current_version,
+                           history=prompt_history())
+
+@admin_bp.route('/system-prompt/rollback/<int:version>', methods=['POST'])
+@admin_required
+def rollback_prompt(version):
     try:
-        with open('src/config/system_prompt.txt', 'r') as f:
-            current_prompt = f.read()
-    except FileNotFoundError:
-        # If file doesn't exist, use the default prompt and create the file
-        current_prompt = ASSISTANT_PERSONA
-        with open('src/config/system_prompt.txt', 'w') as f:
-            f.write(current_prompt)
+        prompt = rollback_system_prompt(version, session['user_id'])
+    except PromptVersionConflict as e:
+        # Another save took the next version number; offer the restored text for review
+        return prompt_conflict(load_prompt(version), e.current_version)
+    if prompt is None:
+        abort(404)
     
-    return render_template('admin/system_prompt.html', system_prompt=current_prompt)
+    flash(f'Restored version {version} as version {prompt.version}', 'success')
+    return redirect(url_for('admin.system_prompt'))
 
 @admin_bp.route('/user/<int:user_id>/send-message', methods=['GET', 'POST'])
 @admin_required
@@ -132,13 +364,15 @@ def send_message(user_id):
             # Create a system message from the assistant
             new_chat = Chat(
                 user_id=user_id,
-                message=None,
+                message='',
                 response=message,
                 timestamp=datetime.utcnow(),
                 is_system_message=True
             )
             
             db.session.add(new_chat)
+            db.session.flush()
+            publish_event(user_id, 'chat.message', system_message_dict(new_chat))
             db.session.commit()
             
             flash('Message sent successfully', 'success')
@@ -169,21 +403,26 @@ def assign_task(user_id):
             )
             
             db.session.add(new_task)
-            db.session.commit()
             
-            # Also send a system message about the task
-            task_message = f"I've assigned you a new task: {description}. You have {days} days to complete it. Don't disappoint me, paaru!"
+            # Also send a system message about the task, committed together with it
+            task_message = task_assigned_message(description, days)
             
             new_chat = Chat(
                 user_id=user_id,
-                message=None,
+                message='',
                 response=task_message,
                 timestamp=datetime.utcnow(),
                 is_system_message=True
             )
             
             db.session.add(new_chat)
+            db.session.flush()
+            publish_events([
+                (user_id, 'task.created', task_to_dict(new_task)),
+                (user_id, 'chat.message', system_message_dict(new_chat))
+            ])
             db.session.commit()
+            invalidate_user_context(user_id)
             
             flash('Task assigned successfully', 'success')
             return redirect(url_for('admin.user_detail', user_id=user_id))
@@ -191,3 +430,75 @@ def assign_task(user_id):
             flash('Task description cannot be empty', 'error')
     
     return render_template('admin/assign_task.html', user=user)
+
+@admin_bp.route('/bulk', methods=['GET', 'POST'])
+@admin_required
+def bulk():
+    """Broadcast a message or assign a task to many users in the background"""
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        target_name = request.form.get('target')
+        
+        if kind == 'task':
+            description = (request.form.get('description') or '').strip()
+            days = min(max(request.form.get('days', 3, type=int), 1), 30)
+            payload = {'description': description, 'days': days}
+            valid = bool(description)
+        else:
+            kind = 'message'
+            message = (request.form.get('message') or '').strip()
+            payload = {'message': message}
+            valid = bool(message)
+        
+        if not valid:
+            flash('Message or task description cannot be empty', 'error')
+            return redirect(url_for('admin.bulk'))
+        
+        if target_name == 'csv':
+            upload = request.files.get('emails_csv')
+            try:
+                emails = parse_email_csv(upload.stream) if upload else []
+            except ValueError as e:
+                flash(str(e), 'error')
+                return redirect(url_for('admin.bulk'))
+            if not emails:
+                flash('The uploaded CSV contains no email addresses', 'error')
+                return redirect(url_for('admin.bulk'))
+            target = {'emails': emails}
+        elif target_name in USER_FILTERS:
+            target = {'filter': target_name}
+        else:
+            flash('Choose who should receive this', 'error')
+            return redirect(url_for('admin.bulk'))
+        
+        # The rows are written by a background thread; the request returns right away
+        operation = create_bulk_operation(kind, payload, target, session['user_id'])
+        flash(f'Bulk {kind} started', 'success')
+        return redirect(url_for('admin.bulk_status', operation_id=operation.id))
+    
+    operations = BulkOperation.query.order_by(BulkOperation.id.desc()).limit(20).all()
+    return render_template('admin/bulk.html', filters=USER_FILTERS, operations=operations)
+
+@admin_bp.route('/bulk/<int:operation_id>')
+@admin_required
+def bulk_status(operation_id):
+    operation = BulkOperation.query.get_or_404(operation_id)
+    return render_template('admin/bulk_status.html', operation=operation_to_dict(operation))
+
+@admin_bp.route('/api/bulk/<int:operation_id>')
+@admin_required
+def bulk_status_json(operation_id):
+    """Progress of a bulk operation, polled by the status page"""
+    operation = BulkOperation.query.get_or_404(operation_id)
+    return jsonify(operation_to_dict(operation))
+
+@admin_bp.route('/bulk/<int:operation_id>/resume', methods=['POST'])
+@admin_required
+def resume_bulk(operation_id):
+    operation = BulkOperation.query.get_or_404(operation_id)
+    if not can_resume(operation):
+        flash('Only failed or stalled operations can be resumed', 'error')
+    else:
+        start_bulk_operation(operation.id)
+        flash('Bulk operation resumed', 'success')
+    return redirect(url_for('admin.bulk_status', operation_id=operation_id))
@@ -1,10 +1,14 @@
 from flask import Blueprint, request, jsonify, session, redirect, url_for, render_template, flash
-from src.models.user import db, User
-from werkzeug.security import generate_password_hash, check_password_hash
+from src.models.user import db, User, Chat, Task
+from src.services.query_budget import blueprint_query_budget
+from sqlalchemy import select, func
+from src.services.passwords import PasswordHasherBusy
+from src.services.principals import stamp_session
 from functools import wraps
 import datetime
 
 auth_bp = Blueprint('auth', __name__)
+blueprint_query_budget(auth_bp, 5)
 
 # Authentication decorator
 def login_required(f):
@@ -34,7 +38,11 @@ def signup():
         
         # Create new user
         new_user = User(email=email)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('signup.html'), 503
         
         try:
             db.session.add(new_user)
@@ -59,20 +67,24 @@ def login():
             flash('Email and password are required', 'error')
             return render_template('login.html')
         
-        # Check if user exists
+        # Check if user exists. Verification also upgrades outdated password hashes.
         user = User.query.filter_by(email=email).first()
-        if not user or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        if not valid:
             flash('Invalid email or password', 'error')
             return render_template('login.html')
         
+        # Set session with the role stamp (before the commit expires the loaded row)
+        stamp_session(session, user)
+        
         # Update last login time
         user.last_login = datetime.datetime.utcnow()
         db.session.commit()
         
-        # Set session
-        session['user_id'] = user.id
-        session['email'] = user.email
-        
         return redirect(url_for('chat.index'))
     
     return render_template('login.html')
@@ -87,9 +99,16 @@ def logout():
 @login_required
 def profile():
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
-    if not user:
+    
+    # Load the user and their statistics in one query instead of loading every task and chat
+    task_count = select(func.count(Task.id)).where(Task.user_id == User.id).correlate(User).scalar_subquery()
+    completed_count = select(func.count(Task.id)).where(Task.user_id == User.id, Task.completed == True).correlate(User).scalar_subquery()
+    chat_count = select(func.count(Chat.id)).where(Chat.user_id == User.id).correlate(User).scalar_subquery()
+    row = db.session.query(User, task_count, completed_count, chat_count).filter(User.id == user_id).first()
+    if not row:
         session.clear()
         return redirect(url_for('auth.login'))
     
-    return render_template('profile.html', user=user)
+    user, tasks_assigned, tasks_completed, conversations = row
+    return render_template('profile.html', user=user, tasks_assigned=tasks_assigned,
+                          tasks_completed=tasks_completed, conversations=conversations)
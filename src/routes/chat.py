@@ -1,9 +1,21 @@
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, flash
+from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, flash, Response, stream_with_context, current_app
 from functools import wraps
-from src.models.user import db, User, Chat, Task
-import requests
+from src.models.user import db, User, Chat, Task, ChatJob, PROCESSING_PLACEHOLDER
+from src.services.job_queue import enqueue_chat_job
+from src.services.context_cache import context_cache, invalidate_user_context
+from src.services.pagination import chat_history_page, chat_to_dict, decode_cursor, CHAT_PAGE_SIZE, CHAT_MAX_PAGE_SIZE
+from src.services.context_builder import build_context, maybe_refresh_summary
+from src.services.task_extraction import extract_tasks, TaskStreamParser
+from src.services.metrics import timed_stage, record_token_usage
+from src.services.rate_limit import acquire_chat_slot, release_chat_slot, RateLimited
+from src.services.query_budget import blueprint_query_budget, query_budget
+from src.services.database import replica_reads
+from src.services.events import publish_events, latest_event_id, task_to_dict
+from src.services.system_prompt import get_system_prompt
+from src.services.http_cache import conditional_get, user_data_version
+from sqlalchemy import func, case, insert
+from sqlalchemy.orm import selectinload
 import json
-import re
 from datetime import datetime, timedelta
 import os
 import logging
@@ -14,22 +26,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 chat_bp = Blueprint('chat', __name__)
+blueprint_query_budget(chat_bp, 8)
 
-# Base system prompt for the chat assistant character
-BASE_ASSISTANT_PERSONA = """You are a tough assistant who speaks in a commanding, strict tone and expects complete obedience. 
-You use occasional Tamil words like 'paaru' (look) and 'samjha' (understand) in your speech.
-You assign self-improvement tasks to users with specific deadlines (usually 24-48 hours).
+# Maximum number of history messages to include in context; the token budget
+# (CONTEXT_TOKEN_BUDGET) usually applies first
+MAX_CONTEXT_MESSAGES = 40
 
-Important: When assigning tasks, ALWAYS include a JSON block at the end of your message in this exact format:
-```json
-{"tasks": [{"description": "Task description here", "deadline_days": 1}]}
-```
+# Grok model used for chat completions
+GROK_MODEL = "grok-3-latest"
 
-Keep your responses short (1-2 sentences) after the initial introduction.
-Always maintain your strict, commanding persona and never break character."""
-
-# Maximum number of messages to include in context
-MAX_CONTEXT_MESSAGES = 20
+# Appended to the text a streamed reply had reached when the browser left
+INTERRUPTED_REPLY_NOTE = "(This reply was cut short because the page was closed.)"
 
 # Authentication decorator
 def login_required(f):
@@ -42,31 +49,63 @@ def login_required(f):
 
 @chat_bp.route('/')
 @login_required
+@replica_reads
+@conditional_get(lambda: user_data_version(session['user_id'], chats=True, tasks=True))
 def index():
     user_id = session.get('user_id')
-    user = User.query.get(user_id)
     
-    # Get all chats for the user, ordered by timestamp ascending (oldest first)
-    chats = Chat.query.filter_by(user_id=user_id).order_by(Chat.timestamp.asc()).all()
+    # Taken before the page data so no change can fall between the two; the page ignores repeats
+    last_event_id = latest_event_id(user_id)
+    
+    # Load tasks with the user so the sidebar triggers no lazy loads
+    user = db.session.get(User, user_id, options=[selectinload(User.tasks)])
+    
+    # Render only the most recent messages (oldest first); older pages come from /chat/history
+    chats, older_cursor = chat_history_page(user_id)
     
     # Add current datetime for template to use for overdue task detection
     now = datetime.utcnow()
     
-    return render_template('chat.html', user=user, chats=chats, now=now)
+    return render_template('chat.html', user=user, chats=chats, older_cursor=older_cursor, now=now,
+                           last_event_id=last_event_id)
+
+@chat_bp.route('/history')
+@login_required
+@replica_reads
+@conditional_get(lambda: user_data_version(session['user_id'], chats=True))
+def history():
+    """Older pages of the user's chat history for infinite scroll"""
+    user_id = session.get('user_id')
+    before = decode_cursor(request.args.get('before'), is_datetime=True)
+    limit = min(max(request.args.get('limit', CHAT_PAGE_SIZE, type=int), 1), CHAT_MAX_PAGE_SIZE)
+    
+    chats, older_cursor = chat_history_page(user_id, before, limit)
+    
+    return jsonify({
+        'chats': [chat_to_dict(chat) for chat in chats],
+        'older_cursor': older_cursor
+    })
 
 def get_user_context_summary(user_id):
     """Generate a summary of user context based on chat history and tasks"""
     
-    # Get user information
-    user = User.query.get(user_id)
+    # Served from the per-process cache while the user's task version is unchanged. The
+    # version is one index-only aggregate and moves on task writes made by any process
+    version = user_data_version(user_id, tasks=True)
+    cached = context_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
     
-    # Get completed and pending tasks
-    completed_tasks = Task.query.filter_by(user_id=user_id, completed=True).all()
-    pending_tasks = Task.query.filter_by(user_id=user_id, completed=False).all()
+    # Task counts and first interaction date in a single aggregate query
+    first_chat_at = db.session.query(func.min(Chat.timestamp)).filter(Chat.user_id == user_id).scalar_subquery()
+    completed_count, pending_count, first_interaction_date = db.session.query(
+        func.coalesce(func.sum(case((Task.completed == True, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((Task.completed == True, 0), else_=1)), 0),
+        first_chat_at
+    ).filter(Task.user_id == user_id).one()
     
-    # Get first interaction date
-    first_chat = Chat.query.filter_by(user_id=user_id).order_by(Chat.timestamp.asc()).first()
-    first_interaction_date = first_chat.timestamp if first_chat else datetime.utcnow()
+    if first_interaction_date is None:
+        first_interaction_date = datetime.utcnow()
     
     # Calculate days since first interaction
     days_since_first = (datetime.utcnow() - first_interaction_date).days
@@ -78,19 +117,24 @@ def get_user_context_summary(user_id):
     context.append(f"User has been interacting with you for {days_since_first} days.")
     
     # Add task completion info
-    if completed_tasks:
-        completion_rate = len(completed_tasks) / (len(completed_tasks) + len(pending_tasks)) * 100 if pending_tasks else 100
-        context.append(f"User has completed {len(completed_tasks)} tasks with a {completion_rate:.0f}% completion rate.")
+    if completed_count:
+        completion_rate = completed_count / (completed_count + pending_count) * 100
+        context.append(f"User has completed {completed_count} tasks with a {completion_rate:.0f}% completion rate.")
     
     # Add pending task info
-    if pending_tasks:
-        context.append(f"User currently has {len(pending_tasks)} pending tasks.")
-        # List the pending tasks
-        task_list = [f"- {task.description} (due {task.deadline.strftime('%Y-%m-%d')})" for task in pending_tasks[:3]]
+    if pending_count:
+        context.append(f"User currently has {pending_count} pending tasks.")
+        # List the most urgent pending tasks
+        pending_tasks = db.session.query(Task.description, Task.deadline).filter(
+            Task.user_id == user_id, Task.completed == False
+        ).order_by(Task.deadline.asc()).limit(3).all()
+        task_list = [f"- {task.description} (due {task.deadline.strftime('%Y-%m-%d')})" for task in pending_tasks]
         context.extend(task_list)
     
     # Return formatted context
-    return "\n".join(context)
+    summary = "\n".join(context)
+    context_cache.set(user_id, (version, summary))
+    return summary
 
 def create_dynamic_system_prompt(user_id):
     """Create a dynamic system prompt that includes user context"""
@@ -98,84 +142,247 @@ def create_dynamic_system_prompt(user_id):
     # Get user context summary
     user_context = get_user_context_summary(user_id)
     
-    # Combine base persona with user context
-    dynamic_prompt = f"{BASE_ASSISTANT_PERSONA}\n\nUSER CONTEXT:\n{user_context}\n\nUse this context to personalize your responses and refer to the user's history and pending tasks when appropriate."
+    # Combine the admin-edited persona (cached per process) with user context
+    dynamic_prompt = f"{get_system_prompt()}\n\nUSER CONTEXT:\n{user_context}\n\nUse this context to personalize your responses and refer to the user's history and pending tasks when appropriate."
     
     logger.info(f"Created dynamic system prompt for user {user_id} with context")
     return dynamic_prompt
 
+def build_grok_request(user_id, stream=False):
+    """Build the payload for a Grok chat completion request"""
+    
+    # Create dynamic system prompt with user context
+    dynamic_system_prompt = create_dynamic_system_prompt(user_id)
+    
+    # Newest messages that fit the token budget, with older history summarized
+    with timed_stage('context_build'):
+        messages = build_context(user_id, dynamic_system_prompt, PROCESSING_PLACEHOLDER, max_messages=MAX_CONTEXT_MESSAGES)
+    
+    payload = {
+        "messages": messages,
+        "model": GROK_MODEL,
+        "stream": stream,
+        "temperature": 0.7
+    }
+    
+    # Log the request payload (excluding API key for security)
+    logger.info(f"Sending request to Grok API with {len(messages) - 1} messages")
+    logger.info(f"Model: {GROK_MODEL} (stream={stream})")
+    
+    return payload
+
+def save_extracted_tasks(user_id, tasks):
+    """Insert extracted tasks in one bulk statement and return how many were added"""
+    if not tasks:
+        return 0
+    
+    now = datetime.utcnow()
+    created = db.session.execute(insert(Task).returning(Task), [{
+        'user_id': user_id,
+        'description': task['description'],
+        'deadline': now + timedelta(days=task['deadline_days']),
+        'completed': False,
+        'created_at': now
+    } for task in tasks]).scalars().all()
+    
+    # Open pages add the new tasks once the response is committed
+    publish_events([(user_id, 'task.created', task_to_dict(task)) for task in created])
+    
+    for task in tasks:
+        logger.info(f"Added task: {task['description']} with deadline in {task['deadline_days']} days")
+    return len(tasks)
+
+def process_assistant_response(user_id, assistant_response):
+    """Extract tasks from an assistant response and return the cleaned response text and number of tasks added"""
+    clean_response, tasks = extract_tasks(assistant_response)
+    return clean_response, save_extracted_tasks(user_id, tasks)
+
+def after_response_saved(user_id, tasks_added):
+    """Follow-up work once an assistant response has been committed"""
+    if tasks_added:
+        invalidate_user_context(user_id)
+    
+    try:
+        maybe_refresh_summary(user_id, PROCESSING_PLACEHOLDER)
+    except Exception as e:
+        logger.error(f"Error scheduling summary refresh for user {user_id}: {str(e)}")
+        db.session.rollback()
+
+def iter_grok_deltas(response):
+    """Yield content deltas from a streamed Grok chat completion response"""
+    for line in response.iter_lines(decode_unicode=True):
+        # Completion chunks arrive as "data: {...}" lines, terminated by "data: [DONE]"
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed stream chunk: {data[:100]}")
+            continue
+        
+        # The final chunk may carry the token usage for the whole completion
+        record_token_usage(chunk.get('usage'))
+        
+        choices = chunk.get('choices') or [{}]
+        delta = (choices[0].get('delta') or {}).get('content')
+        if delta:
+            yield delta
+
+def sse_event(event, data):
+    """Format a single Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def wants_stream():
+    """Check whether the client asked for a streamed (SSE) response"""
+    if request.form.get('stream') in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+def stream_grok_response(chat_id, user_id, payload):
+    """Relay Grok completion deltas to the browser as SSE and store the final response"""
+    from src.services.grok_client import get_grok_client
+    import requests
+    
+    parser = TaskStreamParser()
+    assistant_response = None
+    tasks_added = 0
+    client_gone = False
+    
+    try:
+        try:
+            with timed_stage('llm'), get_grok_client().chat_completion(payload, stream=True) as response:
+                logger.info(f"Grok API stream response status: {response.status_code}")
+                
+                if response.status_code != 200:
+                    logger.error(f"Error from Grok API: Status {response.status_code} - Response text: {response.text}")
+                    assistant_response = f"I apologize, but I'm having trouble connecting to my knowledge base. Please try again later. (Error: {response.status_code})"
+                else:
+                    # Task blocks are parsed as they arrive and never reach the browser
+                    for delta in iter_grok_deltas(response):
+                        visible = parser.feed(delta)
+                        if visible:
+                            try:
+                                yield sse_event('token', {'text': visible})
+                            except GeneratorExit:
+                                # The browser left. Closing the upstream response (leaving the
+                                # with block) frees this thread instead of reading to the end.
+                                client_gone = True
+                                logger.info(f"Client disconnected from chat {chat_id}, storing the partial reply")
+                                break
+                    
+                    if client_gone:
+                        # Keep the text so far and the task blocks that were complete
+                        partial = ''.join(parser.clean_parts).strip()
+                        assistant_response = f"{partial}\n\n{INTERRUPTED_REPLY_NOTE}" if partial else INTERRUPTED_REPLY_NOTE
+                        tasks = parser.tasks
+                    else:
+                        assistant_response, tasks = parser.finish()
+                        logger.info(f"Grok API stream finished: {assistant_response[:100]}...")
+                    tasks_added = save_extracted_tasks(user_id, tasks)
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request exception in stream_grok_response: {str(e)}")
+            logger.error(traceback.format_exc())
+            assistant_response = "I apologize, but I'm having trouble connecting to my knowledge base. Please try again later."
+        
+        except Exception as e:
+            logger.error(f"Unexpected exception in stream_grok_response: {str(e)}")
+            logger.error(traceback.format_exc())
+            db.session.rollback()
+            assistant_response = None
+            tasks_added = 0
+    
+    finally:
+        # Runs however the stream ends, so the row never keeps the placeholder and the
+        # in-flight slot is freed. The generator runs after the view has returned, so
+        # load the chat row in the session that is active now.
+        if assistant_response is None:
+            assistant_response = "I apologize, but I encountered an unexpected error. Please try again later."
+        user_chat = db.session.get(Chat, chat_id)
+        user_chat.response = assistant_response
+        release_chat_slot(user_id)
+        db.session.commit()
+        after_response_saved(user_id, tasks_added)
+        logger.info(f"Updated chat record {chat_id} with streamed assistant response")
+    
+    if client_gone:
+        return
+    
+    yield sse_event('done', {
+        'response': assistant_response,
+        'tasks_added': tasks_added,
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M')
+    })
+
 @chat_bp.route('/send', methods=['POST'])
 @login_required
+@query_budget(20)  # with the queue disabled the whole completion runs in the request
 def send_message():
     user_id = session.get('user_id')
     message = request.form.get('message')
     
-    logger.info(f"User {user_id} sent message: {message[:50]}...")
-    
     if not message:
         logger.warning("Empty message received")
         return jsonify({'error': 'Message cannot be empty'}), 400
     
+    logger.info(f"User {user_id} sent message: {message[:50]}...")
+    
+    # One in-flight completion per user plus a token bucket, shared by all workers
+    try:
+        acquire_chat_slot(user_id, is_admin=session.get('is_admin', False))
+    except RateLimited as e:
+        db.session.rollback()
+        error = ('Please wait for the previous reply before sending another message'
+                 if e.reason == 'inflight' else 'You are sending messages too quickly. Please slow down.')
+        response = jsonify({'error': error, 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    
     # Save user message to database
     user_chat = Chat(
         user_id=user_id,
         message=message,
-        response="Processing your request...",  # Default response to avoid NULL constraint violation
+        response=PROCESSING_PLACEHOLDER,  # Default response to avoid NULL constraint violation
         timestamp=datetime.utcnow(),
         is_system_message=False
     )
     db.session.add(user_chat)
-    db.session.commit()
-    logger.info(f"Saved user message to database with ID: {user_chat.id}")
-    
-    # Get recent chats to provide context, limiting to MAX_CONTEXT_MESSAGES
-    previous_chats = Chat.query.filter_by(user_id=user_id).order_by(Chat.timestamp.desc()).limit(MAX_CONTEXT_MESSAGES).all()
-    previous_chats.reverse()  # Reverse to get chronological order
-    
-    # Build conversation history for context
-    conversation_history = []
-    for chat in previous_chats:
-        if chat.message:
-            conversation_history.append({"role": "user", "content": chat.message})
-        if chat.response and chat.response != "Processing your request...":
-            conversation_history.append({"role": "assistant", "content": chat.response})
-    
-    # Create dynamic system prompt with user context
-    dynamic_system_prompt = create_dynamic_system_prompt(user_id)
     
-    # Get API key from environment variable
-    api_key = os.environ.get("GROK_API_KEY", "xai-6D4IUdKrs8A98klmtzTqrR1P49BvWck5AbFcnrA2DGpJtokYEqPrpG6gHokGIDc5cg1lZP0U8W9nY5Yp")
+    # Hand the Grok call to the background workers and return right away
+    if current_app.config.get('CHAT_QUEUE_ENABLED'):
+        enqueue_chat_job(user_chat)
+        logger.info(f"Queued chat {user_chat.id} for background processing")
+        return jsonify({
+            'chat_id': user_chat.id,
+            'status': 'pending',
+            'result_url': url_for('chat.result', chat_id=user_chat.id)
+        }), 202
     
-    if not api_key or api_key == "xai-6D4IUdKrs8A98klmtzTqrR1P49BvWck5AbFcnrA2DGpJtokYEqPrpG6gHokGIDc5cg1lZP0U8W9nY5Yp":
-        logger.warning("Using default API key or no API key found in environment variables")
+    db.session.commit()
+    logger.info(f"Saved user message to database with ID: {user_chat.id}")
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+    # The HTTP client stack is only imported by processes that call the API themselves
+    from src.services.grok_client import get_grok_client
+    import requests
     
-    payload = {
-        "messages": [
-            {"role": "system", "content": dynamic_system_prompt}
-        ] + conversation_history,
-        "model": "grok-3-latest",
-        "stream": False,
-        "temperature": 0.7
-    }
+    if wants_stream():
+        payload = build_grok_request(user_id, stream=True)
+        return Response(
+            stream_with_context(stream_grok_response(user_chat.id, user_id, payload)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
     
     try:
-        # Log the request payload (excluding API key for security)
-        logger.info(f"Sending request to Grok API with {len(conversation_history)} messages")
-        logger.info(f"API Endpoint: https://api.x.ai/v1/chat/completions")
-        logger.info(f"Model: grok-3-latest")
+        payload = build_grok_request(user_id)
         
-        # Make the API call
-        response = requests.post(
-            "https://api.x.ai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30  # Add timeout to prevent hanging requests
-        )
+        # Make the API call through the pooled client (timeouts, retries, circuit breaker)
+        with timed_stage('llm'):
+            response = get_grok_client().chat_completion(payload)
         
         # Log the response status and content
         logger.info(f"Grok API response status: {response.status_code}")
@@ -183,71 +390,23 @@ def send_message():
         if response.status_code == 200:
             response_data = response.json()
             logger.info(f"Grok API response received successfully")
+            record_token_usage(response_data.get('usage'))
             
             assistant_response = response_data['choices'][0]['message']['content']
             logger.info(f"Grok API response content: {assistant_response[:100]}...")
             
-            # Extract tasks from JSON block if present
-            json_pattern = r'```json\s*(.*?)\s*```'
-            json_matches = re.findall(json_pattern, assistant_response, re.DOTALL)
-            
-            if json_matches:
-                try:
-                    # Extract the JSON data
-                    json_data = json.loads(json_matches[0])
-                    logger.info(f"Extracted task JSON: {json_data}")
-                    
-                    # Remove the JSON block from the response
-                    clean_response = re.sub(json_pattern, '', assistant_response, flags=re.DOTALL).strip()
-                    
-                    # Add tasks to the database
-                    if 'tasks' in json_data and isinstance(json_data['tasks'], list):
-                        for task_data in json_data['tasks']:
-                            if 'description' in task_data:
-                                # Set deadline based on days or default to 1 day
-                                days = task_data.get('deadline_days', 1)
-                                deadline = datetime.utcnow() + timedelta(days=days)
-                                
-                                # Create new task
-                                new_task = Task(
-                                    user_id=user_id,
-                                    description=task_data['description'],
-                                    deadline=deadline,
-                                    completed=False
-                                )
-                                db.session.add(new_task)
-                                logger.info(f"Added task: {task_data['description']} with deadline in {days} days")
-                    
-                    # Save the clean response
-                    assistant_response = clean_response
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing JSON from response: {e}")
-                    # Continue with the original response if JSON parsing fails
-            else:
-                # If no JSON block found, try to extract task information from text
-                task_pattern = r'task.*?:\s*(.*?)(?:\.|\n|$)'
-                task_matches = re.findall(task_pattern, assistant_response, re.IGNORECASE)
-                
-                if task_matches:
-                    for task_desc in task_matches:
-                        if len(task_desc.strip()) > 10:  # Minimum length to be considered a task
-                            # Create new task with default 1 day deadline
-                            new_task = Task(
-                                user_id=user_id,
-                                description=task_desc.strip(),
-                                deadline=datetime.utcnow() + timedelta(days=1),
-                                completed=False
-                            )
-                            db.session.add(new_task)
-                            logger.info(f"Extracted task from text: {task_desc.strip()}")
+            assistant_response, tasks_added = process_assistant_response(user_id, assistant_response)
             
             # Save assistant response to database
             user_chat.response = assistant_response
+            release_chat_slot(user_id)
             db.session.commit()
+            after_response_saved(user_id, tasks_added)
             logger.info(f"Updated chat record with assistant response")
             
             return jsonify({
                 'response': assistant_response,
+                'tasks_added': tasks_added,
                 'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M')
             })
         else:
@@ -261,13 +420,14 @@ def send_message():
             # Update the chat with error information
             error_response = f"I apologize, but I'm having trouble connecting to my knowledge base. Please try again later. (Error: {response.status_code})"
             user_chat.response = error_response
+            release_chat_slot(user_id)
             db.session.commit()
             
             return jsonify({
                 'response': error_response,
                 'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M')
             })
-            
+    
     except requests.exceptions.RequestException as e:
         error_detail = str(e)
         logger.error(f"Request exception in send_message: {error_detail}")
@@ -276,24 +436,51 @@ def send_message():
         # Save a user-friendly error message as the response
         error_response = "I apologize, but I'm having trouble connecting to my knowledge base. Please try again later."
         user_chat.response = error_response
+        release_chat_slot(user_id)
         db.session.commit()
         
         return jsonify({
             'response': error_response,
             'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M')
         })
-        
+    
     except Exception as e:
         error_detail = str(e)
         logger.error(f"Unexpected exception in send_message: {error_detail}")
         logger.error(traceback.format_exc())
         
         # Save a user-friendly error message as the response
+        db.session.rollback()
         error_response = "I apologize, but I encountered an unexpected error. Please try again later."
         user_chat.response = error_response
+        release_chat_slot(user_id)
         db.session.commit()
         
         return jsonify({
             'response': error_response,
             'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M')
         })
+
+@chat_bp.route('/result/<int:chat_id>')
+@login_required
+def result(chat_id):
+    """Report the progress of a queued chat message"""
+    user_id = session.get('user_id')
+    
+    chat = Chat.query.filter_by(id=chat_id, user_id=user_id).first_or_404()
+    job = ChatJob.query.filter_by(chat_id=chat_id).first()
+    
+    if job and job.status in ('pending', 'running'):
+        return jsonify({
+            'chat_id': chat_id,
+            'status': job.status,
+            'response': job.partial_response or ''
+        })
+    
+    return jsonify({
+        'chat_id': chat_id,
+        'status': job.status if job else 'done',
+        'response': chat.response,
+        'tasks_added': job.tasks_added if job else 0,
+        'timestamp': chat.timestamp.strftime('%Y-%m-%d %H:%M')
+    })
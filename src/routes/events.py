@@ -0,0 +1,95 @@
+from flask import Blueprint, request, jsonify, session, redirect, url_for, Response, stream_with_context
+from src.services.events import wait_for_events
+from src.services.query_budget import blueprint_query_budget, query_budget
+from functools import wraps
+from contextlib import contextmanager
+import threading
+import json
+import time
+import os
+
+events_bp = Blueprint('events', __name__)
+blueprint_query_budget(events_bp, 4)
+
+# Streams and long polls hold a gunicorn thread while they wait, so they wait only
+# briefly. A stream closes after this long and the browser reconnects from its last
+# event id after EVENTS_RETRY_MILLISECONDS, during which the thread serves others.
+EVENTS_HOLD_SECONDS = float(os.environ.get('EVENTS_HOLD_SECONDS', '5'))
+EVENTS_RETRY_MILLISECONDS = 3000
+
+# Requests of one process that may wait for events at once; by default half the
+# gunicorn threads, so open pages never take the threads other requests need.
+# Requests over the limit answer with what is there right away.
+EVENTS_MAX_WAITING = int(os.environ.get('EVENTS_MAX_WAITING') or int(os.environ.get('GUNICORN_THREADS', '16')) // 2)
+
+_waiting = threading.BoundedSemaphore(max(EVENTS_MAX_WAITING, 1))
+
+# Authentication decorator
+def login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('auth.login'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+def event_frame(event):
+    """Format one event as an SSE message; the id lets EventSource resume after a reconnect"""
+    return f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+
+@contextmanager
+def waiting_slot():
+    """Yield True if this request may wait for events, False if every slot is taken"""
+    held = _waiting.acquire(blocking=False)
+    try:
+        yield held
+    finally:
+        if held:
+            _waiting.release()
+
+def stream_events(user_id, after):
+    # The slot is taken here rather than in the view, so closing the stream always releases it
+    with waiting_slot() as held:
+        yield f"retry: {EVENTS_RETRY_MILLISECONDS}\n\n"
+        
+        closes_at = time.monotonic() + (EVENTS_HOLD_SECONDS if held else 0)
+        while True:
+            events = wait_for_events(user_id, after, max(closes_at - time.monotonic(), 0))
+            if not events:
+                break
+            for event in events:
+                yield event_frame(event)
+            after = events[-1]['id']
+
+@events_bp.route('/stream')
+@login_required
+def stream():
+    """Server-Sent Events stream of the user's task and message deltas"""
+    user_id = session.get('user_id')
+    # EventSource sends the last id it saw when it reconnects
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', 0, type=int)
+    
+    return Response(
+        stream_with_context(stream_events(user_id, after)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@events_bp.route('/')
+@login_required
+@query_budget(20, allow_repeated=True)  # polls the events table while it waits
+def poll():
+    """Long-poll fallback: the user's events after `after`, waiting up to `wait` seconds"""
+    user_id = session.get('user_id')
+    after = request.args.get('after', 0, type=int)
+    
+    wait = min(max(request.args.get('wait', EVENTS_HOLD_SECONDS, type=float), 0), EVENTS_HOLD_SECONDS)
+    
+    with waiting_slot() as held:
+        events = wait_for_events(user_id, after, wait if held else 0)
+    return jsonify({
+        'events': events,
+        'last_id': events[-1]['id'] if events else after
+    })
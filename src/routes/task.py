@@ -1,9 +1,15 @@
 from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, flash
 from src.models.user import db, User, Task
+from src.services.context_cache import invalidate_user_context
+from src.services.events import publish_event, latest_event_id, task_to_dict
+from src.services.query_budget import blueprint_query_budget
+from src.services.database import replica_reads
+from src.services.http_cache import conditional_get, user_data_version
 from functools import wraps
 from datetime import datetime, timedelta
 
 task_bp = Blueprint('task', __name__)
+blueprint_query_budget(task_bp, 4)
 
 # Authentication decorator
 def login_required(f):
@@ -14,19 +20,39 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def wants_json():
+    """Check whether the client asked for JSON instead of a redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
 @task_bp.route('/')
 @login_required
+@replica_reads
+@conditional_get(lambda: user_data_version(session['user_id'], tasks=True))
 def index():
     user_id = session.get('user_id')
     user = User.query.get(user_id)
+    last_event_id = latest_event_id(user_id)
     
     # Get all tasks for the user
     tasks = Task.query.filter_by(user_id=user_id).order_by(Task.deadline.asc()).all()
+    pending_tasks = [task for task in tasks if not task.completed]
+    completed_tasks = [task for task in tasks if task.completed]
     
     # Get current time for comparison
     now = datetime.utcnow()
     
-    return render_template('tasks.html', user=user, tasks=tasks, now=now)
+    return render_template('tasks.html', user=user, tasks=tasks, pending_tasks=pending_tasks,
+                           completed_tasks=completed_tasks, now=now, last_event_id=last_event_id)
+
+@task_bp.route('/api')
+@login_required
+@replica_reads
+@conditional_get(lambda: user_data_version(session['user_id'], tasks=True))
+def tasks_json():
+    """The user's tasks as JSON, soonest deadline first"""
+    user_id = session.get('user_id')
+    tasks = Task.query.filter_by(user_id=user_id).order_by(Task.deadline.asc()).all()
+    return jsonify({'tasks': [task_to_dict(task) for task in tasks]})
 
 @task_bp.route('/complete/<int:task_id>', methods=['POST'])
 @login_required
@@ -40,8 +66,13 @@ def complete_task(task_id):
     task.completed = True
     task.completed_at = datetime.utcnow()
     
+    data = task_to_dict(task)
+    publish_event(user_id, 'task.completed', data)
     db.session.commit()
+    invalidate_user_context(user_id)
     
+    if wants_json():
+        return jsonify({'completed': True, 'task': data})
     flash('Task marked as completed!', 'success')
     return redirect(url_for('task.index'))
 
@@ -50,9 +81,11 @@ def complete_task(task_id):
 def add_task():
     user_id = session.get('user_id')
     description = request.form.get('description')
-    days = int(request.form.get('days', 1))
+    days = request.form.get('days', 1, type=int)
     
     if not description:
+        if wants_json():
+            return jsonify({'error': 'Task description cannot be empty'}), 400
         flash('Task description cannot be empty', 'error')
         return redirect(url_for('task.index'))
     
@@ -68,8 +101,14 @@ def add_task():
     )
     
     db.session.add(new_task)
+    db.session.flush()
+    data = task_to_dict(new_task)
+    publish_event(user_id, 'task.created', data)
     db.session.commit()
+    invalidate_user_context(user_id)
     
+    if wants_json():
+        return jsonify({'task': data}), 201
     flash('Task added successfully', 'success')
     return redirect(url_for('task.index'))
 
@@ -82,7 +121,11 @@ def delete_task(task_id):
     task = Task.query.filter_by(id=task_id, user_id=user_id).first_or_404()
     
     db.session.delete(task)
+    publish_event(user_id, 'task.deleted', {'id': task_id})
     db.session.commit()
+    invalidate_user_context(user_id)
     
+    if wants_json():
+        return jsonify({'deleted': task_id})
     flash('Task deleted successfully', 'success')
     return redirect(url_for('task.index'))
@@ -0,0 +1,254 @@
+"""Background broadcast messages and bulk task assignment for the admin panel
+
+An operation targets a user filter or a list of emails (from an uploaded CSV)
+and runs on a background thread. It walks the target users in chunks and
+writes each chunk's Task and system Chat rows with batched ORM inserts. Each
+chunk is committed together with the operation's progress cursor, so an
+interrupted operation can be resumed without duplicating rows. Every claim
+gets a new token and progress is only recorded under the current one, so a
+slow thread whose operation was resumed elsewhere rolls its chunk back and stops.
+"""
+from src.models.user import db, User, Chat, Task, BulkOperation
+from src.services.context_cache import invalidate_user_context
+from src.services.events import publish_events, task_to_dict, system_message_dict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import insert, exists, func, or_, and_
+import logging
+import uuid
+import json
+import csv
+import io
+import os
+
+logger = logging.getLogger(__name__)
+
+# Users per chunk; each chunk is one transaction
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '1000'))
+
+# A running operation without progress for this long was abandoned by a dead process
+BULK_STALE_SECONDS = 300
+
+# Upper bound on emails accepted from one CSV upload
+BULK_MAX_EMAILS = 100000
+
+# Named user filters offered on the bulk page; admins are never targeted by a filter
+USER_FILTERS = {
+    'all': 'All users',
+    'active_7d': 'Logged in during the last 7 days',
+    'inactive_30d': 'No login for 30 days',
+    'pending_tasks': 'Users with pending tasks'
+}
+
+# Operations run one at a time per process
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='bulk')
+
+def task_assigned_message(description, days):
+    """System message telling a user about a task an admin assigned"""
+    return f"I've assigned you a new task: {description}. You have {days} days to complete it. Don't disappoint me, paaru!"
+
+def parse_email_csv(stream):
+    """Return the unique email addresses in an uploaded CSV, in file order"""
+    text = stream.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf-8-sig', errors='replace')
+    
+    emails = {}
+    for row in csv.reader(io.StringIO(text)):
+        for cell in row:
+            cell = cell.strip()
+            # Skip header cells and anything else that is not an address
+            if '@' in cell:
+                emails.setdefault(cell, None)
+                if len(emails) > BULK_MAX_EMAILS:
+                    raise ValueError(f"CSV has more than {BULK_MAX_EMAILS} email addresses")
+    return list(emails)
+
+def user_filter_clauses(name):
+    now = datetime.utcnow()
+    clauses = [User.is_admin == False]
+    if name == 'active_7d':
+        clauses.append(User.last_login >= now - timedelta(days=7))
+    elif name == 'inactive_30d':
+        clauses.append(or_(User.last_login.is_(None), User.last_login < now - timedelta(days=30)))
+    elif name == 'pending_tasks':
+        clauses.append(exists().where(Task.user_id == User.id, Task.completed == False).correlate(User))
+    elif name != 'all':
+        raise ValueError(f"Unknown user filter: {name}")
+    return clauses
+
+def create_bulk_operation(kind, payload, target, created_by):
+    """Save a new operation and start it in the background"""
+    operation = BulkOperation(kind=kind, payload=json.dumps(payload), target=json.dumps(target),
+                              status='pending', created_by=created_by)
+    db.session.add(operation)
+    db.session.commit()
+    start_bulk_operation(operation.id)
+    return operation
+
+def start_bulk_operation(operation_id):
+    """Run (or resume) an operation on the background thread"""
+    from flask import current_app
+    app = current_app._get_current_object()
+    _executor.submit(_run_in_app, app, operation_id)
+
+def _run_in_app(app, operation_id):
+    try:
+        with app.app_context():
+            run_bulk_operation(operation_id)
+    except Exception as e:
+        logger.error(f"Error running bulk operation {operation_id}: {str(e)}")
+
+def count_targets(target):
+    """Number of users an operation will reach"""
+    if 'emails' in target:
+        emails = target['emails']
+        return sum(db.session.query(func.count(User.id)).filter(User.email.in_(emails[start:start + BULK_CHUNK_SIZE])).scalar()
+                   for start in range(0, len(emails), BULK_CHUNK_SIZE))
+    return db.session.query(func.count(User.id)).filter(*user_filter_clauses(target['filter'])).scalar()
+
+def next_chunk(target, cursor):
+    """Return the next chunk of user ids after cursor and the new cursor, or (None, None) when done"""
+    if 'emails' in target:
+        emails = target['emails'][cursor:cursor + BULK_CHUNK_SIZE]
+        if not emails:
+            return None, None
+        user_ids = [row.id for row in db.session.query(User.id).filter(User.email.in_(emails))]
+        return user_ids, cursor + len(emails)
+    
+    # Keyset over user ids so every chunk is an index range scan
+    user_ids = [row.id for row in db.session.query(User.id).filter(*user_filter_clauses(target['filter']), User.id > cursor)
+                .order_by(User.id.asc()).limit(BULK_CHUNK_SIZE)]
+    if not user_ids:
+        return None, None
+    return user_ids, user_ids[-1]
+
+def write_chunk(kind, payload, user_ids):
+    """Insert one chunk's rows with batched executemany statements"""
+    now = datetime.utcnow()
+    events = []
+    if kind == 'task':
+        deadline = now + timedelta(days=payload['days'])
+        tasks = db.session.execute(insert(Task).returning(Task), [{
+            'user_id': user_id,
+            'description': payload['description'],
+            'deadline': deadline,
+            'completed': False,
+            'created_at': now
+        } for user_id in user_ids]).scalars().all()
+        events.extend((task.user_id, 'task.created', task_to_dict(task)) for task in tasks)
+        text = task_assigned_message(payload['description'], payload['days'])
+    else:
+        text = payload['message']
+    
+    chats = db.session.execute(insert(Chat).returning(Chat), [{
+        'user_id': user_id,
+        'message': '',
+        'response': text,
+        'timestamp': now,
+        'is_system_message': True
+    } for user_id in user_ids]).scalars().all()
+    events.extend((chat.user_id, 'chat.message', system_message_dict(chat)) for chat in chats)
+    publish_events(events)
+
+class ClaimLost(Exception):
+    """Raised when an operation was resumed by another thread while this one still ran it"""
+
+def update_claimed_operation(operation_id, claim_token, values):
+    """Update a running operation only while the caller still holds its claim; raises ClaimLost otherwise"""
+    updated = BulkOperation.query.filter_by(id=operation_id, status='running', claim_token=claim_token).update(
+        values, synchronize_session=False)
+    if updated != 1:
+        raise ClaimLost(f"Bulk operation {operation_id} was claimed by another run")
+
+def run_bulk_operation(operation_id):
+    """Process an operation from its cursor to the end"""
+    # Claim it so a double submit or resume cannot run it twice at once
+    now = datetime.utcnow()
+    claim_token = uuid.uuid4().hex
+    stale = and_(BulkOperation.status == 'running', BulkOperation.updated_at < now - timedelta(seconds=BULK_STALE_SECONDS))
+    claimed = BulkOperation.query.filter(BulkOperation.id == operation_id,
+                                         or_(BulkOperation.status.in_(('pending', 'failed')), stale)).update({
+        'status': 'running',
+        'started_at': now,
+        'updated_at': now,
+        'claim_token': claim_token,
+        'error': None
+    }, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        logger.warning(f"Bulk operation {operation_id} is not pending; not starting it")
+        return
+    
+    operation = db.session.get(BulkOperation, operation_id)
+    kind = operation.kind
+    payload = json.loads(operation.payload)
+    target = json.loads(operation.target)
+    cursor = operation.cursor
+    processed = operation.processed
+    logger.info(f"Starting bulk {kind} operation {operation_id} from cursor {cursor}")
+    
+    try:
+        if operation.total is None:
+            update_claimed_operation(operation_id, claim_token, {'total': count_targets(target)})
+            db.session.commit()
+        
+        while True:
+            user_ids, next_cursor = next_chunk(target, cursor)
+            if next_cursor is None:
+                break
+            if user_ids:
+                write_chunk(kind, payload, user_ids)
+            
+            # Progress is committed with the rows it describes, or rolled back with them
+            # if another run took the operation over
+            update_claimed_operation(operation_id, claim_token, {
+                'cursor': next_cursor,
+                'processed': processed + len(user_ids),
+                'updated_at': datetime.utcnow()
+            })
+            db.session.commit()
+            cursor = next_cursor
+            processed += len(user_ids)
+            
+            if kind == 'task':
+                for user_id in user_ids:
+                    invalidate_user_context(user_id)
+        
+        update_claimed_operation(operation_id, claim_token, {'status': 'done', 'finished_at': datetime.utcnow()})
+        db.session.commit()
+        logger.info(f"Finished bulk operation {operation_id}: {processed} users")
+    
+    except ClaimLost as e:
+        db.session.rollback()
+        logger.warning(f"{e}; stopping this run at cursor {cursor}")
+    
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Bulk operation {operation_id} failed at cursor {cursor}: {str(e)}")
+        try:
+            update_claimed_operation(operation_id, claim_token, {'status': 'failed', 'error': str(e)})
+            db.session.commit()
+        except ClaimLost:
+            db.session.rollback()
+
+def can_resume(operation):
+    """Failed operations and running ones that stopped making progress can be resumed"""
+    if operation.status == 'failed':
+        return True
+    cutoff = datetime.utcnow() - timedelta(seconds=BULK_STALE_SECONDS)
+    return operation.status == 'running' and operation.updated_at is not None and operation.updated_at < cutoff
+
+def operation_to_dict(operation):
+    """JSON-friendly progress of an operation"""
+    return {
+        'id': operation.id,
+        'kind': operation.kind,
+        'status': operation.status,
+        'total': operation.total,
+        'processed': operation.processed,
+        'error': operation.error,
+        'can_resume': can_resume(operation),
+        'created_at': operation.created_at.strftime('%Y-%m-%d %H:%M'),
+        'finished_at': operation.finished_at.strftime('%Y-%m-%d %H:%M') if operation.finished_at else None
+    }
@@ -0,0 +1,211 @@
+"""Token-budgeted conversation context with a rolling summary of older history"""
+from src.models.user import db, Chat, ConversationSummary
+from src.services.pagination import chat_history_page
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import func
+import threading
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budget for the system prompt, summary and history together
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '3000'))
+
+# Refresh the summary once this many messages have arrived since it was last updated
+SUMMARY_REFRESH_EVERY = int(os.environ.get('SUMMARY_REFRESH_EVERY', '10'))
+
+# The newest messages are always sent verbatim and never folded into the summary
+SUMMARY_KEEP_RECENT = 10
+
+# Upper bound on messages folded into the summary by one refresh
+SUMMARY_MAX_FOLD = 100
+
+# Rough per-message overhead for role and formatting tokens
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Rows fetched per round trip while filling the budget
+HISTORY_BATCH_SIZE = 20
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a conversation between a user and their assistant.
+Merge the new messages into the existing summary. Keep facts about the user, their goals, commitments,
+assigned tasks and progress; drop small talk. Write in the third person, at most 200 words."""
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='summary')
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token)"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + MESSAGE_TOKEN_OVERHEAD
+
+def chat_messages(chat, placeholder):
+    """Turn a chat row into chat-completion messages, oldest first"""
+    messages = []
+    if chat.message:
+        messages.append({"role": "user", "content": chat.message})
+    if chat.response and chat.response != placeholder:
+        messages.append({"role": "assistant", "content": chat.response})
+    return messages
+
+def build_context(user_id, system_prompt, placeholder, budget=None, max_messages=None):
+    """Return chat-completion messages that fit the token budget.
+    
+    Fills the budget from the newest messages backwards, down to the last chat
+    the rolling summary covers. If the budget runs out before that point, the
+    chats left out are queued to be folded into the summary.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    
+    summary = db.session.get(ConversationSummary, user_id)
+    covered = summary.covered_chat_id if summary else 0
+    if summary and summary.summary:
+        system_prompt = f"{system_prompt}\n\nSUMMARY OF EARLIER CONVERSATION:\n{summary.summary}"
+    
+    system_message = {"role": "system", "content": system_prompt}
+    remaining = budget - message_tokens(system_message)
+    
+    history = []
+    before = None
+    dropped_chat_id = None
+    exhausted = False
+    while not exhausted:
+        chats, older_cursor = chat_history_page(user_id, before, HISTORY_BATCH_SIZE)
+        if older_cursor is None:
+            exhausted = True
+        if chats:
+            before = (chats[0].timestamp, chats[0].id)
+        
+        # Pages come back oldest first; walk them newest first
+        for chat in reversed(chats):
+            if chat.id <= covered:
+                # Everything from here back is in the summary
+                exhausted = True
+                break
+            messages = chat_messages(chat, placeholder)
+            cost = sum(message_tokens(message) for message in messages)
+            if cost > remaining or (max_messages and len(history) + len(messages) > max_messages):
+                # Always send the newest message, even if it alone exceeds the budget
+                if not history:
+                    history = messages[-1:]
+                else:
+                    dropped_chat_id = chat.id
+                exhausted = True
+                break
+            remaining -= cost
+            history = messages + history
+    
+    # Chats between the summary and the oldest one sent would otherwise never reach the model
+    if dropped_chat_id is not None:
+        schedule_summary_refresh(user_id, placeholder, through_chat_id=dropped_chat_id)
+    
+    logger.info(f"Built context for user {user_id}: {len(history)} messages, {budget - remaining} of {budget} tokens")
+    return [system_message] + history
+
+def maybe_refresh_summary(user_id, placeholder):
+    """Queue a background summary refresh once enough new messages have arrived"""
+    covered = db.session.query(ConversationSummary.covered_chat_id).filter_by(user_id=user_id).scalar() or 0
+    pending = db.session.query(func.count(Chat.id)).filter(Chat.user_id == user_id, Chat.id > covered).scalar()
+    if pending < SUMMARY_REFRESH_EVERY + SUMMARY_KEEP_RECENT:
+        return False
+    return schedule_summary_refresh(user_id, placeholder)
+
+def schedule_summary_refresh(user_id, placeholder, through_chat_id=None):
+    """Run refresh_summary in the background unless one is already running for the user"""
+    with _in_flight_lock:
+        if user_id in _in_flight:
+            return False
+        _in_flight.add(user_id)
+    
+    from flask import current_app
+    app = current_app._get_current_object()
+    _executor.submit(_refresh_summary, app, user_id, placeholder, through_chat_id)
+    return True
+
+def _refresh_summary(app, user_id, placeholder, through_chat_id=None):
+    try:
+        with app.app_context():
+            refresh_summary(user_id, placeholder, through_chat_id=through_chat_id)
+    except Exception as e:
+        logger.error(f"Error refreshing conversation summary for user {user_id}: {str(e)}")
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(user_id)
+
+def refresh_summary(user_id, placeholder, through_chat_id=None):
+    """Fold messages older than the recent window into the user's summary.
+    
+    With through_chat_id, fold every message up to that chat instead: the ones
+    build_context had to leave out, which may be inside the recent window.
+    """
+    from src.services.grok_client import get_grok_client
+    from src.routes.chat import GROK_MODEL
+    
+    summary = db.session.get(ConversationSummary, user_id)
+    covered = summary.covered_chat_id if summary else 0
+    previous_summary = summary.summary if summary else ''
+    
+    # Everything after the covered point except the newest messages, oldest first
+    if through_chat_id is not None:
+        newer_bound = Chat.id <= through_chat_id
+    else:
+        recent_ids = db.session.query(Chat.id).filter(Chat.user_id == user_id).order_by(Chat.id.desc()).limit(SUMMARY_KEEP_RECENT).subquery()
+        newer_bound = Chat.id.notin_(db.select(recent_ids.c.id))
+    rows = db.session.query(Chat.id, Chat.message, Chat.response).filter(
+        Chat.user_id == user_id, Chat.id > covered, newer_bound
+    ).order_by(Chat.id.asc()).limit(SUMMARY_MAX_FOLD).all()
+    if not rows:
+        return None
+    
+    transcript = []
+    for row in rows:
+        for message in chat_messages(row, placeholder):
+            transcript.append(f"{message['role'].upper()}: {message['content']}")
+    
+    payload = {
+        "messages": [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": f"EXISTING SUMMARY:\n{previous_summary or '(none)'}\n\nNEW MESSAGES:\n" + "\n".join(transcript)}
+        ],
+        "model": GROK_MODEL,
+        "stream": False,
+        "temperature": 0.2
+    }
+    
+    response = get_grok_client().chat_completion(payload)
+    if response.status_code != 200:
+        logger.error(f"Summary refresh for user {user_id} failed: Status {response.status_code}")
+        return None
+    new_summary = response.json()['choices'][0]['message']['content'].strip()
+    new_covered = rows[-1].id
+    
+    # Compare-and-set on the covered point so concurrent refreshes in other processes cannot regress it
+    if summary is None:
+        db.session.add(ConversationSummary(user_id=user_id, summary=new_summary, covered_chat_id=new_covered,
+                                           updated_at=datetime.utcnow()))
+    else:
+        updated = ConversationSummary.query.filter_by(user_id=user_id, covered_chat_id=covered).update({
+            'summary': new_summary,
+            'covered_chat_id': new_covered,
+            'updated_at': datetime.utcnow()
+        }, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            return None
+    
+    try:
+        db.session.commit()
+    except Exception:
+        # Another process created the summary first
+        db.session.rollback()
+        return None
+    
+    logger.info(f"Refreshed conversation summary for user {user_id} through chat {new_covered}")
+    return new_summary
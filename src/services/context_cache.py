@@ -0,0 +1,59 @@
+"""In-process cache of the per-user context summary used in the system prompt
+
+Entries are stored with the user's task version (user_data_version) and only
+served while it is unchanged, so task writes made by other processes are seen
+on the next read. invalidate_user_context() drops the local entry early.
+"""
+from collections import OrderedDict
+import threading
+import time
+import os
+
+# Entries also expire, which keeps the "days since first interaction" line current
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get('CONTEXT_CACHE_TTL', '60'))
+
+# Upper bound on cached users per process
+CONTEXT_CACHE_MAX_ENTRIES = 10000
+
+class UserTTLCache:
+    """Small TTL + LRU cache keyed by user id"""
+    
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+    
+    def set(self, user_id, value):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+context_cache = UserTTLCache(CONTEXT_CACHE_TTL_SECONDS, CONTEXT_CACHE_MAX_ENTRIES)
+
+def invalidate_user_context(user_id):
+    """Drop the cached summary after a user's tasks change"""
+    context_cache.invalidate(user_id)
@@ -0,0 +1,156 @@
+"""Database engine configuration and read-replica routing
+
+Engines get a connection pool sized for the threads of one process, pre-ping,
+recycling and a per-statement timeout, all configurable through DB_* variables.
+With DB_PGBOUNCER=true, pooling is left to PgBouncer and the statement timeout
+is set per transaction, since PgBouncer rejects startup options.
+
+When DATABASE_REPLICA_URL is set, views marked with @replica_reads send their
+SELECTs to the replica. Writes, row locks and everything after the first write
+of a request still go to the primary. A user whose request committed a write
+reads from the primary for DB_REPLICA_STICKY_SECONDS afterwards, so they never
+see a page older than their own change.
+"""
+from flask import session, g, has_request_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.dml import UpdateBase
+from functools import wraps
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+# Connections one process can use at once: request threads plus in-process chat workers
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or
+                   int(os.environ.get('GUNICORN_THREADS', '16')) + int(os.environ.get('CHAT_WORKER_THREADS', '2')))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '5'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+
+# Milliseconds before PostgreSQL cancels a statement; 0 disables the limit
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000'))
+
+# Connect through PgBouncer in transaction pooling mode
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true'
+
+# How long a user who just wrote keeps reading from the primary
+DB_REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', '10'))
+
+# Session cookie key holding the end of the user's primary-only window
+STICKY_SESSION_KEY = 'db_primary_until'
+
+def engine_options(uri):
+    """SQLAlchemy engine options for a database URI"""
+    options = {'pool_pre_ping': DB_POOL_PRE_PING}
+    if not uri.startswith('postgresql'):
+        return options
+    
+    connect_args = {'connect_timeout': DB_CONNECT_TIMEOUT}
+    if DB_PGBOUNCER:
+        # PgBouncer pools server connections; holding idle ones here would only pin its slots
+        options['poolclass'] = NullPool
+        options.pop('pool_pre_ping')
+    else:
+        options.update({
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE
+        })
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args['options'] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    options['connect_args'] = connect_args
+    return options
+
+def configure_database(app, db_uri):
+    """Set the engine options and the optional replica bind on the app config"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(db_uri)
+    
+    replica_uri = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_uri:
+        if replica_uri.startswith('postgres://'):
+            replica_uri = replica_uri.replace('postgres://', 'postgresql://', 1)
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: {'url': replica_uri, **engine_options(replica_uri)}}
+        logger.info("Read replica configured for replica-routed views")
+
+@event.listens_for(Engine, 'begin')
+def _set_transaction_timeout(conn):
+    # Behind PgBouncer the timeout cannot be a startup option, and a plain SET would
+    # leak to other clients of the server connection, so it is set per transaction
+    if not DB_PGBOUNCER or not DB_STATEMENT_TIMEOUT_MS or conn.dialect.name != 'postgresql':
+        return
+    # Straight on the driver cursor, so it is not counted as one of the request's queries
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+def replica_reads(f):
+    """Send the SELECTs of a read-only view to the read replica.
+    
+    Goes below the login decorators, so authorization checks still read the primary.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_replica = session.get(STICKY_SESSION_KEY, 0) < time.time()
+        return f(*args, **kwargs)
+    return decorated_function
+
+def _wants_replica():
+    return has_request_context() and g.get('read_replica', False)
+
+class RoutingSession(FlaskSession):
+    """Session that sends reads of replica-routed views to the replica bind"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _wants_replica() and REPLICA_BIND in self._db.engines:
+            # A bare session.connection() is how Core writes get their connection here
+            writes = (self._flushing or (mapper is None and clause is None) or isinstance(clause, UpdateBase)
+                      or getattr(clause, '_for_update_arg', None) is not None)
+            if writes:
+                # Later reads of this request must see its own writes
+                self.info['wrote_primary'] = True
+            elif not self.info.get('wrote_primary'):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(Session, 'after_flush')
+def _note_flush(db_session, flush_context):
+    db_session.info['pending_write'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['pending_write'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _note_commit(db_session):
+    if db_session.info.pop('pending_write', False) and has_request_context():
+        g.committed_write = True
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop('pending_write', None)
+
+def init_replica_routing(app):
+    """Keep users whose request wrote something on the primary for a while"""
+    if not app.config.get('SQLALCHEMY_BINDS', {}).get(REPLICA_BIND):
+        return
+    
+    @app.after_request
+    def stick_to_primary(response):
+        # Only signed-in users have pages that must show their own writes
+        if g.get('committed_write') and 'user_id' in session:
+            session[STICKY_SESSION_KEY] = time.time() + DB_REPLICA_STICKY_SECONDS
+        return response
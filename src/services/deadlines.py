@@ -0,0 +1,94 @@
+"""Deadline sweep: mark pending tasks past their deadline overdue and remind their users
+
+Each batch picks candidate tasks from the ix_tasks_unswept_deadline partial
+index, then claims them with a compare-and-set UPDATE ... RETURNING that only
+matches tasks still pending and unswept. Only the claimed tasks get a
+reminder, inserted in the same transaction, so sweeps running in several
+processes at once never remind a user twice. On PostgreSQL the candidates are
+also selected FOR UPDATE SKIP LOCKED, so concurrent sweeps take different
+batches instead of contending for the same rows.
+"""
+from src.models.user import db, Chat, Task
+from src.services.context_cache import invalidate_user_context
+from src.services.events import publish_events, system_message_dict
+from sqlalchemy import select, update, insert
+from datetime import datetime
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps in the chat workers; 0 disables the scheduled sweep
+DEADLINE_SWEEP_INTERVAL = int(os.environ.get('DEADLINE_SWEEP_INTERVAL', '60'))
+
+# Tasks claimed per transaction, and batches per scheduled run
+DEADLINE_SWEEP_BATCH_SIZE = 500
+DEADLINE_SWEEP_MAX_BATCHES = 20
+
+def overdue_reminder_message(description):
+    """System message telling a user one of their tasks is overdue"""
+    return f"Your task is overdue: {description}. The deadline has passed and I'm still waiting. Finish it today, paaru!"
+
+def _claim_overdue(now, batch_size):
+    """Mark one batch of overdue tasks and return the (id, user_id, description) rows this sweep claimed"""
+    candidates = select(Task.id).where(
+        Task.completed == False,
+        Task.overdue_at.is_(None),
+        Task.deadline < now
+    ).order_by(Task.deadline.asc()).limit(batch_size).with_for_update(skip_locked=True)
+    task_ids = db.session.execute(candidates).scalars().all()
+    if not task_ids:
+        return []
+    
+    # Only rows still unswept match, so a concurrent sweep cannot claim them twice
+    return db.session.execute(
+        update(Task).where(Task.id.in_(task_ids), Task.completed == False, Task.overdue_at.is_(None))
+        .values(overdue_at=now).returning(Task.id, Task.user_id, Task.description)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+def sweep_overdue_tasks(batch_size=DEADLINE_SWEEP_BATCH_SIZE, max_batches=None):
+    """Mark overdue tasks and insert a reminder for each; returns how many were marked"""
+    marked = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        now = datetime.utcnow()
+        claimed = _claim_overdue(now, batch_size)
+        if not claimed:
+            db.session.commit()
+            break
+        
+        # Reminders are committed with the overdue marks they belong to
+        reminders = db.session.execute(insert(Chat).returning(Chat), [{
+            'user_id': task.user_id,
+            'message': '',
+            'response': overdue_reminder_message(task.description),
+            'timestamp': now,
+            'is_system_message': True
+        } for task in claimed]).scalars().all()
+        publish_events([(task.user_id, 'task.overdue', {'id': task.id}) for task in claimed] +
+                       [(chat.user_id, 'chat.message', system_message_dict(chat)) for chat in reminders])
+        db.session.commit()
+        
+        for user_id in {task.user_id for task in claimed}:
+            invalidate_user_context(user_id)
+        
+        marked += len(claimed)
+        batches += 1
+        logger.info(f"Marked {len(claimed)} tasks overdue")
+    
+    return marked
+
+def register_deadline_commands(app):
+    """Add `flask deadlines sweep` to the app CLI"""
+    import click
+    
+    @app.cli.group('deadlines')
+    def deadlines_group():
+        """Task deadline sweeps."""
+    
+    @deadlines_group.command('sweep')
+    def sweep_command():
+        """Mark overdue tasks and remind their users."""
+        marked = sweep_overdue_tasks()
+        click.echo(f'Marked {marked} tasks overdue')
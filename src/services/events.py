@@ -0,0 +1,122 @@
+"""Per-user live updates: task and message deltas pushed to open pages
+
+Routes publish small events (a task created, completed, deleted or overdue,
+a system message arriving) into the user_events table in the same
+transaction as the change itself, so an event exists exactly when its change
+was committed. Every web process, the standalone worker and every instance
+share the table. Browsers follow it over Server-Sent Events or a long-poll
+fallback (see src/routes/events.py); commits in the same process wake
+waiting streams immediately, others are picked up on the next poll.
+"""
+from src.models.user import db, UserEvent
+from sqlalchemy import event, insert, delete, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import threading
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# How often an open stream checks for events published by other processes
+EVENTS_POLL_SECONDS = float(os.environ.get('EVENTS_POLL_SECONDS', '2'))
+
+# Events are only needed until open pages have picked them up
+EVENTS_RETENTION_SECONDS = 3600
+EVENTS_PRUNE_INTERVAL_SECONDS = 300
+EVENTS_PRUNE_BATCH_SIZE = 5000
+
+# Upper bound on events returned per poll
+EVENTS_BATCH_LIMIT = 100
+
+# Woken after a commit that published events in this process
+_published = threading.Condition()
+
+def task_to_dict(task):
+    """JSON representation of a task for events and the task endpoints"""
+    return {
+        'id': task.id,
+        'description': task.description,
+        'deadline': task.deadline.isoformat() if task.deadline else None,
+        'completed': bool(task.completed),
+        'completed_at': task.completed_at.isoformat() if task.completed_at else None,
+        'overdue': task.is_overdue
+    }
+
+def system_message_dict(chat):
+    """Event payload for a system message shown in the user's chat"""
+    return {
+        'id': chat.id,
+        'response': chat.response,
+        'timestamp': chat.timestamp.isoformat() if chat.timestamp else None,
+        'is_system_message': True
+    }
+
+def publish_event(user_id, kind, data):
+    """Queue one event in the current transaction; it is delivered once the caller commits"""
+    publish_events([(user_id, kind, data)])
+
+def publish_events(events):
+    """Queue (user_id, kind, data) events with one batched insert in the current transaction"""
+    if not events:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(UserEvent), [{
+        'user_id': user_id,
+        'kind': kind,
+        'data': json.dumps(data),
+        'created_at': now
+    } for user_id, kind, data in events])
+    db.session.info['published_events'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _wake_streams(session):
+    if session.info.pop('published_events', False):
+        with _published:
+            _published.notify_all()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_published(session):
+    session.info.pop('published_events', None)
+
+def latest_event_id(user_id):
+    """Id of the user's newest event; pages start following from here"""
+    return db.session.query(func.coalesce(func.max(UserEvent.id), 0)).filter(UserEvent.user_id == user_id).scalar()
+
+def events_after(user_id, after, limit=EVENTS_BATCH_LIMIT):
+    """The user's events with an id above `after`, oldest first"""
+    rows = db.session.query(UserEvent.id, UserEvent.kind, UserEvent.data).filter(
+        UserEvent.user_id == user_id, UserEvent.id > after
+    ).order_by(UserEvent.id.asc()).limit(limit).all()
+    # Release the connection while the caller waits for more
+    db.session.rollback()
+    return [{'id': row.id, 'kind': row.kind, 'data': json.loads(row.data)} for row in rows]
+
+def wait_for_events(user_id, after, timeout):
+    """Return the user's events after `after`, waiting up to `timeout` seconds for the first one"""
+    deadline = time.monotonic() + timeout
+    while True:
+        events = events_after(user_id, after)
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            return events
+        with _published:
+            _published.wait(min(EVENTS_POLL_SECONDS, remaining))
+
+def prune_events(max_age_seconds=EVENTS_RETENTION_SECONDS, batch_size=EVENTS_PRUNE_BATCH_SIZE):
+    """Delete events older than max_age_seconds in batches and return how many were removed"""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    removed = 0
+    while True:
+        event_ids = [row.id for row in db.session.query(UserEvent.id).filter(UserEvent.created_at < cutoff)
+                     .order_by(UserEvent.id.asc()).limit(batch_size)]
+        if not event_ids:
+            break
+        db.session.execute(delete(UserEvent).where(UserEvent.id.in_(event_ids)))
+        db.session.commit()
+        removed += len(event_ids)
+    if removed:
+        logger.info(f"Pruned {removed} delivered user events")
+    return removed
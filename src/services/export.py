@@ -0,0 +1,142 @@
+"""Streaming CSV and JSON-lines export of chat and task history
+
+Rows are read through a server-side cursor (yield_per) and written out as
+they arrive, optionally gzip-compressed on the fly, so memory use stays flat
+however large the chats table is. A user's archived chats are exported
+before their hot ones.
+"""
+from src.models.user import db, User, Chat, Task, ChatArchiveSegment
+from src.services.bulk_ops import user_filter_clauses
+from src.services.retention import decode_segment
+from sqlalchemy import select
+import logging
+import json
+import csv
+import io
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per cursor round trip; archive segments hold up to 500 chats each
+EXPORT_FETCH_SIZE = 1000
+EXPORT_SEGMENT_FETCH_SIZE = 20
+
+# Output is buffered up to this size before a chunk is sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson'
+}
+
+EXPORT_FIELDS = {
+    'chats': ['id', 'user_id', 'email', 'timestamp', 'is_system_message', 'message', 'response', 'archived'],
+    'tasks': ['id', 'user_id', 'email', 'description', 'deadline', 'completed', 'completed_at', 'created_at']
+}
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+def _stream(statement, fetch_size=EXPORT_FETCH_SIZE):
+    # yield_per streams from a server-side cursor instead of loading the whole result
+    return db.session.execute(statement.execution_options(yield_per=fetch_size))
+
+def scope_clauses(user_id=None, cohort=None):
+    """User filter for one user, a named cohort, or everyone"""
+    if user_id is not None:
+        return [User.id == user_id]
+    if cohort:
+        return user_filter_clauses(cohort)
+    return []
+
+def chat_rows(clauses):
+    """Archived then hot chats of the users matching `clauses`, as dicts"""
+    segments = select(ChatArchiveSegment.user_id, User.email, ChatArchiveSegment.data).join(
+        User, User.id == ChatArchiveSegment.user_id).where(*clauses).order_by(ChatArchiveSegment.id)
+    for segment in _stream(segments, EXPORT_SEGMENT_FETCH_SIZE):
+        for chat in decode_segment(segment):
+            yield {
+                'id': chat['id'],
+                'user_id': segment.user_id,
+                'email': segment.email,
+                'timestamp': chat['timestamp'],
+                'is_system_message': chat['is_system_message'],
+                'message': chat['message'],
+                'response': chat['response'],
+                'archived': True
+            }
+    
+    chats = select(Chat.id, Chat.user_id, User.email, Chat.timestamp, Chat.is_system_message, Chat.message,
+                   Chat.response).join(User, User.id == Chat.user_id).where(*clauses).order_by(Chat.id)
+    for row in _stream(chats):
+        yield {
+            'id': row.id,
+            'user_id': row.user_id,
+            'email': row.email,
+            'timestamp': _iso(row.timestamp),
+            'is_system_message': row.is_system_message,
+            'message': row.message,
+            'response': row.response,
+            'archived': False
+        }
+
+def task_rows(clauses):
+    """Tasks of the users matching `clauses`, as dicts"""
+    tasks = select(Task.id, Task.user_id, User.email, Task.description, Task.deadline, Task.completed,
+                   Task.completed_at, Task.created_at).join(User, User.id == Task.user_id).where(*clauses).order_by(Task.id)
+    for row in _stream(tasks):
+        yield {
+            'id': row.id,
+            'user_id': row.user_id,
+            'email': row.email,
+            'description': row.description,
+            'deadline': _iso(row.deadline),
+            'completed': row.completed,
+            'completed_at': _iso(row.completed_at),
+            'created_at': _iso(row.created_at)
+        }
+
+def encode_rows(rows, fields, fmt):
+    """Serialize rows as CSV or JSON lines, yielding UTF-8 chunks of about EXPORT_CHUNK_BYTES"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+    
+    for row in rows:
+        if writer:
+            writer.writerow([row[field] for field in fields])
+        else:
+            buffer.write(json.dumps(row) + '\n')
+        
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def gzip_chunks(chunks):
+    """Compress a byte stream into a gzip file incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(dataset, fmt, user_id=None, cohort=None, compress=False):
+    """Chunks of the export file for `dataset` ('chats' or 'tasks')"""
+    clauses = scope_clauses(user_id, cohort)
+    rows = chat_rows(clauses) if dataset == 'chats' else task_rows(clauses)
+    chunks = encode_rows(rows, EXPORT_FIELDS[dataset], fmt)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    
+    yield from chunks
+    logger.info(f"Finished {dataset} export ({fmt}, user={user_id}, filter={cohort})")
+
+def export_filename(dataset, fmt, user_id=None, cohort=None, compress=False):
+    scope = f"user-{user_id}" if user_id is not None else (cohort or 'all')
+    return f"{dataset}-{scope}.{fmt}{'.gz' if compress else ''}"
@@ -0,0 +1,244 @@
+"""Pooled, resilient HTTP client for the Grok chat completions API"""
+from requests.adapters import HTTPAdapter
+from src.services.metrics import LLM_DURATION, LLM_ERRORS, LLM_RETRIES
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import requests
+import threading
+import logging
+import random
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = "https://api.x.ai/v1/chat/completions"
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+class GrokNotConfigured(requests.exceptions.RequestException):
+    """Raised instead of calling the API when no API key is configured"""
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures, then let a single trial call through"""
+    
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.open_count = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    
+    def allow_request(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    self.open_count += 1
+                    logger.warning(f"Grok circuit breaker opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+class GrokClient:
+    """Chat completions client with a keep-alive connection pool, retries and a circuit breaker"""
+    
+    def __init__(self, api_url=None, api_key=None, max_retries=None, backoff_base=0.5, backoff_cap=8.0,
+                 max_retry_after=10.0, connect_timeout=5, read_timeout=30, pool_size=10,
+                 failure_threshold=5, reset_timeout=30):
+        self.api_url = api_url or os.environ.get('GROK_API_URL', DEFAULT_API_URL)
+        self.api_key = api_key or os.environ.get('GROK_API_KEY')
+        if not self.api_key:
+            raise GrokNotConfigured("GROK_API_KEY is not set, so the Grok API client is disabled")
+        self.max_retries = int(os.environ.get('GROK_MAX_RETRIES', '2')) if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_retry_after = max_retry_after
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        
+        # One pooled session per client; connections are kept alive between calls
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        })
+        
+        # Per-call counters
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.rejected = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+    
+    def chat_completion(self, payload, stream=False):
+        """POST a chat completion request and return the response.
+        
+        Retryable failures are retried with jittered exponential backoff. The final
+        response is returned even when it is not a 200 so callers can report the
+        status. Connection errors are raised as requests exceptions, and
+        CircuitOpenError is raised without calling the API while the breaker is open.
+        """
+        if not self.breaker.allow_request():
+            with self._stats_lock:
+                self.rejected += 1
+            LLM_ERRORS.labels('circuit_open').inc()
+            raise CircuitOpenError("Grok API circuit breaker is open")
+        
+        # Any exception ends the call as a failure, so a half-open trial never stays in flight
+        attempt = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = self.session.post(self.api_url, json=payload, stream=stream, timeout=self.timeout)
+                except requests.exceptions.RequestException as e:
+                    self._record_call(started, 'error')
+                    transient = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+                    if transient and attempt < self.max_retries:
+                        delay = self._backoff(attempt)
+                        logger.warning(f"Grok API request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                        attempt += 1
+                        self._sleep(delay)
+                        continue
+                    raise
+                
+                retryable = response.status_code in RETRYABLE_STATUS_CODES
+                self._record_call(started, response.status_code)
+                
+                if retryable and attempt < self.max_retries:
+                    delay = self._retry_delay(response, attempt)
+                    if delay is not None:
+                        logger.warning(f"Grok API returned {response.status_code}, retrying in {delay:.2f}s")
+                        response.close()
+                        attempt += 1
+                        self._sleep(delay)
+                        continue
+                
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return response
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+    
+    def stats(self):
+        """Return a snapshot of the client counters"""
+        with self._stats_lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'latency_total_seconds': self.latency_total,
+                'latency_max_seconds': self.latency_max,
+                'latency_avg_seconds': self.latency_total / self.calls if self.calls else 0.0,
+                'circuit_state': self.breaker.state,
+                'circuit_open_count': self.breaker.open_count
+            }
+    
+    def _record_call(self, started, status):
+        # Latency is measured to the response headers; streamed bodies are read later
+        elapsed = time.perf_counter() - started
+        error = status != 200
+        with self._stats_lock:
+            self.calls += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            if error:
+                self.errors += 1
+        LLM_DURATION.labels(str(status)).observe(elapsed)
+        if error:
+            LLM_ERRORS.labels('connection' if status == 'error' else f'http_{status}').inc()
+        logger.info(f"Grok API call took {elapsed * 1000:.0f}ms")
+    
+    def _sleep(self, delay):
+        with self._stats_lock:
+            self.retries += 1
+        LLM_RETRIES.inc()
+        time.sleep(delay)
+    
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+    
+    def _retry_delay(self, response, attempt):
+        """Delay before retrying a response, honouring Retry-After; None means do not retry"""
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        if retry_after is None:
+            return self._backoff(attempt)
+        if retry_after > self.max_retry_after:
+            # Waiting this long would hold a worker for too long; give up instead
+            return None
+        return retry_after
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_grok_client():
+    """Return the per-process Grok client, creating it after a fork if needed.
+    
+    Raises GrokNotConfigured while GROK_API_KEY is missing.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                # Pooled sockets must not be shared with a forked parent
+                _client = GrokClient()
+                _client_pid = pid
+    return _client
@@ -0,0 +1,222 @@
+"""HTTP caching and compression
+
+- Pages and JSON endpoints decorated with @conditional_get carry a weak ETag
+  built from a cheap per-user data version (counts and newest ids of the rows
+  they show). A matching If-None-Match gets 304 before the view runs, so
+  nothing is queried beyond the version or rendered.
+- Static URLs get a content hash (?v=...) from url_for. Matching requests are
+  cached as immutable for a year; a changed file gets a new URL.
+- Text responses above COMPRESS_MIN_BYTES are compressed with brotli (when
+  the brotli package is installed) or gzip, as the client accepts.
+"""
+from flask import request, make_response, current_app, session
+from src.models.user import db, Chat, Task, PROCESSING_PLACEHOLDER
+from sqlalchemy import select, func, case, and_, true, literal
+from functools import wraps
+from collections import OrderedDict
+from datetime import datetime
+import threading
+import hashlib
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies gain too little from compression to be worth the CPU
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml'
+}
+
+# Fingerprinted static files never change under the same URL
+STATIC_MAX_AGE_SECONDS = 365 * 24 * 3600
+
+# Compressed static bodies kept per process, keyed by file, ETag and encoding
+STATIC_COMPRESSED_MAX_ENTRIES = 64
+
+_fingerprints = {}
+_compressed_static = OrderedDict()
+_compressed_lock = threading.Lock()
+_release = None
+
+def static_fingerprint(filename):
+    """Short content hash of a static file, recomputed when the file changes"""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _fingerprints.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha256(f.read()).hexdigest()[:12])
+        _fingerprints[filename] = cached
+    return cached[1]
+
+def release_token():
+    """Hash of the templates and static files, so a deploy that changes the markup changes every ETag"""
+    global _release
+    if _release is None:
+        digest = hashlib.sha256()
+        for folder in (os.path.join(current_app.root_path, current_app.template_folder), current_app.static_folder):
+            for root, dirs, files in os.walk(folder):
+                dirs.sort()
+                for name in sorted(files):
+                    with open(os.path.join(root, name), 'rb') as f:
+                        digest.update(f.read())
+        _release = digest.hexdigest()[:12]
+    return _release
+
+def user_data_version(user_id, chats=False, tasks=False):
+    """Counts and newest ids of a user's chats and/or tasks, read in one query.
+    
+    Every change the pages show moves one of them: a new row, a deletion or
+    archive run, a reply replacing the placeholder, a completion, or a pending
+    task passing its deadline. Each aggregate reads only the user's entries in
+    ix_chats_user_id_timestamp, ix_chats_user_id_pending_reply or
+    ix_tasks_user_id_completed_deadline, never the table rows.
+    """
+    stats = []
+    if chats:
+        # The placeholder is inlined so the planner can match the partial index
+        pending_replies = select(func.count()).where(
+            Chat.user_id == user_id, Chat.response == literal(PROCESSING_PLACEHOLDER, literal_execute=True)
+        ).scalar_subquery()
+        chat_stats = select(
+            func.count().label('chats'),
+            func.coalesce(func.max(Chat.id), 0).label('last_chat'),
+            pending_replies.label('pending_replies')
+        ).where(Chat.user_id == user_id).subquery()
+        stats.append(chat_stats)
+    if tasks:
+        task_stats = select(
+            func.count().label('tasks'),
+            func.coalesce(func.max(Task.id), 0).label('last_task'),
+            func.count(case((Task.completed == True, 1))).label('completed'),
+            func.count(case((and_(Task.completed == False, Task.deadline < datetime.utcnow()), 1))).label('past_deadline')
+        ).where(Task.user_id == user_id).subquery()
+        stats.append(task_stats)
+    
+    # Each side is a single aggregate row, so joining them on true yields one row
+    joined = stats[0]
+    for subquery in stats[1:]:
+        joined = joined.join(subquery, true())
+    return tuple(db.session.execute(select(*[column for subquery in stats for column in subquery.c]).select_from(joined)).one())
+
+def make_etag(*parts):
+    """Opaque ETag value for the given version parts"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+def conditional_get(version):
+    """Answer 304 when the client already has the current version of a view.
+    
+    `version` gets the view arguments and returns the parts the ETag is built
+    from. The user and their role are always included, since pages differ per user.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = make_etag(release_token(), session.get('user_id'), session.get('is_admin'),
+                             request.full_path, version(*args, **kwargs))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # The browser may keep the page but must revalidate it on every use
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def _compressed_static_body(response, encoding):
+    # Static files are read and compressed once per process, not per request
+    key = (request.view_args.get('filename'), response.get_etag()[0], encoding)
+    with _compressed_lock:
+        body = _compressed_static.get(key)
+    response.direct_passthrough = False
+    if body is None:
+        body = _compress(response.get_data(), encoding)
+        with _compressed_lock:
+            _compressed_static[key] = body
+            while len(_compressed_static) > STATIC_COMPRESSED_MAX_ENTRIES:
+                _compressed_static.popitem(last=False)
+    # set_data replaces the file send_file opened without closing it
+    response.response.close()
+    return body
+
+def compress_response(response):
+    """Compress a finished text response if the client accepts it and it is large enough"""
+    static = request.endpoint == 'static'
+    # Streamed responses (SSE, exports) must reach the client as they are produced;
+    # static files only look streamed because send_file passes the file through
+    if (response.mimetype not in COMPRESSIBLE_MIMETYPES or response.status_code != 200
+            or (response.is_streamed and not static) or 'Content-Encoding' in response.headers
+            or response.cache_control.no_transform):
+        return response
+    response.vary.add('Accept-Encoding')
+    
+    encoding = _accepted_encoding()
+    length = response.content_length
+    if encoding is None or (length is not None and length < COMPRESS_MIN_BYTES):
+        return response
+    
+    if static:
+        body = _compressed_static_body(response, encoding)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_BYTES:
+            return response
+        body = _compress(data, encoding)
+    
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the original, so a strong validator would be wrong
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+def init_http_cache(app):
+    """Fingerprint static URLs, cache fingerprinted assets and compress responses"""
+    
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = static_fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+    
+    @app.after_request
+    def cache_and_compress(response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            fingerprint = static_fingerprint(request.view_args.get('filename', ''))
+            if fingerprint and request.args.get('v') == fingerprint:
+                response.cache_control.public = True
+                response.cache_control.max_age = STATIC_MAX_AGE_SECONDS
+                response.cache_control.immutable = True
+                response.cache_control.no_cache = None
+        return compress_response(response)
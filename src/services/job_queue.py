@@ -0,0 +1,347 @@
+"""Database-backed job queue that runs Grok completions outside the request cycle"""
+from src.models.user import db, Chat, ChatJob, MaintenanceRun
+from src.services.task_extraction import TaskStreamParser
+from src.services.metrics import timed_stage
+from src.services.rate_limit import release_chat_slot
+from src.services.retention import archive_old_chats, CHAT_ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS, ARCHIVE_MAX_BATCHES_PER_RUN
+from src.services.deadlines import sweep_overdue_tasks, DEADLINE_SWEEP_INTERVAL, DEADLINE_SWEEP_MAX_BATCHES
+from src.services.events import prune_events, EVENTS_PRUNE_INTERVAL_SECONDS
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import threading
+import logging
+import traceback
+import socket
+import uuid
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# How long an idle worker sleeps before checking the queue again
+POLL_INTERVAL_SECONDS = float(os.environ.get('CHAT_WORKER_POLL_INTERVAL', '0.5'))
+
+# A running job whose worker has not sent a heartbeat within this window is
+# considered abandoned (crashed process) and is handed to another worker
+JOB_LEASE_SECONDS = int(os.environ.get('CHAT_JOB_LEASE_SECONDS', '120'))
+
+# How often workers look for abandoned jobs
+RECLAIM_INTERVAL_SECONDS = 30
+
+# Number of attempts before a job is given up and the user gets an apology
+MAX_JOB_ATTEMPTS = 3
+
+# How often partial streamed text and the lease heartbeat are written to the job row
+PARTIAL_FLUSH_SECONDS = 0.5
+
+# Wakes local workers as soon as this process enqueues a job
+_wakeup = threading.Event()
+
+def enqueue_chat_job(chat):
+    """Queue a chat row for background processing and commit it together with the job"""
+    job = ChatJob(chat=chat, user_id=chat.user_id, status='pending')
+    db.session.add(job)
+    db.session.commit()
+    _wakeup.set()
+    return job
+
+def claim_next_job():
+    """Atomically move the oldest pending job to running and return it"""
+    candidate_ids = [row.id for row in ChatJob.query.with_entities(ChatJob.id)
+                     .filter_by(status='pending').order_by(ChatJob.id.asc()).limit(5)]
+    
+    for job_id in candidate_ids:
+        # The status check in the WHERE clause makes the claim safe across
+        # threads and processes without a broker or SELECT ... FOR UPDATE
+        now = datetime.utcnow()
+        claimed = ChatJob.query.filter_by(id=job_id, status='pending').update({
+            'status': 'running',
+            'started_at': now,
+            'heartbeat_at': now,
+            'claim_token': uuid.uuid4().hex,
+            'attempts': ChatJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        
+        if claimed:
+            return db.session.get(ChatJob, job_id)
+    
+    return None
+
+def reclaim_abandoned_jobs():
+    """Return running jobs whose lease expired to the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LEASE_SECONDS)
+    # Jobs claimed before heartbeats existed only have started_at
+    reclaimed = ChatJob.query.filter(
+        ChatJob.status == 'running',
+        func.coalesce(ChatJob.heartbeat_at, ChatJob.started_at) < cutoff
+    ).update({
+        'status': 'pending',
+        'partial_response': None,
+        'claim_token': None
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    if reclaimed:
+        logger.warning(f"Reclaimed {reclaimed} abandoned chat jobs")
+    return reclaimed
+
+def recover_stuck_chats():
+    """Queue chats still showing the processing placeholder that have no job, e.g. after a crash"""
+    from src.routes.chat import PROCESSING_PLACEHOLDER
+    
+    stuck_chats = Chat.query.outerjoin(ChatJob, ChatJob.chat_id == Chat.id).filter(
+        Chat.response == PROCESSING_PLACEHOLDER,
+        ChatJob.id.is_(None)
+    ).all()
+    
+    recovered = 0
+    for chat in stuck_chats:
+        try:
+            db.session.add(ChatJob(chat_id=chat.id, user_id=chat.user_id, status='pending'))
+            db.session.commit()
+            recovered += 1
+        except IntegrityError:
+            # Another worker queued it first
+            db.session.rollback()
+    
+    if recovered:
+        logger.warning(f"Queued {recovered} chats left at the processing placeholder")
+    return recovered
+
+def update_claimed_job(job_id, claim_token, values):
+    """Update a running job only while the caller still holds its claim; returns False if it was reclaimed"""
+    return ChatJob.query.filter_by(id=job_id, status='running', claim_token=claim_token).update(
+        values, synchronize_session=False) == 1
+
+def process_job(job):
+    """Run the Grok completion for a claimed job and store the response"""
+    from src.routes.chat import build_grok_request, save_extracted_tasks, iter_grok_deltas, after_response_saved
+    from src.services.grok_client import get_grok_client, CircuitOpenError, GrokNotConfigured
+    import requests
+    
+    chat = job.chat
+    job_id = job.id
+    claim_token = job.claim_token
+    tasks_added = 0
+    logger.info(f"Processing chat job {job_id} for chat {chat.id} (attempt {job.attempts})")
+    
+    def heartbeat(values):
+        # A False return means the lease expired and another worker owns the job now
+        if update_claimed_job(job_id, claim_token, dict(values, heartbeat_at=datetime.utcnow())):
+            db.session.commit()
+            return True
+        db.session.rollback()
+        logger.warning(f"Lost the claim on chat job {job_id}, abandoning this attempt")
+        return False
+    
+    try:
+        payload = build_grok_request(chat.user_id, stream=True)
+        
+        with timed_stage('llm'), get_grok_client().chat_completion(payload, stream=True) as response:
+            logger.info(f"Grok API response status for job {job_id}: {response.status_code}")
+            
+            # Waiting for the response headers may take several retries
+            if not heartbeat({}):
+                return
+            
+            if response.status_code != 200:
+                logger.error(f"Error from Grok API: Status {response.status_code} - Response text: {response.text}")
+                assistant_response = f"I apologize, but I'm having trouble connecting to my knowledge base. Please try again later. (Error: {response.status_code})"
+            else:
+                visible = []
+                parser = TaskStreamParser()
+                last_flush = time.monotonic()
+                
+                for delta in iter_grok_deltas(response):
+                    visible.append(parser.feed(delta))
+                    
+                    # Publish partial text so polling clients can render progress, and renew the lease
+                    if time.monotonic() - last_flush >= PARTIAL_FLUSH_SECONDS:
+                        if not heartbeat({'partial_response': ''.join(visible)}):
+                            return
+                        last_flush = time.monotonic()
+                
+                assistant_response, tasks = parser.finish()
+                tasks_added = save_extracted_tasks(chat.user_id, tasks)
+    
+    except Exception as e:
+        logger.error(f"Error processing chat job {job_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        db.session.rollback()
+        
+        # Retry later, unless the circuit breaker says the API is down or no key is configured
+        if job.attempts < MAX_JOB_ATTEMPTS and not isinstance(e, (CircuitOpenError, GrokNotConfigured)):
+            if update_claimed_job(job_id, claim_token, {
+                'status': 'pending',
+                'partial_response': None,
+                'claim_token': None,
+                'error': str(e)
+            }):
+                db.session.commit()
+            return
+        
+        if isinstance(e, requests.exceptions.RequestException):
+            assistant_response = "I apologize, but I'm having trouble connecting to my knowledge base. Please try again later."
+        else:
+            assistant_response = "I apologize, but I encountered an unexpected error. Please try again later."
+        if not update_claimed_job(job_id, claim_token, {
+            'status': 'failed',
+            'error': str(e),
+            'partial_response': None,
+            'finished_at': datetime.utcnow()
+        }):
+            db.session.rollback()
+            return
+        chat.response = assistant_response
+        release_chat_slot(chat.user_id)
+        db.session.commit()
+        return
+    
+    # Save assistant response to database, unless the job was reclaimed meanwhile:
+    # the extracted tasks roll back with it, so a rerun never duplicates them
+    if not update_claimed_job(job_id, claim_token, {
+        'status': 'done',
+        'tasks_added': tasks_added,
+        'partial_response': None,
+        'finished_at': datetime.utcnow()
+    }):
+        db.session.rollback()
+        logger.warning(f"Chat job {job_id} was reclaimed before it finished; discarding this response")
+        return
+    chat.response = assistant_response
+    release_chat_slot(chat.user_id)
+    db.session.commit()
+    after_response_saved(chat.user_id, tasks_added)
+    logger.info(f"Finished chat job {job_id}")
+
+def claim_periodic_run(name, interval):
+    """Claim the next run of a periodic task for this process; False if another process ran it within `interval` seconds.
+    
+    Every process with workers schedules the same tasks, so the shared
+    maintenance_runs row makes each run happen once across all of them.
+    """
+    now = datetime.utcnow()
+    values = {'last_run_at': now, 'holder': f"{socket.gethostname()}:{os.getpid()}"}
+    claimed = MaintenanceRun.query.filter(
+        MaintenanceRun.name == name,
+        MaintenanceRun.last_run_at <= now - timedelta(seconds=interval)
+    ).update(values, synchronize_session=False)
+    if not claimed and db.session.get(MaintenanceRun, name) is None:
+        db.session.add(MaintenanceRun(name=name, **values))
+        claimed = 1
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process created the row first and runs this one
+        db.session.rollback()
+        return False
+    return claimed == 1
+
+class ChatWorkerPool:
+    """Pool of worker threads that process queued chat jobs.
+    
+    With take_jobs=False the threads only run the periodic maintenance, for
+    processes where the chat queue is disabled.
+    """
+    
+    def __init__(self, app, threads, take_jobs=True):
+        self.app = app
+        self.threads = threads
+        self.take_jobs = take_jobs
+        self._stop = threading.Event()
+        self._workers = []
+        
+        # Periodic maintenance as (name, interval seconds, function), run between
+        # jobs by whichever worker thread is free
+        self._periodic = [('event prune', EVENTS_PRUNE_INTERVAL_SECONDS, prune_events)]
+        if take_jobs:
+            self._periodic.append(('reclaim', RECLAIM_INTERVAL_SECONDS, reclaim_abandoned_jobs))
+        if DEADLINE_SWEEP_INTERVAL > 0:
+            self._periodic.append(('deadline sweep', DEADLINE_SWEEP_INTERVAL,
+                                   lambda: sweep_overdue_tasks(max_batches=DEADLINE_SWEEP_MAX_BATCHES)))
+        if CHAT_ARCHIVE_AFTER_DAYS > 0:
+            self._periodic.append(('chat archive', ARCHIVE_INTERVAL_SECONDS,
+                                   lambda: archive_old_chats(max_batches=ARCHIVE_MAX_BATCHES_PER_RUN)))
+        self._last_run = {}
+        self._periodic_lock = threading.Lock()
+    
+    def start(self):
+        """Start the worker threads; the first one recovers unfinished work before taking jobs"""
+        for index in range(self.threads):
+            worker = threading.Thread(target=self._run, args=(index == 0 and self.take_jobs,),
+                                      name=f"chat-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"Started {self.threads} chat worker threads")
+    
+    def stop(self, timeout=None):
+        """Ask the workers to exit after their current job"""
+        self._stop.set()
+        _wakeup.set()
+        for worker in self._workers:
+            worker.join(timeout)
+    
+    def _due_task(self):
+        """Claim the next periodic task that is due, so only one thread of this process checks it"""
+        with self._periodic_lock:
+            now = time.monotonic()
+            for name, interval, function in self._periodic:
+                if now - self._last_run.get(name, 0) >= interval:
+                    self._last_run[name] = now
+                    return name, function, interval
+        return None, None, None
+    
+    def _run_periodic(self):
+        name, function, interval = self._due_task()
+        if function is not None and claim_periodic_run(name, interval):
+            # Each task works in bounded batches, so a worker is back on chat jobs quickly
+            logger.debug(f"Running periodic task: {name}")
+            function()
+    
+    def _recover(self):
+        """Requeue work left unfinished by a crashed process"""
+        with self.app.app_context():
+            try:
+                reclaim_abandoned_jobs()
+                recover_stuck_chats()
+            except Exception as e:
+                logger.error(f"Error recovering chat jobs: {str(e)}")
+                db.session.rollback()
+    
+    def _run(self, recover=False):
+        # Recovery runs here rather than in start(), so starting a process needs no database round trip
+        if recover:
+            self._recover()
+        
+        while not self._stop.is_set():
+            job_found = False
+            
+            with self.app.app_context():
+                try:
+                    self._run_periodic()
+                    
+                    job = claim_next_job() if self.take_jobs else None
+                    if job:
+                        job_found = True
+                        process_job(job)
+                except Exception as e:
+                    logger.error(f"Chat worker error: {str(e)}")
+                    logger.error(traceback.format_exc())
+                    db.session.rollback()
+                    # Back off while the database is unavailable
+                    self._stop.wait(5)
+            
+            if not job_found:
+                _wakeup.wait(POLL_INTERVAL_SECONDS)
+                _wakeup.clear()
+
+def start_chat_workers(app, threads, take_jobs=True):
+    """Start a worker pool for the app unless one is already running"""
+    pool = app.extensions.get('chat_worker_pool')
+    if pool is None and threads > 0:
+        pool = ChatWorkerPool(app, threads, take_jobs=take_jobs)
+        pool.start()
+        app.extensions['chat_worker_pool'] = pool
+    return pool
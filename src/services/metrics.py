@@ -0,0 +1,122 @@
+"""Prometheus metrics for requests, SQL, the Grok API and the chat send path
+
+When PROMETHEUS_MULTIPROC_DIR is set (see gunicorn.conf.py), every worker
+writes its samples to that directory and /metrics aggregates all of them.
+"""
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response, abort
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+from src.services.query_budget import record_statement
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+import hmac
+import time
+import os
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', 'HTTP request duration',
+                             ['method', 'endpoint', 'status'], buckets=LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements issued per request',
+                            ['endpoint'], buckets=QUERY_COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Time spent in SQL per request',
+                            ['endpoint'], buckets=LATENCY_BUCKETS)
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'Duration of individual SQL statements',
+                              buckets=LATENCY_BUCKETS)
+LLM_DURATION = Histogram('llm_request_duration_seconds', 'Grok API call duration to response headers',
+                         ['status'], buckets=LLM_BUCKETS)
+LLM_ERRORS = Counter('llm_errors_total', 'Failed Grok API calls', ['reason'])
+LLM_RETRIES = Counter('llm_retries_total', 'Retried Grok API calls')
+LLM_TOKENS = Counter('llm_tokens_total', 'Tokens reported by the Grok API', ['kind'])
+CHAT_RATE_LIMITED = Counter('chat_rate_limited_total', 'Chat messages rejected by the per-user limits',
+                            ['reason', 'role'])
+STAGE_DURATION = Histogram('chat_stage_duration_seconds', 'Duration of chat send path stages',
+                           ['stage'], buckets=LATENCY_BUCKETS)
+
+@contextmanager
+def timed_stage(stage):
+    """Time a block of the chat send path (context, llm, task_extraction, ...)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+def record_token_usage(usage):
+    """Count the token usage block of a completion response, if present"""
+    if not isinstance(usage, dict):
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = usage.get(kind)
+        if isinstance(value, (int, float)) and value > 0:
+            LLM_TOKENS.labels(kind.replace('_tokens', '')).inc(value)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    DB_QUERY_DURATION.observe(elapsed)
+    
+    if has_request_context() and 'request_started' in g:
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_time = g.get('db_time', 0.0) + elapsed
+    
+    # The only statement listener: query budgets and count_queries() are fed from here
+    record_statement(statement)
+
+def _endpoint_label():
+    # Use the URL rule, not the raw path, to keep label cardinality bounded
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def init_metrics(app):
+    """Install request instrumentation and the /metrics endpoint"""
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+    
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' in g:
+            endpoint = _endpoint_label()
+            REQUEST_DURATION.labels(request.method, endpoint, str(response.status_code)).observe(
+                time.perf_counter() - g.request_started)
+            REQUEST_QUERIES.labels(endpoint).observe(g.db_queries)
+            REQUEST_DB_TIME.labels(endpoint).observe(g.db_time)
+        return response
+    
+    # Template rendering time, from the signal pair around each render
+    def start_render(sender, template, context, **extra):
+        g.render_started = time.perf_counter()
+    
+    def finish_render(sender, template, context, **extra):
+        if 'render_started' in g:
+            STAGE_DURATION.labels('template_render').observe(time.perf_counter() - g.pop('render_started'))
+    
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(finish_render, app, weak=False)
+    
+    @app.route('/metrics')
+    def metrics():
+        # Optional bearer token so the endpoint can be exposed publicly
+        token = os.environ.get('METRICS_TOKEN')
+        if token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(supplied, token):
+                abort(403)
+        
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            from prometheus_client import multiprocess
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,58 @@
+"""Keyset pagination helpers shared by the chat and admin views"""
+from src.models.user import Chat
+from sqlalchemy import or_, and_
+from datetime import datetime
+import base64
+import json
+
+# Number of chat messages rendered on first load and returned per history page
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_PAGE_SIZE = 200
+
+def encode_cursor(value, row_id):
+    """Encode a keyset position as an opaque URL-safe token"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token, is_datetime=False):
+    """Decode a keyset position; returns None for a missing or malformed token"""
+    if not token:
+        return None
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if value is not None and is_datetime:
+            value = datetime.fromisoformat(value)
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def chat_history_page(user_id, before=None, limit=CHAT_PAGE_SIZE):
+    """Return up to `limit` chats older than the `before` cursor, oldest first, and the cursor for the next older page"""
+    query = Chat.query.filter(Chat.user_id == user_id)
+    
+    if before is not None:
+        timestamp, chat_id = before
+        query = query.filter(or_(Chat.timestamp < timestamp, and_(Chat.timestamp == timestamp, Chat.id < chat_id)))
+    
+    chats = query.order_by(Chat.timestamp.desc(), Chat.id.desc()).limit(limit + 1).all()
+    
+    older_cursor = None
+    if len(chats) > limit:
+        chats = chats[:limit]
+        oldest = chats[-1]
+        older_cursor = encode_cursor(oldest.timestamp, oldest.id)
+    
+    chats.reverse()  # Oldest first, as the templates render them
+    return chats, older_cursor
+
+def chat_to_dict(chat):
+    """JSON representation of a chat row for the history endpoints"""
+    return {
+        'id': chat.id,
+        'message': chat.message,
+        'response': chat.response,
+        'is_system_message': chat.is_system_message,
+        'timestamp': chat.timestamp.isoformat() if chat.timestamp else None
+    }
@@ -0,0 +1,66 @@
+"""Password hashing on a bounded thread pool, with upgradeable hash parameters
+
+hashlib releases the GIL while hashing, so running PBKDF2/scrypt on a small
+pool keeps request threads responsive and caps the CPU a login storm can use.
+When the pool's queue is full, PasswordHasherBusy is raised instead of queueing.
+
+Stored hashes carry their own method and cost (Werkzeug format), so changing
+PASSWORD_HASH_METHOD never locks anyone out: old hashes keep verifying and are
+rehashed with the current method on the next successful login.
+"""
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import os
+
+# Werkzeug method string, e.g. "scrypt", "scrypt:65536:8:1" or "pbkdf2:sha256:1000000"
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+
+# Concurrent hashes per process, and how many may wait before callers are turned away
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '16'))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+_current_method = None
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when too many password hashes are already queued"""
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Password hashing queue is full")
+    try:
+        future = _executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+def _hash(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+def _method_of(password_hash):
+    return password_hash.split('$', 1)[0]
+
+def _needs_rehash(password_hash):
+    # Werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"), so compare
+    # against the prefix of a hash generated with the configured method
+    global _current_method
+    if _current_method is None:
+        _current_method = _method_of(_hash(''))
+    return _method_of(password_hash) != _current_method
+
+def _verify(password_hash, password):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    return True, _hash(password) if _needs_rehash(password_hash) else None
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return _run(_hash, password)
+
+def verify_password(password_hash, password):
+    """Check a password; returns (valid, new_hash) where new_hash is set when the stored hash is outdated"""
+    return _run(_verify, password_hash, password)
@@ -0,0 +1,78 @@
+"""Cached authorization data for signed-in users
+
+Login stamps the session (a signed cookie) with the user's role and
+auth_version. Sessions signed before the stamp existed carry neither; they
+are stamped from the user's row on their first admin request. Requests
+compare that stamp with a short-lived in-process copy of the user's row, so
+authorization normally needs no query. Changing a user's role bumps
+auth_version, which invalidates every existing session of that user.
+
+The process that changes a role or deletes a user drops its own copy at once.
+Other processes keep theirs for up to PRINCIPAL_CACHE_TTL seconds (30 by
+default), so a demoted or deleted user can keep their old access there for
+that long.
+"""
+from src.models.user import db, User
+from src.services.context_cache import UserTTLCache
+from sqlalchemy import event
+from collections import namedtuple
+import os
+
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.environ.get('PRINCIPAL_CACHE_TTL', '30'))
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+Principal = namedtuple('Principal', ['is_admin', 'auth_version'])
+
+# Cached value for users that no longer exist
+_MISSING = Principal(False, None)
+
+principal_cache = UserTTLCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES)
+
+def stamp_session(session, user):
+    """Record the identity and role stamp of a user who just logged in"""
+    session['user_id'] = user.id
+    session['email'] = user.email
+    session['is_admin'] = bool(user.is_admin)
+    session['auth_version'] = user.auth_version
+
+def load_principal(user_id):
+    """Return the user's role and auth_version, or None if the user no longer exists"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.is_admin, User.auth_version).filter(User.id == user_id).first()
+        principal = Principal(bool(row.is_admin), row.auth_version) if row else _MISSING
+        principal_cache.set(user_id, principal)
+    return None if principal is _MISSING else principal
+
+def restamp_legacy_session(session):
+    """Stamp a session from before role stamps with the user's current role and version.
+    
+    Returns False if the user no longer exists, so the caller can force a new login.
+    """
+    if 'is_admin' in session and 'auth_version' in session:
+        return True
+    principal = load_principal(session['user_id'])
+    if principal is None:
+        return False
+    session['is_admin'] = principal.is_admin
+    session['auth_version'] = principal.auth_version
+    return True
+
+def session_is_current(session):
+    """Check that the session's stamp still matches the user's role and version"""
+    principal = load_principal(session['user_id'])
+    if principal is None or principal.auth_version != session.get('auth_version'):
+        return False
+    return principal.is_admin == session.get('is_admin')
+
+def invalidate_principal(user_id):
+    """Drop the cached principal after a user is deleted or their role changes"""
+    principal_cache.invalidate(user_id)
+
+@event.listens_for(User.is_admin, 'set', active_history=True)
+def _revoke_sessions_on_role_change(target, value, oldvalue, initiator):
+    # New users and no-op assignments keep their version
+    if target.id is None or not isinstance(oldvalue, bool) or bool(value) == oldvalue:
+        return
+    target.auth_version = (target.auth_version or 0) + 1
+    invalidate_principal(target.id)
@@ -0,0 +1,162 @@
+"""Per-request SQL query budgets and N+1 detection
+
+Every request records the statements it runs. When a request goes over the
+query budget of its endpoint, or runs the same statement (differing only in
+parameters) too many times, the request is logged, or rejected with
+QueryBudgetExceeded in strict mode. Statements arrive through the one SQL
+listener in src/services/metrics.py, which also counts them for the
+request metrics.
+
+Budgets are declared next to the routes: blueprint_query_budget() sets a
+ceiling for a whole blueprint and @query_budget overrides it for one view.
+count_queries() and assert_max_queries() give tests the same counting, and
+the within_budget fixture in tests/conftest.py checks a request against the
+budget declared for its endpoint.
+"""
+from flask import request, current_app, g
+from collections import Counter
+from contextlib import contextmanager
+import threading
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Ceiling for endpoints without a declared budget
+DEFAULT_QUERY_BUDGET = 20
+
+# The same statement run this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '5'))
+
+QUERY_BUDGET_MODES = ('off', 'log', 'strict')
+
+# Blueprint name -> query ceiling
+_blueprint_budgets = {}
+
+# Query logs that are currently recording on this thread
+_active = threading.local()
+
+class QueryBudgetExceeded(RuntimeError):
+    """Raised in strict mode when a request breaks its query budget"""
+
+class QueryLog:
+    """Statements executed while the log was active"""
+    
+    def __init__(self):
+        self.statements = []
+    
+    @property
+    def count(self):
+        return len(self.statements)
+    
+    def repeated(self, threshold=None):
+        """Statements run at least `threshold` times, most frequent first"""
+        threshold = N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        counts = Counter(self.statements)
+        return [(statement, n) for statement, n in counts.most_common() if n >= threshold]
+    
+    def describe(self, limit=5):
+        lines = [f"{self.count} queries"]
+        for statement, n in Counter(self.statements).most_common(limit):
+            lines.append(f"  {n}x {' '.join(statement.split())[:200]}")
+        return '\n'.join(lines)
+
+def _logs():
+    if not hasattr(_active, 'logs'):
+        _active.logs = []
+    return _active.logs
+
+def record_statement(statement):
+    """Add a statement to the query logs recording on this thread"""
+    # Parameters are bound separately, so N+1 queries share the same statement text
+    for log in _logs():
+        log.statements.append(statement)
+
+@contextmanager
+def count_queries():
+    """Record the statements executed inside the block; usable as a test fixture"""
+    log = QueryLog()
+    _logs().append(log)
+    try:
+        yield log
+    finally:
+        _logs().remove(log)
+
+@contextmanager
+def assert_max_queries(limit, allow_repeated=False):
+    """Fail with AssertionError if the block runs more than `limit` queries or an N+1 pattern"""
+    with count_queries() as log:
+        yield log
+    if log.count > limit:
+        raise AssertionError(f"Expected at most {limit} queries, got {log.describe()}")
+    if not allow_repeated and log.repeated():
+        raise AssertionError(f"Repeated statements (possible N+1): {log.describe()}")
+
+def query_budget(limit, allow_repeated=False):
+    """Set the query ceiling of a single view; allow_repeated is for views that poll"""
+    def decorator(f):
+        f.query_budget = limit
+        f.query_budget_allow_repeated = allow_repeated
+        return f
+    return decorator
+
+def blueprint_query_budget(blueprint, limit):
+    """Set the query ceiling for every view of a blueprint"""
+    _blueprint_budgets[blueprint.name] = limit
+
+def budget_for_endpoint(endpoint):
+    """Return the query ceiling of an endpoint and whether it may repeat statements"""
+    view = current_app.view_functions.get(endpoint)
+    if view is not None and hasattr(view, 'query_budget'):
+        return view.query_budget, getattr(view, 'query_budget_allow_repeated', False)
+    blueprint = endpoint.rpartition('.')[0] if endpoint else None
+    return _blueprint_budgets.get(blueprint, DEFAULT_QUERY_BUDGET), False
+
+def budget_for_request():
+    """Return the query ceiling of the current view and whether it may repeat statements"""
+    return budget_for_endpoint(request.endpoint)
+
+def check_query_log(log, budget, mode, allow_repeated=False):
+    """Report a request log that breaks its budget or repeats a statement"""
+    problems = []
+    if log.count > budget:
+        problems.append(f"ran {log.count} queries (budget {budget})")
+    repeated = [] if allow_repeated else log.repeated()
+    if repeated:
+        problems.append(f"repeated a statement {repeated[0][1]} times (possible N+1)")
+    if not problems:
+        return
+    
+    message = f"{request.method} {request.path} {' and '.join(problems)}\n{log.describe()}"
+    if mode == 'strict':
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+def init_query_budget(app):
+    """Count queries per request and enforce endpoint budgets"""
+    mode = app.config.get('QUERY_BUDGET_MODE', 'log')
+    if mode not in QUERY_BUDGET_MODES:
+        raise ValueError(f"QUERY_BUDGET_MODE must be one of {', '.join(QUERY_BUDGET_MODES)}")
+    if mode == 'off':
+        return
+    
+    @app.before_request
+    def start_query_log():
+        g.query_log = QueryLog()
+        _logs().append(g.query_log)
+    
+    @app.after_request
+    def check_query_budget(response):
+        log = g.pop('query_log', None)
+        if log is not None:
+            _logs().remove(log)
+            budget, allow_repeated = budget_for_request()
+            check_query_log(log, budget, mode, allow_repeated)
+        return response
+    
+    @app.teardown_request
+    def stop_query_log(exc):
+        # after_request is skipped when the view raised
+        log = g.pop('query_log', None)
+        if log is not None:
+            _logs().remove(log)
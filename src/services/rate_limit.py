@@ -0,0 +1,95 @@
+"""Per-user token bucket and single in-flight completion limit for /chat/send
+
+State lives in the chat_rate_limits table so every gunicorn worker, the
+standalone chat worker and every web instance see the same limits. Updates
+are compare-and-set UPDATEs, like the job queue's claims, so no row locks
+or external store are needed.
+"""
+from src.models.user import db, ChatRateLimit
+from src.services.metrics import CHAT_RATE_LIMITED
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+# Bucket size (burst) and refill rate per minute, separately for admins
+CHAT_RATE_BURST = float(os.environ.get('CHAT_RATE_BURST', '5'))
+CHAT_RATE_PER_MINUTE = float(os.environ.get('CHAT_RATE_PER_MINUTE', '6'))
+ADMIN_CHAT_RATE_BURST = float(os.environ.get('ADMIN_CHAT_RATE_BURST', '20'))
+ADMIN_CHAT_RATE_PER_MINUTE = float(os.environ.get('ADMIN_CHAT_RATE_PER_MINUTE', '60'))
+
+# An in-flight completion that is never released (crashed worker) stops
+# blocking the user after this long
+CHAT_INFLIGHT_LEASE_SECONDS = int(os.environ.get('CHAT_INFLIGHT_LEASE_SECONDS', '180'))
+
+# Retry-After suggested while the previous message is still being answered
+INFLIGHT_RETRY_AFTER_SECONDS = 3
+
+class RateLimited(Exception):
+    """Raised when a user may not send another chat message yet"""
+    
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Chat rate limited ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+def _limits(is_admin):
+    if is_admin:
+        return ADMIN_CHAT_RATE_BURST, ADMIN_CHAT_RATE_PER_MINUTE / 60
+    return CHAT_RATE_BURST, CHAT_RATE_PER_MINUTE / 60
+
+def _load_bucket(user_id, burst, now):
+    bucket = db.session.get(ChatRateLimit, user_id, populate_existing=True)
+    if bucket is not None:
+        return bucket
+    # Created in the caller's transaction rather than committed here; if another
+    # request created it first, theirs is kept
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    db.session.execute(insert(ChatRateLimit.__table__).values(user_id=user_id, tokens=burst, refilled_at=now)
+                       .on_conflict_do_nothing(index_elements=['user_id']))
+    return db.session.get(ChatRateLimit, user_id, populate_existing=True)
+
+def acquire_chat_slot(user_id, is_admin=False):
+    """Take a token and the user's in-flight lease, or raise RateLimited.
+    
+    The claim is not committed here; it is committed with the caller's chat
+    row, and rolled back with it if saving the message fails.
+    """
+    burst, rate = _limits(is_admin)
+    now = datetime.utcnow()
+    bucket = _load_bucket(user_id, burst, now)
+    
+    try:
+        if bucket.inflight_until is not None and bucket.inflight_until > now:
+            remaining = (bucket.inflight_until - now).total_seconds()
+            raise RateLimited('inflight', max(1, min(INFLIGHT_RETRY_AFTER_SECONDS, math.ceil(remaining))))
+        
+        elapsed = max(0.0, (now - bucket.refilled_at).total_seconds())
+        tokens = min(burst, bucket.tokens + elapsed * rate)
+        if tokens < 1:
+            raise RateLimited('rate', max(1, math.ceil((1 - tokens) / rate)))
+        
+        # refilled_at changes on every claim, so a concurrent claim makes this match nothing
+        claimed = ChatRateLimit.query.filter(
+            ChatRateLimit.user_id == user_id,
+            ChatRateLimit.refilled_at == bucket.refilled_at,
+            or_(ChatRateLimit.inflight_until.is_(None), ChatRateLimit.inflight_until <= now)
+        ).update({
+            'tokens': tokens - 1,
+            'refilled_at': now,
+            'inflight_until': now + timedelta(seconds=CHAT_INFLIGHT_LEASE_SECONDS)
+        }, synchronize_session=False)
+        if not claimed:
+            raise RateLimited('inflight', 1)
+    except RateLimited as e:
+        CHAT_RATE_LIMITED.labels(e.reason, 'admin' if is_admin else 'user').inc()
+        logger.info(f"Rate limited chat from user {user_id}: {e.reason}, retry after {e.retry_after}s")
+        raise
+
+def release_chat_slot(user_id):
+    """Clear the user's in-flight lease; committed with the caller's response"""
+    ChatRateLimit.query.filter_by(user_id=user_id).update({'inflight_until': None}, synchronize_session=False)
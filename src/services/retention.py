@@ -0,0 +1,185 @@
+"""Chat retention: archive old chats into compressed cold segments and delete users in batches
+
+Chats older than CHAT_ARCHIVE_AFTER_DAYS are moved out of the hot chats table
+into chat_archive_segments rows, each holding up to ARCHIVE_SEGMENT_MAX_CHATS
+of one user's chats as zlib-compressed JSON lines. Archived chats still count
+in the dashboard totals and can be read back from the admin user view.
+"""
+from src.models.user import (db, User, Chat, Task, ChatJob, ConversationSummary, ChatRateLimit,
+                             ChatArchiveSegment, UserEvent)
+from src.services.pagination import chat_to_dict
+from src.services.stats import bump_counter
+from sqlalchemy import delete, func, or_
+from datetime import datetime, timedelta
+import logging
+import json
+import zlib
+import os
+
+logger = logging.getLogger(__name__)
+
+# Chats older than this many days are archived; 0 disables archiving
+CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', '0'))
+
+# How often chat workers run the archiver when it is enabled
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get('CHAT_ARCHIVE_INTERVAL', '3600'))
+
+# Chats moved per transaction, and batches per scheduled run
+ARCHIVE_BATCH_SIZE = 2000
+ARCHIVE_MAX_BATCHES_PER_RUN = 25
+
+ARCHIVE_SEGMENT_MAX_CHATS = 500
+
+# Rows deleted per transaction when removing a user
+DELETE_BATCH_SIZE = 1000
+
+def _encode_segment(chats):
+    lines = '\n'.join(json.dumps(chat_to_dict(chat)) for chat in chats)
+    return zlib.compress(lines.encode('utf-8'), 6)
+
+def decode_segment(segment):
+    """Chat dicts stored in a segment, oldest first"""
+    text = zlib.decompress(segment.data).decode('utf-8')
+    return [json.loads(line) for line in text.split('\n') if line]
+
+def _segments_for(chats):
+    """Group a batch of chats (ordered by id) into per-user segments"""
+    by_user = {}
+    for chat in chats:
+        by_user.setdefault(chat.user_id, []).append(chat)
+    
+    now = datetime.utcnow()
+    for user_id, user_chats in by_user.items():
+        for start in range(0, len(user_chats), ARCHIVE_SEGMENT_MAX_CHATS):
+            part = user_chats[start:start + ARCHIVE_SEGMENT_MAX_CHATS]
+            yield {
+                'user_id': user_id,
+                'first_chat_id': part[0].id,
+                'last_chat_id': part[-1].id,
+                'first_timestamp': part[0].timestamp,
+                'last_timestamp': part[-1].timestamp,
+                'message_count': len(part),
+                'data': _encode_segment(part),
+                'created_at': now
+            }
+
+def archive_old_chats(max_age_days=None, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Move chats older than max_age_days into archive segments and return how many were moved"""
+    from src.routes.chat import PROCESSING_PLACEHOLDER
+    
+    max_age_days = CHAT_ARCHIVE_AFTER_DAYS if max_age_days is None else max_age_days
+    if max_age_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=max_age_days)
+    
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # Oldest first along ix_chats_timestamp, so each batch reads only rows past the cutoff;
+        # never archive a chat that is still waiting for its reply
+        chats = Chat.query.outerjoin(ChatJob, ChatJob.chat_id == Chat.id).filter(
+            Chat.timestamp < cutoff,
+            Chat.response != PROCESSING_PLACEHOLDER,
+            or_(ChatJob.id.is_(None), ChatJob.status.in_(('done', 'failed')))
+        ).order_by(Chat.timestamp.asc()).limit(batch_size).all()
+        if not chats:
+            break
+        chats.sort(key=lambda chat: chat.id)
+        
+        chat_ids = [chat.id for chat in chats]
+        segments = list(_segments_for(chats))
+        
+        # Core statements on the connection: archived chats stay in the dashboard totals
+        connection = db.session.connection()
+        connection.execute(delete(ChatJob.__table__).where(ChatJob.__table__.c.chat_id.in_(chat_ids)))
+        deleted = connection.execute(delete(Chat.__table__).where(Chat.__table__.c.id.in_(chat_ids))).rowcount
+        if deleted != len(chat_ids):
+            # Another archiver took some of these rows; let it finish them
+            db.session.rollback()
+            logger.warning("Chat archive batch raced with another archiver; stopping this run")
+            break
+        connection.execute(ChatArchiveSegment.__table__.insert(), segments)
+        db.session.commit()
+        db.session.expunge_all()
+        
+        archived += len(chat_ids)
+        batches += 1
+        logger.info(f"Archived {len(chat_ids)} chats into {len(segments)} segments")
+    
+    return archived
+
+def archived_message_count(user_id):
+    return db.session.query(func.coalesce(func.sum(ChatArchiveSegment.message_count), 0)).filter(
+        ChatArchiveSegment.user_id == user_id).scalar()
+
+def archive_page(user_id, before=None):
+    """Return the chats of the newest archive segment older than `before` (oldest first) and the next cursor"""
+    query = ChatArchiveSegment.query.filter(ChatArchiveSegment.user_id == user_id)
+    if before is not None:
+        query = query.filter(ChatArchiveSegment.id < before)
+    segment = query.order_by(ChatArchiveSegment.id.desc()).first()
+    if segment is None:
+        return [], None
+    
+    has_older = db.session.query(ChatArchiveSegment.id).filter(
+        ChatArchiveSegment.user_id == user_id, ChatArchiveSegment.id < segment.id).first() is not None
+    return decode_segment(segment), segment.id if has_older else None
+
+def delete_user_data(user_id):
+    """Delete a user's chats, tasks and archive in small transactions so no statement holds long locks"""
+    while True:
+        chat_ids = [row.id for row in db.session.query(Chat.id).filter(Chat.user_id == user_id).limit(DELETE_BATCH_SIZE)]
+        if not chat_ids:
+            break
+        ChatJob.query.filter(ChatJob.chat_id.in_(chat_ids)).delete(synchronize_session=False)
+        Chat.query.filter(Chat.id.in_(chat_ids)).delete(synchronize_session=False)
+        db.session.commit()
+    
+    while True:
+        task_ids = [row.id for row in db.session.query(Task.id).filter(Task.user_id == user_id).limit(DELETE_BATCH_SIZE)]
+        if not task_ids:
+            break
+        Task.query.filter(Task.id.in_(task_ids)).delete(synchronize_session=False)
+        db.session.commit()
+    
+    while True:
+        segments = db.session.query(ChatArchiveSegment.id, ChatArchiveSegment.message_count).filter(
+            ChatArchiveSegment.user_id == user_id).limit(DELETE_BATCH_SIZE).all()
+        if not segments:
+            break
+        # Archived chats are part of the chat total, so take them out of it too
+        bump_counter(db.session.connection(), 'chats', -sum(segment.message_count for segment in segments))
+        ChatArchiveSegment.query.filter(ChatArchiveSegment.id.in_([segment.id for segment in segments])).delete(
+            synchronize_session=False)
+        db.session.commit()
+    
+    ChatJob.query.filter_by(user_id=user_id).delete()
+    UserEvent.query.filter_by(user_id=user_id).delete()
+    ConversationSummary.query.filter_by(user_id=user_id).delete()
+    ChatRateLimit.query.filter_by(user_id=user_id).delete()
+    User.query.filter_by(id=user_id).delete()
+    db.session.commit()
+
+def register_retention_commands(app):
+    """Add `flask retention archive|status` to the app CLI"""
+    import click
+    
+    @app.cli.group('retention')
+    def retention_group():
+        """Chat archiving."""
+    
+    @retention_group.command('archive')
+    @click.option('--days', type=int, default=None, help='Archive chats older than this (default CHAT_ARCHIVE_AFTER_DAYS)')
+    def archive_command(days):
+        """Move old chats into the compressed archive."""
+        moved = archive_old_chats(days)
+        click.echo(f'Archived {moved} chats')
+    
+    @retention_group.command('status')
+    def status_command():
+        """Show hot and archived chat counts."""
+        hot = db.session.query(func.count(Chat.id)).scalar()
+        segments, archived = db.session.query(func.count(ChatArchiveSegment.id),
+                                              func.coalesce(func.sum(ChatArchiveSegment.message_count), 0)).one()
+        click.echo(f'Hot chats: {hot}')
+        click.echo(f'Archived chats: {archived} in {segments} segments')
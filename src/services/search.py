@@ -0,0 +1,161 @@
+"""Ranked full-text search over chat messages, responses and task descriptions
+
+On PostgreSQL searches use GIN indexes over to_tsvector expressions and are
+ranked with ts_rank; on SQLite they use FTS5 tables kept in sync by triggers
+and ranked with bm25. Both are created by the 'full text search' migration.
+A database that has not been migrated yet falls back to an unranked
+substring scan.
+"""
+from src.models.user import db, User, Chat, Task
+from sqlalchemy import select, func, inspect, literal_column, table, column
+from datetime import timedelta
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Text search configuration used by the PostgreSQL indexes and queries
+SEARCH_CONFIG = 'english'
+
+# Indexed text columns of each searchable table
+SEARCH_COLUMNS = {
+    'chats': ('message', 'response'),
+    'tasks': ('description',)
+}
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+# Length of the excerpt shown for long messages
+SEARCH_SNIPPET_CHARS = 240
+
+# Engines whose search indexes are known to exist
+_indexed = {}
+
+def document_vector(kind):
+    """SQL tsvector expression for a searchable table; queries must match the index expression exactly"""
+    document = " || ' ' || ".join(SEARCH_COLUMNS[kind])
+    return f"to_tsvector('{SEARCH_CONFIG}', {document})"
+
+def search_backend():
+    """'postgresql' or 'sqlite' when the search indexes exist, otherwise None"""
+    engine = db.engine
+    key = str(engine.url)
+    if key in _indexed:
+        return _indexed[key]
+    
+    inspector = inspect(engine)
+    dialect = engine.dialect.name
+    if dialect == 'postgresql':
+        available = 'ix_chats_search' in {index['name'] for index in inspector.get_indexes('chats')}
+    elif dialect == 'sqlite':
+        available = inspector.has_table('chats_fts')
+    else:
+        available = False
+    
+    if not available:
+        # Not cached, so search switches over as soon as the migration has run
+        logger.warning("Full-text search indexes are missing; run `flask db upgrade`. Using a substring scan.")
+        return None
+    _indexed[key] = dialect
+    return dialect
+
+def fts5_query(q):
+    """Quote every term so user input cannot break FTS5 query syntax; terms are ANDed"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+def snippet(value, terms):
+    """Excerpt of `value` around the first search term it contains"""
+    if value is None or len(value) <= SEARCH_SNIPPET_CHARS:
+        return value
+    match = re.search('|'.join(re.escape(term) for term in terms), value, re.IGNORECASE) if terms else None
+    start = max(0, (match.start() if match else 0) - SEARCH_SNIPPET_CHARS // 4)
+    end = start + SEARCH_SNIPPET_CHARS
+    return ('…' if start else '') + value[start:end] + ('…' if end < len(value) else '')
+
+def _ranked(statement, model, kind, q, backend):
+    """Add the full-text match and a `rank` column (higher is better) to a select"""
+    if backend == 'postgresql':
+        vector = literal_column(document_vector(kind))
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        rank = func.ts_rank(vector, tsquery)
+        return statement.add_columns(rank.label('rank')).where(vector.op('@@')(tsquery)).order_by(rank.desc(), model.id.desc())
+    
+    if backend == 'sqlite':
+        fts = table(f"{kind}_fts", column('rowid'), column('rank'))
+        # FTS5 rank is bm25, where lower is a better match
+        return statement.add_columns((-fts.c.rank).label('rank')).join(fts, fts.c.rowid == model.id).where(
+            literal_column(f"{kind}_fts").op('MATCH')(fts5_query(q))).order_by(fts.c.rank, model.id.desc())
+    
+    # Unindexed fallback: newest matches first
+    if kind == 'chats':
+        match = Chat.message.icontains(q, autoescape=True) | Chat.response.icontains(q, autoescape=True)
+    else:
+        match = Task.description.icontains(q, autoescape=True)
+    return statement.add_columns(literal_column('NULL').label('rank')).where(match).order_by(model.id.desc())
+
+def search(kind, q, user_id=None, start=None, end=None, page=1, limit=SEARCH_PAGE_SIZE):
+    """Return one page of ranked matches for `q` in chats or tasks and whether more pages follow.
+    
+    `start` and `end` are dates; both are inclusive.
+    """
+    model = Chat if kind == 'chats' else Task
+    timestamp = Chat.timestamp if kind == 'chats' else Task.created_at
+    
+    if kind == 'chats':
+        statement = select(Chat.id, Chat.user_id, User.email, Chat.timestamp, Chat.is_system_message,
+                           Chat.message, Chat.response)
+    else:
+        statement = select(Task.id, Task.user_id, User.email, Task.description, Task.deadline, Task.completed,
+                           Task.created_at)
+    statement = statement.select_from(model).join(User, User.id == model.user_id)
+    
+    if user_id is not None:
+        statement = statement.where(model.user_id == user_id)
+    if start is not None:
+        statement = statement.where(timestamp >= start)
+    if end is not None:
+        statement = statement.where(timestamp < end + timedelta(days=1))
+    
+    statement = _ranked(statement, model, kind, q, search_backend())
+    rows = db.session.execute(statement.offset((page - 1) * limit).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    
+    terms = q.split()
+    results = []
+    for row in rows[:limit]:
+        result = {'id': row.id, 'user_id': row.user_id, 'email': row.email, 'rank': row.rank}
+        if kind == 'chats':
+            result.update({
+                'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+                'is_system_message': row.is_system_message,
+                'message': snippet(row.message, terms),
+                'response': snippet(row.response, terms)
+            })
+        else:
+            result.update({
+                'description': snippet(row.description, terms),
+                'deadline': row.deadline.isoformat() if row.deadline else None,
+                'completed': row.completed,
+                'created_at': row.created_at.isoformat() if row.created_at else None
+            })
+        results.append(result)
+    return results, has_more
+
+def fts5_statements(kind):
+    """SQLite FTS5 table, sync triggers and initial build for a searchable table"""
+    columns = ', '.join(SEARCH_COLUMNS[kind])
+    new_values = ', '.join(f"new.{name}" for name in SEARCH_COLUMNS[kind])
+    old_values = ', '.join(f"old.{name}" for name in SEARCH_COLUMNS[kind])
+    fts = f"{kind}_fts"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, content='{kind}', content_rowid='id')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {kind} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {kind} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {columns} ON {kind} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"
+    ]
@@ -0,0 +1,244 @@
+"""Activity rollups kept up to date in the same transaction as the rows they count
+
+Each running total and daily bucket is spread over STAT_SHARDS rows, and a
+write adds its delta to a random shard. Concurrent chat and task writes
+from different users then rarely wait on the same row lock. Reads sum the
+shards.
+"""
+from src.models.user import db, User, Chat, Task, StatCounter, DailyStat, DailyActiveUser, ChatArchiveSegment
+from sqlalchemy import event, func, delete, case
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, date, timedelta
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# Running totals shown on the admin dashboard
+COUNTER_MODELS = {'users': User, 'chats': Chat, 'tasks': Task}
+
+# Daily time-series metrics
+DAILY_METRICS = ('messages', 'tasks_created', 'tasks_completed', 'active_users')
+
+# Rows each total and bucket is spread over. Counter shard 0 holds the rebuilt
+# base value, so writes use shards 1..STAT_SHARDS.
+STAT_SHARDS = 16
+
+def _insert_for(connection, table):
+    """Dialect-specific INSERT that supports ON CONFLICT"""
+    if connection.dialect.name == 'postgresql':
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def bump_counter(connection, name, delta):
+    """Add delta to a running total.
+    
+    Writes land even before the totals are built, but get_counters() reports
+    nothing until rebuild_stats has written the shard 0 rows, and the rebuild
+    replaces any earlier deltas with a recount of the raw tables. Totals are
+    therefore never started from zero on a database that already has data.
+    """
+    if not delta:
+        return
+    table = StatCounter.__table__
+    stmt = _insert_for(connection, table).values(name=name, shard=random.randint(1, STAT_SHARDS), value=delta)
+    stmt = stmt.on_conflict_do_update(index_elements=['name', 'shard'], set_={'value': table.c.value + delta})
+    connection.execute(stmt)
+
+def bump_daily(connection, day, metric, delta=1):
+    """Add delta to a daily bucket"""
+    if not delta:
+        return
+    table = DailyStat.__table__
+    stmt = _insert_for(connection, table).values(day=day, metric=metric, shard=random.randrange(STAT_SHARDS), value=delta)
+    stmt = stmt.on_conflict_do_update(index_elements=['day', 'metric', 'shard'], set_={'value': table.c.value + delta})
+    connection.execute(stmt)
+
+def mark_active(connection, day, user_id):
+    """Record a user as active on a day, counting each user once per day"""
+    stmt = _insert_for(connection, DailyActiveUser.__table__).values(day=day, user_id=user_id)
+    stmt = stmt.on_conflict_do_nothing(index_elements=['day', 'user_id'])
+    if connection.execute(stmt).rowcount:
+        bump_daily(connection, day, 'active_users')
+
+def _day(value):
+    return (value or datetime.utcnow()).date()
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    """Turn the rows written by a flush into counter and bucket updates"""
+    counters = {}
+    daily = {}
+    active = set()
+    
+    for obj in session.new:
+        if isinstance(obj, User):
+            counters['users'] = counters.get('users', 0) + 1
+        elif isinstance(obj, Chat):
+            counters['chats'] = counters.get('chats', 0) + 1
+            if not obj.is_system_message:
+                day = _day(obj.timestamp)
+                daily[(day, 'messages')] = daily.get((day, 'messages'), 0) + 1
+                active.add((day, obj.user_id))
+        elif isinstance(obj, Task):
+            counters['tasks'] = counters.get('tasks', 0) + 1
+            day = _day(obj.created_at)
+            daily[(day, 'tasks_created')] = daily.get((day, 'tasks_created'), 0) + 1
+            if obj.completed:
+                day = _day(obj.completed_at)
+                daily[(day, 'tasks_completed')] = daily.get((day, 'tasks_completed'), 0) + 1
+    
+    for obj in session.dirty:
+        if isinstance(obj, Task):
+            history = db.inspect(obj).attrs.completed.history
+            if history.added and history.added[0] and not (history.deleted and history.deleted[0]):
+                day = _day(obj.completed_at)
+                daily[(day, 'tasks_completed')] = daily.get((day, 'tasks_completed'), 0) + 1
+        elif isinstance(obj, User):
+            if db.inspect(obj).attrs.last_login.history.added and obj.last_login:
+                active.add((_day(obj.last_login), obj.id))
+    
+    for obj in session.deleted:
+        for name, model in COUNTER_MODELS.items():
+            if isinstance(obj, model):
+                counters[name] = counters.get(name, 0) - 1
+    
+    if not (counters or daily or active):
+        return
+    
+    connection = session.connection()
+    for name, delta in counters.items():
+        bump_counter(connection, name, delta)
+    for (day, metric), delta in daily.items():
+        bump_daily(connection, day, metric, delta)
+    for day, user_id in active:
+        mark_active(connection, day, user_id)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    """Keep rollups right for ORM bulk INSERT and Query.delete(), which bypass the flush"""
+    is_insert = orm_execute_state.is_insert
+    if not (is_insert or orm_execute_state.is_delete) or orm_execute_state.bind_mapper is None:
+        return None
+    
+    model = orm_execute_state.bind_mapper.class_
+    name = next((name for name, counted_model in COUNTER_MODELS.items() if model is counted_model), None)
+    if name is None:
+        return None
+    
+    result = orm_execute_state.invoke_statement()
+    if is_insert and isinstance(orm_execute_state.parameters, list):
+        rows = len(orm_execute_state.parameters)
+    else:
+        rows = max(result.rowcount or 0, 0)
+    
+    if rows:
+        connection = orm_execute_state.session.connection()
+        bump_counter(connection, name, rows if is_insert else -rows)
+        if is_insert and model is Task:
+            bump_daily(connection, datetime.utcnow().date(), 'tasks_created', rows)
+    return result
+
+def get_counters():
+    """Return the running totals, or None if they have never been built"""
+    rows = db.session.query(
+        StatCounter.name,
+        func.sum(StatCounter.value).label('value'),
+        func.count(case((StatCounter.shard == 0, 1))).label('built')
+    ).group_by(StatCounter.name).all()
+    if not any(row.built for row in rows):
+        return None
+    counters = {name: 0 for name in COUNTER_MODELS}
+    counters.update({row.name: int(row.value) for row in rows})
+    return counters
+
+def get_daily_series(days=14):
+    """Return the last `days` daily buckets per metric, oldest first, with gaps filled with zero"""
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=days - 1)
+    rows = db.session.query(DailyStat.day, DailyStat.metric, func.sum(DailyStat.value).label('value')).filter(
+        DailyStat.day >= start).group_by(DailyStat.day, DailyStat.metric).all()
+    
+    values = {(_as_date(row.day), row.metric): int(row.value) for row in rows}
+    series = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        point = {'day': day}
+        point.update({metric: values.get((day, metric), 0) for metric in DAILY_METRICS})
+        series.append(point)
+    return series
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+def rebuild_stats():
+    """Recompute every rollup from the raw tables"""
+    connection = db.session.connection()
+    
+    connection.execute(delete(StatCounter.__table__))
+    connection.execute(delete(DailyStat.__table__))
+    connection.execute(delete(DailyActiveUser.__table__))
+    
+    for name, model in COUNTER_MODELS.items():
+        total = db.session.query(func.count(model.id)).scalar()
+        if model is Chat:
+            # Archived chats still count towards the total
+            total += db.session.query(func.coalesce(func.sum(ChatArchiveSegment.message_count), 0)).scalar()
+        connection.execute(StatCounter.__table__.insert().values(name=name, shard=0, value=total))
+    
+    # Daily buckets
+    message_day = func.date(Chat.timestamp)
+    bucket_queries = {
+        'messages': db.session.query(message_day, func.count(Chat.id))
+            .filter(Chat.is_system_message == False).group_by(message_day),
+        'tasks_created': db.session.query(func.date(Task.created_at), func.count(Task.id))
+            .filter(Task.created_at.isnot(None)).group_by(func.date(Task.created_at)),
+        'tasks_completed': db.session.query(func.date(Task.completed_at), func.count(Task.id))
+            .filter(Task.completed == True, Task.completed_at.isnot(None)).group_by(func.date(Task.completed_at))
+    }
+    for metric, query in bucket_queries.items():
+        rows = [{'day': _as_date(day), 'metric': metric, 'shard': 0, 'value': value} for day, value in query if day is not None]
+        if rows:
+            connection.execute(DailyStat.__table__.insert(), rows)
+    
+    # Active users: anyone who sent a message that day, plus each user's last login
+    active = {(_as_date(day), user_id) for day, user_id in db.session.query(message_day, Chat.user_id)
+              .filter(Chat.is_system_message == False).distinct() if day is not None}
+    active.update((login.date(), user_id) for user_id, login in db.session.query(User.id, User.last_login)
+                  .filter(User.last_login.isnot(None)))
+    if active:
+        connection.execute(DailyActiveUser.__table__.insert(), [{'day': day, 'user_id': user_id} for day, user_id in active])
+        per_day = {}
+        for day, _ in active:
+            per_day[day] = per_day.get(day, 0) + 1
+        connection.execute(DailyStat.__table__.insert(),
+                           [{'day': day, 'metric': 'active_users', 'shard': 0, 'value': value} for day, value in per_day.items()])
+    
+    db.session.commit()
+    logger.info("Rebuilt activity rollups from raw tables")
+
+def ensure_stats_built():
+    """Build the rollups if they have never been built; returns True if it ran the rebuild"""
+    if get_counters() is not None:
+        return False
+    rebuild_stats()
+    return True
+
+def register_stats_commands(app):
+    """Add `flask stats rebuild` to the app CLI"""
+    import click
+    
+    @app.cli.group('stats')
+    def stats_group():
+        """Activity rollup maintenance."""
+    
+    @stats_group.command('rebuild')
+    def rebuild_command():
+        """Recompute the activity rollups from the raw tables."""
+        rebuild_stats()
+        click.echo('Activity rollups rebuilt')
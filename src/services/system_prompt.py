@@ -0,0 +1,137 @@
+"""Versioned assistant system prompt shared by every worker and node
+
+Each save inserts a new row in system_prompts; the highest version is the
+active prompt, and rolling back saves an earlier version's text as a new one,
+so the history is never rewritten. The send path reads the prompt from an
+in-process copy and checks the current version number at most every
+SYSTEM_PROMPT_CHECK_SECONDS, so edits reach all processes within seconds
+without a database read per message.
+"""
+from src.models.user import db, User, SystemPrompt
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Used until an admin saves the first version
+DEFAULT_SYSTEM_PROMPT = """You are a tough assistant who speaks in a commanding, strict tone and expects complete obedience.
+You use occasional Tamil words like 'paaru' (look) and 'samjha' (understand) in your speech.
+You assign self-improvement tasks to users with specific deadlines (usually 24-48 hours).
+
+Important: When assigning tasks, ALWAYS include a JSON block at the end of your message in this exact format:
+```json
+{"tasks": [{"description": "Task description here", "deadline_days": 1}]}
+```
+
+Keep your responses short (1-2 sentences) after the initial introduction.
+Always maintain your strict, commanding persona and never break character."""
+
+# Seconds a process uses its copy of the prompt before checking for a newer version
+SYSTEM_PROMPT_CHECK_SECONDS = float(os.environ.get('SYSTEM_PROMPT_CHECK_SECONDS', '5'))
+
+SYSTEM_PROMPT_HISTORY_SIZE = 20
+
+class PromptVersionConflict(Exception):
+    """Raised when the prompt changed since the editor loaded it"""
+    
+    def __init__(self, current_version):
+        super().__init__(f"The system prompt is now at version {current_version}")
+        self.current_version = current_version
+
+class PromptCache:
+    """This process's copy of the active prompt and the version it belongs to"""
+    
+    def __init__(self, check_seconds):
+        self.check_seconds = check_seconds
+        self.version = None
+        self.content = DEFAULT_SYSTEM_PROMPT
+        self._checked_at = None
+        self._lock = threading.Lock()
+    
+    def fresh(self):
+        """Return the cached prompt if it was checked recently, otherwise None"""
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.check_seconds:
+                return self.content
+            return None
+    
+    def store(self, version, content):
+        with self._lock:
+            self.version = version
+            self.content = content
+            self._checked_at = time.monotonic()
+    
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+prompt_cache = PromptCache(SYSTEM_PROMPT_CHECK_SECONDS)
+
+def current_prompt_version():
+    """Version number of the active prompt, 0 while the default is in use"""
+    return db.session.query(func.coalesce(func.max(SystemPrompt.version), 0)).scalar()
+
+def load_prompt(version):
+    """Text of a prompt version; version 0 is the built-in default"""
+    if not version:
+        return DEFAULT_SYSTEM_PROMPT
+    return db.session.query(SystemPrompt.content).filter(SystemPrompt.version == version).scalar()
+
+def get_system_prompt():
+    """The active system prompt, from the in-process copy while it is fresh"""
+    content = prompt_cache.fresh()
+    if content is not None:
+        return content
+    
+    # One indexed lookup of the version number; the text is only read after a change
+    version = current_prompt_version()
+    if version == prompt_cache.version:
+        content = prompt_cache.content
+    else:
+        content = load_prompt(version)
+        logger.info(f"Using system prompt version {version}")
+    prompt_cache.store(version, content)
+    return content
+
+def save_system_prompt(content, admin_id, base_version=None, note=None):
+    """Save `content` as the next version and return it.
+    
+    With base_version set, raises PromptVersionConflict if another admin saved
+    a version since the editor was loaded, instead of overwriting their edit.
+    """
+    current = current_prompt_version()
+    if base_version is not None and base_version != current:
+        db.session.rollback()
+        raise PromptVersionConflict(current)
+    
+    prompt = SystemPrompt(version=current + 1, content=content, created_at=datetime.utcnow(),
+                          created_by=admin_id, note=note)
+    db.session.add(prompt)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another save took the same version number first
+        db.session.rollback()
+        raise PromptVersionConflict(current_prompt_version())
+    
+    prompt_cache.invalidate()
+    logger.info(f"System prompt version {prompt.version} saved by user {admin_id}")
+    return prompt
+
+def rollback_system_prompt(version, admin_id):
+    """Make an earlier version active again by saving its text as a new version"""
+    content = load_prompt(version)
+    if content is None:
+        return None
+    note = f"Rolled back to version {version}" if version else "Restored the built-in default"
+    return save_system_prompt(content, admin_id, note=note)
+
+def prompt_history(limit=SYSTEM_PROMPT_HISTORY_SIZE):
+    """Most recent prompt versions, newest first, with the email of the admin who saved them"""
+    return db.session.query(SystemPrompt, User.email).outerjoin(User, User.id == SystemPrompt.created_by).order_by(
+        SystemPrompt.version.desc()).limit(limit).all()
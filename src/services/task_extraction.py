@@ -0,0 +1,186 @@
+"""Extraction of assigned tasks from assistant responses"""
+import json
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Fenced JSON blocks: ```json { ... } ```
+JSON_BLOCK_RE = re.compile(r'```json[ \t]*\n?(.*?)```', re.DOTALL | re.IGNORECASE)
+
+# Fallback when no JSON block is present: explicit "Task: ..." lines only
+TASK_LINE_RE = re.compile(r'^[ \t]*(?:[-*][ \t]*)?(?:\*\*)?(?:new[ \t]+)?task(?:\*\*)?[ \t]*:[ \t]*(?:\*\*)?[ \t]*([^\n]+)$',
+                          re.IGNORECASE | re.MULTILINE)
+
+FENCE = '```'
+JSON_FENCE = '```json'
+
+DEFAULT_DEADLINE_DAYS = 1
+MAX_DEADLINE_DAYS = 30
+MIN_FALLBACK_DESCRIPTION = 10
+MAX_DESCRIPTION_LENGTH = 500
+
+def validate_task(task_data):
+    """Return a clean {'description', 'deadline_days'} dict, or None if the entry is unusable"""
+    if not isinstance(task_data, dict):
+        return None
+    
+    description = task_data.get('description')
+    if not isinstance(description, str) or not description.strip():
+        return None
+    
+    days = task_data.get('deadline_days', DEFAULT_DEADLINE_DAYS)
+    if isinstance(days, bool) or not isinstance(days, (int, float, str)):
+        days = DEFAULT_DEADLINE_DAYS
+    try:
+        days = int(float(days))
+    except (TypeError, ValueError):
+        days = DEFAULT_DEADLINE_DAYS
+    days = min(max(days, DEFAULT_DEADLINE_DAYS), MAX_DEADLINE_DAYS)
+    
+    return {'description': description.strip()[:MAX_DESCRIPTION_LENGTH], 'deadline_days': days}
+
+def parse_task_block(block):
+    """Parse the JSON inside one fenced block; returns (tasks, ok)"""
+    try:
+        data = json.loads(block)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing JSON from response: {e}")
+        return [], False
+    
+    entries = data.get('tasks') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return [], True
+    
+    tasks = []
+    for entry in entries:
+        task = validate_task(entry)
+        if task:
+            tasks.append(task)
+        else:
+            logger.warning(f"Skipping invalid task entry: {entry!r}"[:200])
+    return tasks, True
+
+def fallback_tasks(text):
+    """Extract tasks from explicit 'Task: ...' lines when there is no JSON block"""
+    tasks = []
+    for match in TASK_LINE_RE.finditer(text):
+        description = match.group(1).strip().rstrip('*').strip()
+        if len(description) > MIN_FALLBACK_DESCRIPTION:
+            tasks.append({'description': description[:MAX_DESCRIPTION_LENGTH], 'deadline_days': DEFAULT_DEADLINE_DAYS})
+    return tasks
+
+def extract_tasks(text):
+    """Split a complete response into (clean_text, tasks) in a single pass.
+    
+    Every fenced JSON block is parsed and removed. Blocks that are not valid
+    JSON are left in the text, as before.
+    """
+    parts = []
+    tasks = []
+    found_block = False
+    position = 0
+    
+    for match in JSON_BLOCK_RE.finditer(text):
+        block_tasks, ok = parse_task_block(match.group(1))
+        parts.append(text[position:match.start()])
+        if ok:
+            found_block = True
+            tasks.extend(block_tasks)
+        else:
+            parts.append(match.group(0))
+        position = match.end()
+    
+    if not found_block and position == 0:
+        return text, fallback_tasks(text)
+    
+    parts.append(text[position:])
+    return ''.join(parts).strip(), tasks
+
+class TaskStreamParser:
+    """Incremental version of extract_tasks for streamed responses.
+    
+    feed() takes the next chunk and returns the text that can be shown right
+    away, holding back fenced JSON blocks. Blocks are parsed as soon as their
+    closing fence arrives. finish() returns the same (clean_text, tasks) as
+    extract_tasks() on the whole response.
+    """
+    
+    def __init__(self):
+        self.clean_parts = []
+        self.tasks = []
+        self.saw_block = False
+        self.pending = ''
+        self.in_block = False
+        self.block = ''
+    
+    def feed(self, chunk):
+        # Fast path: plain text with nothing held back
+        if not self.in_block and not self.pending and '`' not in chunk:
+            self.clean_parts.append(chunk)
+            return chunk
+        
+        visible = []
+        self.pending += chunk
+        
+        while self.pending:
+            if self.in_block:
+                end = self.pending.find(FENCE)
+                if end == -1:
+                    # Keep a possible partial closing fence in pending
+                    keep = _partial_suffix(self.pending, FENCE)
+                    self.block += self.pending[:len(self.pending) - keep]
+                    self.pending = self.pending[len(self.pending) - keep:]
+                    break
+                self.block += self.pending[:end]
+                self.pending = self.pending[end + len(FENCE):]
+                self.in_block = False
+                self._close_block()
+                continue
+            
+            start = self.pending.lower().find(JSON_FENCE)
+            if start == -1:
+                keep = _partial_suffix(self.pending.lower(), JSON_FENCE)
+                visible.append(self.pending[:len(self.pending) - keep])
+                self.pending = self.pending[len(self.pending) - keep:]
+                break
+            visible.append(self.pending[:start])
+            self.pending = self.pending[start + len(JSON_FENCE):]
+            self.in_block = True
+            self.block = ''
+        
+        text = ''.join(visible)
+        self.clean_parts.append(text)
+        return text
+    
+    def _close_block(self):
+        self.saw_block = True
+        block_tasks, ok = parse_task_block(self.block.strip())
+        if ok:
+            self.tasks.extend(block_tasks)
+        else:
+            # Invalid blocks stay in the stored text, as in extract_tasks
+            self.clean_parts.append(f"{JSON_FENCE}{self.block}{FENCE}")
+        self.block = ''
+    
+    def finish(self):
+        """Return (clean_text, tasks) once the stream has ended"""
+        if self.in_block:
+            # Unterminated block: keep it as plain text
+            self.clean_parts.append(f"{JSON_FENCE}{self.block}{self.pending}")
+        else:
+            self.clean_parts.append(self.pending)
+        self.pending = ''
+        self.in_block = False
+        
+        text = ''.join(self.clean_parts)
+        if not self.saw_block:
+            return text, fallback_tasks(text)
+        return text.strip(), self.tasks
+
+def _partial_suffix(text, marker):
+    """Length of the longest suffix of text that is a proper prefix of marker"""
+    for size in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:size]):
+            return size
+    return 0
@@ -0,0 +1,66 @@
+// Live updates: follow the user's task and message events and re-dispatch
+// each one on the document as a "live-event" CustomEvent for the page to
+// apply. Pages opt in with <div id="liveEvents" data-after="..."></div>.
+(function() {
+    // Matches the server's EVENTS_HOLD_SECONDS; an empty poll is followed by a pause
+    // so an idle page does not keep a server thread busy
+    const LONG_POLL_SECONDS = 5;
+    const POLL_PAUSE_MILLISECONDS = 3000;
+    
+    function dispatch(event) {
+        document.dispatchEvent(new CustomEvent('live-event', {detail: event}));
+    }
+    
+    // Fallback for browsers without EventSource, or when streams keep failing
+    function longPoll(after) {
+        fetch(`/events/?after=${after}&wait=${LONG_POLL_SECONDS}`, {headers: {'Accept': 'application/json'}})
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(data => {
+            data.events.forEach(dispatch);
+            setTimeout(() => longPoll(data.last_id), data.events.length ? 0 : POLL_PAUSE_MILLISECONDS);
+        })
+        .catch(error => {
+            console.error('Live updates unavailable:', error);
+            setTimeout(() => longPoll(after), 5000);
+        });
+    }
+    
+    function stream(after) {
+        // EventSource reconnects by itself and resumes from the last event id it saw
+        const source = new EventSource(`/events/stream?after=${after}`);
+        let lastId = after;
+        let failures = 0;
+        
+        source.onmessage = function(message) {
+            const event = JSON.parse(message.data);
+            lastId = event.id;
+            failures = 0;
+            dispatch(event);
+        };
+        source.onopen = function() {
+            failures = 0;
+        };
+        source.onerror = function() {
+            failures += 1;
+            if (failures >= 3) {
+                source.close();
+                longPoll(lastId);
+            }
+        };
+    }
+    
+    document.addEventListener('DOMContentLoaded', function() {
+        const config = document.getElementById('liveEvents');
+        if (!config) return;
+        
+        const after = parseInt(config.dataset.after || '0', 10);
+        if (window.EventSource) {
+            stream(after);
+        } else {
+            longPoll(after);
+        }
+    });
+})();
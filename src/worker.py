@@ -0,0 +1,21 @@
+"""Standalone chat worker process: python -m src.worker"""
+import os
+import time
+import logging
+from src.main import app
+from src.services.job_queue import start_chat_workers
+
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    threads = int(os.environ.get('CHAT_WORKER_PROCESS_THREADS', '4'))
+    # Without the queue, chats still at the placeholder are being streamed by a web
+    # process, so this process only runs the periodic maintenance
+    pool = start_chat_workers(app, threads, take_jobs=app.config['CHAT_QUEUE_ENABLED'])
+    logger.info(f"Chat worker process running with {threads} threads")
+    
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pool.stop(timeout=35)
@@ -0,0 +1,92 @@
+"""Shared fixtures: the app on a fresh SQLite database, signed-in clients and a local Grok API"""
+from bench.mock_grok import make_server
+import threading
+import tempfile
+import itertools
+import pytest
+import os
+
+# Module-level settings are read at import, so they are set before the app is imported
+_workdir = tempfile.mkdtemp(prefix='chat-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ['QUERY_BUDGET_MODE'] = 'strict'
+os.environ['CHAT_WORKER_THREADS'] = '0'
+os.environ['SECRET_KEY'] = 'tests'
+
+_emails = itertools.count(1)
+
+@pytest.fixture(scope='session')
+def app():
+    from src.main import app
+    from src.models.user import db
+    from src.migrations import upgrade, seed_admin
+    from src.services.stats import ensure_stats_built
+    
+    # What `flask db setup` does on a deploy
+    with app.app_context():
+        upgrade(db.engine)
+        seed_admin()
+        ensure_stats_built()
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    return app
+
+@pytest.fixture
+def make_user(app):
+    """Sign up and log in a new user; returns (client, user_id)"""
+    from src.models.user import User
+    
+    def make():
+        email = f"user{next(_emails)}@example.com"
+        client = app.test_client()
+        client.post('/signup', data={'email': email, 'password': 'password'})
+        client.post('/login', data={'email': email, 'password': 'password'})
+        with app.app_context():
+            return client, User.query.filter_by(email=email).one().id
+    return make
+
+@pytest.fixture
+def admin_client(app):
+    from src.migrations import DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD
+    
+    client = app.test_client()
+    client.post('/login', data={'email': DEFAULT_ADMIN_EMAIL, 'password': DEFAULT_ADMIN_PASSWORD})
+    return client
+
+@pytest.fixture
+def within_budget(app):
+    """Make a request and assert it stays within its endpoint's query budget, without N+1 patterns.
+    
+    Returns a function taking (client, method, path, data=None) that returns the response.
+    """
+    from src.services.query_budget import count_queries, budget_for_endpoint
+    
+    def request(client, method, path, data=None):
+        with count_queries() as log:
+            response = client.open(path, method=method, data=data)
+        with app.test_request_context():
+            endpoint = app.url_map.bind('localhost').match(path.partition('?')[0], method=method)[0]
+            budget, allow_repeated = budget_for_endpoint(endpoint)
+        assert log.count <= budget, f"{method} {path} ran {log.describe()}, budget {budget}"
+        if not allow_repeated:
+            assert not log.repeated(), f"{method} {path} repeated a statement (possible N+1): {log.describe()}"
+        return response
+    return request
+
+@pytest.fixture
+def mock_grok(monkeypatch):
+    """Point the app's Grok client at bench.mock_grok; returns a function that starts it with options"""
+    from src.services import grok_client
+    servers = []
+    
+    def start(**options):
+        server, url = make_server(**options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(grok_client, '_client', grok_client.GrokClient(api_url=url, api_key='test-key'))
+        monkeypatch.setattr(grok_client, '_client_pid', os.getpid())
+        return server
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,60 @@
+"""Admin access checks and admin editing flows"""
+
+def forget_role_stamp(client):
+    # Sessions signed before the deploy that added role stamps carry only the identity
+    with client.session_transaction() as session:
+        session.pop('is_admin')
+        session.pop('auth_version')
+
+def test_legacy_admin_session_is_restamped(admin_client):
+    forget_role_stamp(admin_client)
+    
+    assert admin_client.get('/admin/').status_code == 200
+    with admin_client.session_transaction() as session:
+        assert session['is_admin'] is True
+        assert session['auth_version'] is not None
+
+def test_legacy_user_session_is_still_refused(make_user):
+    client, _ = make_user()
+    forget_role_stamp(client)
+    
+    response = client.get('/admin/')
+    assert response.status_code == 302 and response.location.endswith('/chat/')
+    with client.session_transaction() as session:
+        assert session['is_admin'] is False
+
+def test_legacy_session_of_deleted_user_must_log_in(app, make_user):
+    from src.models.user import db, User
+    from src.services.principals import invalidate_principal
+    
+    client, user_id = make_user()
+    forget_role_stamp(client)
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        invalidate_principal(user_id)
+    
+    response = client.get('/admin/')
+    assert response.status_code == 302 and response.location.endswith('/login')
+    with client.session_transaction() as session:
+        assert 'user_id' not in session
+
+def test_rollback_race_shows_the_conflict(app, admin_client, monkeypatch):
+    from src.services import system_prompt
+    from src.services.system_prompt import save_system_prompt, load_prompt
+    
+    with app.app_context():
+        first = save_system_prompt('First prompt', None).version
+        save_system_prompt('Second prompt', None)
+    
+    # Another admin saves between the rollback reading the current version and inserting the next one
+    real_current = system_prompt.current_prompt_version
+    stale = iter([first])
+    monkeypatch.setattr(system_prompt, 'current_prompt_version', lambda: next(stale, None) or real_current())
+    response = admin_client.post(f"/admin/system-prompt/rollback/{first}")
+    
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert f"Another admin saved version {first + 1}" in page and 'First prompt' in page
+    with app.app_context():
+        assert load_prompt(real_current()) == 'Second prompt'
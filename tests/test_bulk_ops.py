@@ -0,0 +1,92 @@
+"""Chunked bulk operations: progress, resume and fencing of a superseded run"""
+from src.models.user import db, User, Chat, Task, BulkOperation
+from src.services import bulk_ops
+from src.services.bulk_ops import run_bulk_operation, task_assigned_message
+from sqlalchemy import update
+import itertools
+import pytest
+import json
+
+_emails = itertools.count(1)
+
+@pytest.fixture
+def targets(app, monkeypatch):
+    """Five fresh users, reached two per chunk; returns their emails"""
+    monkeypatch.setattr(bulk_ops, 'BULK_CHUNK_SIZE', 2)
+    with app.app_context():
+        emails = [f"bulk{next(_emails)}@example.com" for _ in range(5)]
+        db.session.add_all([User(email=email, password_hash='x', is_admin=False) for email in emails])
+        db.session.commit()
+    return emails
+
+def create_operation(kind, payload, emails):
+    operation = BulkOperation(kind=kind, payload=json.dumps(payload), target=json.dumps({'emails': emails}),
+                              status='pending')
+    db.session.add(operation)
+    db.session.commit()
+    return operation.id
+
+def messages_per_user(emails, text):
+    return [Chat.query.join(User, User.id == Chat.user_id).filter(User.email == email, Chat.response == text).count()
+            for email in emails]
+
+def test_task_assignment_runs_in_chunks(app, targets):
+    with app.app_context():
+        operation_id = create_operation('task', {'description': 'Submit the report', 'days': 3}, targets)
+        run_bulk_operation(operation_id)
+        
+        operation = db.session.get(BulkOperation, operation_id)
+        assert (operation.status, operation.total, operation.processed, operation.cursor) == ('done', 5, 5, 5)
+        assert messages_per_user(targets, task_assigned_message('Submit the report', 3)) == [1] * 5
+        assert Task.query.filter_by(description='Submit the report').count() == 5
+
+def test_failed_operation_resumes_from_its_cursor(app, targets, monkeypatch):
+    real_write_chunk = bulk_ops.write_chunk
+    calls = itertools.count()
+    
+    def failing_second_chunk(kind, payload, user_ids):
+        if next(calls) == 1:
+            real_write_chunk(kind, payload, user_ids)
+            raise RuntimeError('database went away')
+        real_write_chunk(kind, payload, user_ids)
+    
+    with app.app_context():
+        operation_id = create_operation('message', {'message': 'Resume me'}, targets)
+        monkeypatch.setattr(bulk_ops, 'write_chunk', failing_second_chunk)
+        run_bulk_operation(operation_id)
+        
+        operation = db.session.get(BulkOperation, operation_id)
+        assert (operation.status, operation.processed, operation.cursor) == ('failed', 2, 2)
+        assert operation.error == 'database went away'
+        # The failed chunk rolled back with its progress
+        assert messages_per_user(targets, 'Resume me') == [1, 1, 0, 0, 0]
+        
+        monkeypatch.setattr(bulk_ops, 'write_chunk', real_write_chunk)
+        run_bulk_operation(operation_id)
+        db.session.expire_all()
+        operation = db.session.get(BulkOperation, operation_id)
+        assert (operation.status, operation.processed) == ('done', 5)
+        assert messages_per_user(targets, 'Resume me') == [1] * 5
+
+def test_superseded_run_stops_without_duplicating_rows(app, targets, monkeypatch):
+    real_write_chunk = bulk_ops.write_chunk
+    calls = itertools.count()
+    
+    def resumed_elsewhere_during_second_chunk(kind, payload, user_ids):
+        if next(calls) == 1:
+            # A resume in another process takes the stale operation over from chunk 1's cursor
+            db.session.execute(update(BulkOperation).where(BulkOperation.id == operation_id)
+                               .values(claim_token='other-run'))
+            db.session.commit()
+        real_write_chunk(kind, payload, user_ids)
+    
+    with app.app_context():
+        operation_id = create_operation('message', {'message': 'Only once'}, targets)
+        monkeypatch.setattr(bulk_ops, 'write_chunk', resumed_elsewhere_during_second_chunk)
+        run_bulk_operation(operation_id)
+        
+        db.session.expire_all()
+        operation = db.session.get(BulkOperation, operation_id)
+        # This run recorded nothing after losing its claim, and its second chunk rolled back
+        assert (operation.status, operation.claim_token, operation.cursor, operation.processed) == ('running', 'other-run', 2, 2)
+        assert messages_per_user(targets, 'Only once') == [1, 1, 0, 0, 0]
@@ -0,0 +1,53 @@
+from bench.mock_grok import REPLIES
+from src.models.user import Chat, Task
+from src.routes.chat import INTERRUPTED_REPLY_NOTE
+import time
+
+def test_disconnect_mid_stream_stores_partial_reply_and_frees_slot(app, make_user, mock_grok, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', False)
+    # About ten chunks half a second apart, so reading the rest would take seconds
+    mock_grok(latency='fixed:0', task_rate=1.0, token_delay=0.5)
+    client, user_id = make_user()
+    
+    response = client.post('/chat/send', data={'message': 'Plan my day', 'stream': '1'}, buffered=False)
+    first = next(iter(response.response))
+    assert b'event: token' in first
+    
+    # The browser goes away after the first token; the upstream stream is closed, not drained
+    started = time.monotonic()
+    response.close()
+    assert time.monotonic() - started < 1
+    
+    with app.app_context():
+        chat = Chat.query.filter_by(user_id=user_id).order_by(Chat.id.desc()).first()
+        assert chat.response.endswith(INTERRUPTED_REPLY_NOTE)
+        assert any(reply.startswith(chat.response.split('\n\n')[0]) for reply in REPLIES)
+        # The task block comes last and never arrived
+        assert Task.query.filter_by(user_id=user_id).count() == 0
+    
+    # The in-flight slot was released, so the next message is accepted
+    mock_grok(latency='fixed:0', task_rate=0.0, token_delay=0)
+    response = client.post('/chat/send', data={'message': 'Again', 'stream': '1'})
+    assert response.status_code == 200
+    assert b'event: done' in response.data
+
+def test_stream_sends_done_event(app, make_user, mock_grok, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', False)
+    mock_grok(latency='fixed:0', task_rate=0.0, token_delay=0)
+    client, user_id = make_user()
+    
+    response = client.post('/chat/send', data={'message': 'Hello', 'stream': '1'})
+    assert response.status_code == 200
+    assert response.data.count(b'event: done') == 1
+    with app.app_context():
+        chat = Chat.query.filter_by(user_id=user_id).one()
+        assert chat.response in REPLIES
+
+def test_default_config_streams_the_reply(app, make_user, mock_grok):
+    mock_grok(latency='fixed:0', task_rate=0.0, token_delay=0)
+    client, _ = make_user()
+    
+    response = client.post('/chat/send', data={'message': 'Hello'}, headers={'Accept': 'text/event-stream'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert b'event: token' in response.data
@@ -0,0 +1,64 @@
+"""Token-budgeted chat context and the rolling summary boundary"""
+from src.models.user import db, Chat, ConversationSummary, PROCESSING_PLACEHOLDER
+from src.services import context_builder
+from src.services.context_builder import build_context, refresh_summary
+from datetime import datetime, timedelta
+import pytest
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Record summary refreshes build_context schedules instead of running them"""
+    calls = []
+    monkeypatch.setattr(context_builder, 'schedule_summary_refresh',
+                        lambda user_id, placeholder, through_chat_id=None: calls.append((user_id, through_chat_id)))
+    return calls
+
+def add_chats(user_id, count, length=40):
+    start = datetime.utcnow() - timedelta(hours=1)
+    chats = [Chat(user_id=user_id, message=f"question {index} " + 'x' * length, response=f"answer {index} " + 'y' * length,
+                  timestamp=start + timedelta(seconds=index)) for index in range(count)]
+    db.session.add_all(chats)
+    db.session.commit()
+    return [chat.id for chat in chats]
+
+def sent_chats(messages):
+    return [message['content'].split()[1] for message in messages[1:] if message['role'] == 'user']
+
+def test_history_stops_at_the_summary(app, make_user, scheduled):
+    _, user_id = make_user()
+    with app.app_context():
+        chat_ids = add_chats(user_id, 6)
+        db.session.add(ConversationSummary(user_id=user_id, summary='Earlier: the user plans a move.',
+                                           covered_chat_id=chat_ids[3]))
+        db.session.commit()
+        
+        messages = build_context(user_id, 'SYSTEM', PROCESSING_PLACEHOLDER, budget=10000)
+        assert 'Earlier: the user plans a move.' in messages[0]['content']
+        # Chats the summary covers are not repeated verbatim, and nothing was dropped
+        assert sent_chats(messages) == ['4', '5']
+        assert scheduled == []
+
+def test_chats_cut_by_the_budget_are_folded_into_the_summary(app, make_user, scheduled, mock_grok):
+    _, user_id = make_user()
+    with app.app_context():
+        chat_ids = add_chats(user_id, 8)
+        db.session.add(ConversationSummary(user_id=user_id, summary='Earlier things.', covered_chat_id=chat_ids[1]))
+        db.session.commit()
+        
+        # Room for about three of the six unsummarized chats
+        messages = build_context(user_id, 'SYSTEM', PROCESSING_PLACEHOLDER, budget=130)
+        sent = sent_chats(messages)
+        assert 0 < len(sent) < 6 and sent[-1] == '7'
+        newest_dropped = chat_ids[int(sent[0]) - 1]
+        
+        # The newest chat left out, and everything older, goes into the summary
+        assert scheduled == [(user_id, newest_dropped)]
+        mock_grok(latency='fixed:0', task_rate=0.0)
+        assert refresh_summary(user_id, PROCESSING_PLACEHOLDER, through_chat_id=newest_dropped)
+        db.session.expire_all()
+        assert db.session.get(ConversationSummary, user_id).covered_chat_id == newest_dropped
+        
+        # The next context has no gap between the summary and the history
+        scheduled.clear()
+        assert sent_chats(build_context(user_id, 'SYSTEM', PROCESSING_PLACEHOLDER, budget=10000)) == sent
+        assert scheduled == []
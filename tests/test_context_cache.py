@@ -0,0 +1,37 @@
+"""Per-user context summary cache and its invalidation"""
+from src.models.user import db, Task
+from src.routes.chat import get_user_context_summary
+from src.services.context_cache import context_cache
+from datetime import datetime, timedelta
+
+def test_task_writes_through_the_routes_refresh_the_summary(app, make_user):
+    client, user_id = make_user()
+    with app.app_context():
+        assert 'pending' not in get_user_context_summary(user_id)
+    
+    client.post('/task/add', data={'description': 'Water the plants', 'days': 2})
+    with app.app_context():
+        summary = get_user_context_summary(user_id)
+        assert 'User currently has 1 pending tasks.' in summary and 'Water the plants' in summary
+        task_id = Task.query.filter_by(user_id=user_id).one().id
+    
+    client.post(f'/task/complete/{task_id}')
+    with app.app_context():
+        summary = get_user_context_summary(user_id)
+        assert 'completed 1 tasks' in summary and 'pending' not in summary
+
+def test_writes_from_another_process_are_seen_without_invalidation(app, make_user):
+    _, user_id = make_user()
+    with app.app_context():
+        get_user_context_summary(user_id)
+        assert context_cache.get(user_id) is not None
+        
+        # Another process adds a task; this process's entry is never invalidated
+        db.session.add(Task(user_id=user_id, description='Call the bank', deadline=datetime.utcnow() + timedelta(days=1)))
+        db.session.commit()
+        assert 'Call the bank' in get_user_context_summary(user_id)
+        
+        # Unchanged tasks are served from the cache
+        hits = context_cache.hits
+        get_user_context_summary(user_id)
+        assert context_cache.hits == hits + 1
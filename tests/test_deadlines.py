@@ -0,0 +1,53 @@
+"""Overdue task sweep and the cross-process schedule of periodic maintenance"""
+from src.models.user import db, Chat, Task, UserEvent
+from src.services.deadlines import sweep_overdue_tasks, overdue_reminder_message
+from src.services.job_queue import claim_periodic_run
+from datetime import datetime, timedelta
+
+def add_task(user_id, description, deadline, completed=False):
+    task = Task(user_id=user_id, description=description, deadline=deadline, completed=completed,
+                created_at=datetime.utcnow())
+    db.session.add(task)
+    db.session.commit()
+    return task.id
+
+def test_sweep_marks_overdue_tasks_once_and_reminds_their_users(app, make_user):
+    _, user_id = make_user()
+    now = datetime.utcnow()
+    with app.app_context():
+        sweep_overdue_tasks()
+        late = add_task(user_id, 'Pay rent', now - timedelta(hours=1))
+        done = add_task(user_id, 'Buy milk', now - timedelta(hours=1), completed=True)
+        upcoming = add_task(user_id, 'Book flights', now + timedelta(days=1))
+        
+        assert sweep_overdue_tasks(batch_size=1) == 1
+        assert db.session.get(Task, late).overdue_at is not None
+        assert db.session.get(Task, done).overdue_at is None
+        assert db.session.get(Task, upcoming).overdue_at is None
+        
+        reminders = Chat.query.filter_by(user_id=user_id, is_system_message=True).all()
+        assert [chat.response for chat in reminders] == [overdue_reminder_message('Pay rent')]
+        kinds = sorted(event.kind for event in UserEvent.query.filter_by(user_id=user_id))
+        assert kinds == ['chat.message', 'task.overdue']
+        
+        # A second sweep finds nothing left to mark
+        assert sweep_overdue_tasks() == 0
+        assert Chat.query.filter_by(user_id=user_id, is_system_message=True).count() == 1
+
+def test_sweep_stops_after_max_batches(app, make_user):
+    _, user_id = make_user()
+    now = datetime.utcnow()
+    with app.app_context():
+        sweep_overdue_tasks()
+        for index in range(5):
+            add_task(user_id, f"Late {index}", now - timedelta(minutes=index + 1))
+        
+        assert sweep_overdue_tasks(batch_size=2, max_batches=2) == 4
+        assert sweep_overdue_tasks(batch_size=2) == 1
+
+def test_periodic_run_is_claimed_once_per_interval(app):
+    with app.app_context():
+        assert claim_periodic_run('test task', 60)
+        # Another process checking within the interval does not run it again
+        assert not claim_periodic_run('test task', 60)
+        assert claim_periodic_run('test task', 0)
@@ -0,0 +1,63 @@
+"""Live-update stream and long-poll endpoints"""
+from src.routes import events
+import threading
+import pytest
+import time
+
+@pytest.fixture
+def short_hold(monkeypatch):
+    monkeypatch.setattr(events, 'EVENTS_HOLD_SECONDS', 0.3)
+    monkeypatch.setattr(events, '_waiting', threading.BoundedSemaphore(2))
+
+def test_poll_returns_new_events(app, make_user, short_hold):
+    client, _ = make_user()
+    client.post('/task/add', data={'description': 'Water the plants', 'days': '1'})
+    
+    data = client.get('/events/?after=0&wait=0').get_json()
+    assert [event['kind'] for event in data['events']] == ['task.created']
+    assert data['events'][0]['data']['description'] == 'Water the plants'
+    
+    # Nothing newer: the poll waits at most the hold time and returns empty
+    started = time.monotonic()
+    data = client.get(f"/events/?after={data['last_id']}&wait=10").get_json()
+    assert data['events'] == []
+    assert 0.25 < time.monotonic() - started < 2
+
+def test_poll_does_not_wait_when_every_slot_is_taken(app, make_user, short_hold, monkeypatch):
+    monkeypatch.setattr(events, 'EVENTS_HOLD_SECONDS', 5)
+    client, _ = make_user()
+    events._waiting.acquire()
+    events._waiting.acquire()
+    try:
+        started = time.monotonic()
+        assert client.get('/events/?after=0&wait=5').get_json()['events'] == []
+        assert time.monotonic() - started < 1
+    finally:
+        events._waiting.release()
+        events._waiting.release()
+
+def test_stream_sends_events_then_closes_and_frees_its_slot(app, make_user, short_hold):
+    client, _ = make_user()
+    client.post('/task/add', data={'description': 'Call the bank', 'days': '1'})
+    
+    started = time.monotonic()
+    response = client.get('/events/stream?after=0')
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert body.startswith(f"retry: {events.EVENTS_RETRY_MILLISECONDS}")
+    assert body.count('id: ') == 1 and 'Call the bank' in body
+    assert time.monotonic() - started < 2
+    
+    # Both slots are free again
+    assert events._waiting.acquire(blocking=False) and events._waiting.acquire(blocking=False)
+    events._waiting.release()
+    events._waiting.release()
+
+def test_stream_resumes_after_last_event_id(app, make_user, short_hold):
+    client, _ = make_user()
+    client.post('/task/add', data={'description': 'First', 'days': '1'})
+    client.post('/task/add', data={'description': 'Second', 'days': '1'})
+    first_id = client.get('/events/?after=0&wait=0').get_json()['events'][0]['id']
+    
+    body = client.get('/events/stream', headers={'Last-Event-ID': str(first_id)}).get_data(as_text=True)
+    assert 'Second' in body and 'First' not in body
@@ -0,0 +1,230 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.services import grok_client
+from src.services.grok_client import GrokClient, CircuitOpenError, GrokNotConfigured, parse_retry_after
+from prometheus_client import REGISTRY
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import threading
+import requests
+import socket
+import pytest
+import json
+import time
+
+PAYLOAD = {'messages': [{'role': 'user', 'content': 'hi'}], 'model': 'test'}
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Answers each request with the next (status, headers, delay) from the server's script"""
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            status, headers, delay = self.server.script.pop(0) if self.server.script else (200, {}, 0)
+        time.sleep(delay)
+        body = json.dumps({'choices': [{'message': {'content': 'ok'}}]} if status == 200 else {'error': 'injected'}).encode()
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.script = []
+    server.requests = 0
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record retry delays instead of waiting them out"""
+    delays = []
+    clock = SimpleNamespace(sleep=delays.append, monotonic=time.monotonic, perf_counter=time.perf_counter)
+    monkeypatch.setattr(grok_client, 'time', clock)
+    return delays
+
+def metric(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def make_client(url, **options):
+    options = dict({'api_key': 'test-key', 'max_retries': 2, 'backoff_base': 0.01}, **options)
+    return GrokClient(api_url=url, **options)
+
+def test_retries_server_errors(server, sleeps):
+    server.script = [(500, {}, 0), (503, {}, 0)]
+    client = make_client(server.url)
+    
+    response = client.chat_completion(PAYLOAD)
+    
+    assert response.status_code == 200
+    assert server.requests == 3
+    assert len(sleeps) == 2
+    stats = client.stats()
+    assert (stats['calls'], stats['errors'], stats['retries']) == (3, 2, 2)
+    assert stats['circuit_state'] == 'closed'
+
+def test_returns_last_error_when_retries_run_out(server, sleeps):
+    server.script = [(502, {}, 0)] * 3
+    client = make_client(server.url)
+    errors_before = metric('llm_errors_total', reason='http_502')
+    retries_before = metric('llm_retries_total')
+    
+    assert client.chat_completion(PAYLOAD).status_code == 502
+    assert server.requests == 3
+    assert client.stats()['errors'] == 3
+    assert metric('llm_errors_total', reason='http_502') - errors_before == 3
+    assert metric('llm_retries_total') - retries_before == 2
+
+def test_does_not_retry_client_errors(server, sleeps):
+    server.script = [(400, {}, 0)]
+    client = make_client(server.url)
+    
+    assert client.chat_completion(PAYLOAD).status_code == 400
+    assert server.requests == 1
+    assert sleeps == []
+
+def test_retries_connection_errors(sleeps):
+    # Nothing listens on a port that was just released
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    client = make_client(f"http://127.0.0.1:{port}/v1/chat/completions")
+    
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.chat_completion(PAYLOAD)
+    stats = client.stats()
+    assert (stats['calls'], stats['errors'], stats['retries']) == (3, 3, 2)
+
+def test_honours_retry_after(server, sleeps):
+    server.script = [(429, {'Retry-After': '3'}, 0)]
+    client = make_client(server.url)
+    
+    assert client.chat_completion(PAYLOAD).status_code == 200
+    assert sleeps == [3.0]
+
+def test_gives_up_when_retry_after_is_too_long(server, sleeps):
+    server.script = [(503, {'Retry-After': '120'}, 0)]
+    client = make_client(server.url, max_retry_after=10.0)
+    
+    assert client.chat_completion(PAYLOAD).status_code == 503
+    assert server.requests == 1
+    assert sleeps == []
+
+def test_parse_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after('') is None
+    assert parse_retry_after('soon') is None
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(later, usegmt=True)) <= 30
+
+def test_circuit_breaker_opens_half_opens_and_closes(server, sleeps):
+    server.script = [(503, {}, 0), (503, {}, 0)]
+    client = make_client(server.url, max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    
+    assert client.chat_completion(PAYLOAD).status_code == 503
+    assert client.breaker.state == 'closed'
+    assert client.chat_completion(PAYLOAD).status_code == 503
+    assert client.breaker.state == 'open'
+    
+    # While open, calls fail fast without reaching the API
+    with pytest.raises(CircuitOpenError):
+        client.chat_completion(PAYLOAD)
+    assert server.requests == 2
+    assert client.stats()['rejected'] == 1
+    
+    # After the reset timeout one trial call goes through and closes the circuit
+    client.breaker.opened_at -= 0.2
+    assert client.breaker.state == 'half-open'
+    assert client.chat_completion(PAYLOAD).status_code == 200
+    assert client.breaker.state == 'closed'
+    assert client.stats()['circuit_open_count'] == 1
+
+def test_failed_trial_reopens_circuit(server, sleeps):
+    server.script = [(500, {}, 0), (500, {}, 0)]
+    client = make_client(server.url, max_retries=0, failure_threshold=1, reset_timeout=0.1)
+    
+    client.chat_completion(PAYLOAD)
+    assert client.breaker.state == 'open'
+    client.breaker.opened_at -= 0.1
+    assert client.breaker.state == 'half-open'
+    
+    assert client.chat_completion(PAYLOAD).status_code == 500
+    assert client.breaker.state == 'open'
+    assert client.stats()['circuit_open_count'] == 2
+
+def test_unexpected_error_in_trial_reopens_circuit(server, sleeps, monkeypatch):
+    server.script = [(500, {}, 0)]
+    client = make_client(server.url, max_retries=0, failure_threshold=1, reset_timeout=0.1)
+    client.chat_completion(PAYLOAD)
+    client.breaker.opened_at -= 0.1
+    
+    # An error that is not a requests exception must not leave the trial in flight
+    def broken_post(*args, **kwargs):
+        raise ValueError("bad payload")
+    monkeypatch.setattr(client.session, 'post', broken_post)
+    with pytest.raises(ValueError):
+        client.chat_completion(PAYLOAD)
+    assert client.breaker.state == 'open'
+    assert not client.breaker.trial_in_flight
+    
+    # The next reset timeout lets a new trial through
+    monkeypatch.delattr(client.session, 'post')
+    client.breaker.opened_at -= 0.1
+    assert client.chat_completion(PAYLOAD).status_code == 200
+    assert client.breaker.state == 'closed'
+
+def test_only_one_trial_call_while_half_open():
+    breaker = grok_client.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.allow_request()
+
+def test_read_timeout_is_separate_from_connect_timeout(server, sleeps):
+    client = make_client(server.url, max_retries=0, connect_timeout=5, read_timeout=0.2)
+    assert client.timeout == (5, 0.2)
+    
+    # A slow answer trips the read timeout, not the connect timeout
+    server.script = [(200, {}, 1.0)]
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.chat_completion(PAYLOAD)
+    assert client.stats()['errors'] == 1
+    
+    # An answer inside the read timeout succeeds
+    server.script = [(200, {}, 0.05)]
+    assert client.chat_completion(PAYLOAD).status_code == 200
+
+def test_latency_counters(server, sleeps):
+    server.script = [(200, {}, 0.05)]
+    client = make_client(server.url)
+    client.chat_completion(PAYLOAD)
+    
+    stats = client.stats()
+    assert stats['calls'] == 1
+    assert stats['errors'] == 0
+    assert stats['latency_max_seconds'] >= 0.05
+    assert stats['latency_avg_seconds'] == stats['latency_total_seconds']
+
+def test_requires_api_key(monkeypatch):
+    monkeypatch.delenv('GROK_API_KEY', raising=False)
+    with pytest.raises(GrokNotConfigured):
+        GrokClient(api_url='http://127.0.0.1:1/v1/chat/completions')
@@ -0,0 +1,44 @@
+"""Per-user data versions behind the page ETags"""
+from src.models.user import db, Chat, PROCESSING_PLACEHOLDER
+from src.services.http_cache import user_data_version
+from sqlalchemy import event
+from datetime import datetime
+
+def test_reply_replacing_placeholder_changes_the_etag(app, make_user):
+    client, user_id = make_user()
+    with app.app_context():
+        chat = Chat(user_id=user_id, message='Hello', response=PROCESSING_PLACEHOLDER, timestamp=datetime.utcnow())
+        db.session.add(chat)
+        db.session.commit()
+        chat_id = chat.id
+    
+    etag = client.get('/chat/history').headers['ETag']
+    assert client.get('/chat/history', headers={'If-None-Match': etag}).status_code == 304
+    
+    with app.app_context():
+        db.session.get(Chat, chat_id).response = 'Hi there'
+        db.session.commit()
+    assert client.get('/chat/history', headers={'If-None-Match': etag}).status_code == 200
+
+def test_data_version_reads_only_indexes(app, make_user):
+    _, user_id = make_user()
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            user_data_version(user_id, chats=True, tasks=True)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        statement, parameters = statements[-1]
+        plan = [row[-1] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    
+    searches = [step for step in plan if step.startswith(('SEARCH', 'SCAN chats', 'SCAN tasks'))]
+    assert searches == [
+        'SEARCH chats USING COVERING INDEX ix_chats_user_id_timestamp (user_id=?)',
+        'SEARCH chats USING INDEX ix_chats_user_id_pending_reply (user_id=?)',
+        'SEARCH tasks USING COVERING INDEX ix_tasks_user_id_completed_deadline (user_id=?)'
+    ]
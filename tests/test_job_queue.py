@@ -0,0 +1,120 @@
+from bench.mock_grok import REPLIES
+from src.models.user import db, ChatJob, Task
+from src.routes.chat import PROCESSING_PLACEHOLDER
+from src.services import job_queue
+from src.services.job_queue import claim_next_job, process_job, reclaim_abandoned_jobs
+from sqlalchemy import update
+from datetime import datetime, timedelta
+import threading
+
+def queue_message(client):
+    """Send a message with the queue enabled and claim its job; returns the job id"""
+    response = client.post('/chat/send', data={'message': 'Plan my week'})
+    assert response.status_code == 202
+    chat_id = response.get_json()['chat_id']
+    
+    # Leave only this test's job pending, so the claim takes it
+    ChatJob.query.filter(ChatJob.status == 'pending', ChatJob.chat_id != chat_id).update(
+        {'status': 'failed'}, synchronize_session=False)
+    db.session.commit()
+    job = claim_next_job()
+    assert job.chat_id == chat_id
+    return job.id
+
+def test_heartbeat_keeps_slow_job_leased(app, make_user, mock_grok, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    monkeypatch.setattr(job_queue, 'JOB_LEASE_SECONDS', 1)
+    monkeypatch.setattr(job_queue, 'PARTIAL_FLUSH_SECONDS', 0.1)
+    # About 10 chunks at 0.2s each, so the stream outlasts the lease
+    mock_grok(latency='fixed:0', task_rate=1.0, token_delay=0.2)
+    client, user_id = make_user()
+    
+    reclaimed = []
+    finished = threading.Event()
+    
+    def reclaim_while_running():
+        with app.app_context():
+            while not finished.wait(0.3):
+                reclaimed.append(reclaim_abandoned_jobs())
+    
+    with app.app_context():
+        job_id = queue_message(client)
+        reclaimer = threading.Thread(target=reclaim_while_running)
+        reclaimer.start()
+        try:
+            process_job(db.session.get(ChatJob, job_id))
+        finally:
+            finished.set()
+            reclaimer.join()
+        
+        job = db.session.get(ChatJob, job_id)
+        assert job.status == 'done'
+        assert job.attempts == 1
+        assert job.chat.response.startswith(tuple(REPLIES))
+        assert Task.query.filter_by(user_id=user_id).count() == 1
+    assert sum(reclaimed) == 0
+
+def test_reclaimed_worker_cannot_finish(app, make_user, mock_grok, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    mock_grok(latency='fixed:0', task_rate=1.0, token_delay=0)
+    client, user_id = make_user()
+    
+    with app.app_context():
+        job_id = queue_message(client)
+        job = db.session.get(ChatJob, job_id)
+        assert job.claim_token
+        
+        # Meanwhile the lease expired and another worker claimed the job
+        with db.engine.begin() as connection:
+            connection.execute(update(ChatJob).where(ChatJob.id == job_id).values(claim_token='other-worker'))
+        
+        process_job(job)
+        
+        db.session.expire_all()
+        job = db.session.get(ChatJob, job_id)
+        assert job.status == 'running'
+        assert job.claim_token == 'other-worker'
+        assert job.chat.response == PROCESSING_PLACEHOLDER
+        assert Task.query.filter_by(user_id=user_id).count() == 0
+
+def test_reclaim_uses_heartbeat(app, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    client, user_id = make_user()
+    
+    with app.app_context():
+        job_id = queue_message(client)
+        now = datetime.utcnow()
+        
+        # Started long ago but still streaming: not reclaimed
+        ChatJob.query.filter_by(id=job_id).update({
+            'started_at': now - timedelta(seconds=job_queue.JOB_LEASE_SECONDS * 3),
+            'heartbeat_at': now
+        }, synchronize_session=False)
+        db.session.commit()
+        assert reclaim_abandoned_jobs() == 0
+        
+        # No heartbeat for longer than the lease: back to the queue
+        ChatJob.query.filter_by(id=job_id).update({
+            'heartbeat_at': now - timedelta(seconds=job_queue.JOB_LEASE_SECONDS + 1)
+        }, synchronize_session=False)
+        db.session.commit()
+        assert reclaim_abandoned_jobs() == 1
+        job = db.session.get(ChatJob, job_id)
+        assert job.status == 'pending'
+        assert job.claim_token is None
+
+def test_maintenance_only_pool_leaves_jobs_alone(app, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    client, _ = make_user()
+    chat_id = client.post('/chat/send', data={'message': 'Plan my week'}).get_json()['chat_id']
+    
+    pool = job_queue.ChatWorkerPool(app, 1, take_jobs=False)
+    assert [name for name, _, _ in pool._periodic if name == 'reclaim'] == []
+    pool.start()
+    try:
+        threading.Event().wait(0.3)
+    finally:
+        pool.stop(timeout=5)
+    
+    with app.app_context():
+        assert ChatJob.query.filter_by(chat_id=chat_id).one().status == 'pending'
@@ -0,0 +1,44 @@
+from src.models.user import db
+from src.migrations import upgrade, MIGRATIONS, MIGRATIONS_TABLE
+from sqlalchemy import create_engine, inspect
+
+def schema(engine, tables):
+    """Columns, primary keys and indexes of the given tables"""
+    inspector = inspect(engine)
+    result = {}
+    for table in tables:
+        result[table] = {
+            'columns': {column['name']: column['nullable'] for column in inspector.get_columns(table)},
+            'primary_key': sorted(inspector.get_pk_constraint(table)['constrained_columns']),
+            'indexes': {index['name']: (index['column_names'], bool(index['unique'])) for index in inspector.get_indexes(table)},
+            'foreign_keys': sorted((tuple(key['constrained_columns']), key['referred_table']) for key in inspector.get_foreign_keys(table))
+        }
+    return result
+
+def test_migrations_build_the_model_schema(tmp_path):
+    migrated = create_engine(f"sqlite:///{tmp_path / 'migrated.db'}")
+    assert upgrade(migrated) == [version for version, _, _, _ in MIGRATIONS]
+    assert upgrade(migrated) == []
+    
+    modelled = create_engine(f"sqlite:///{tmp_path / 'modelled.db'}")
+    db.metadata.create_all(modelled)
+    
+    tables = sorted(db.metadata.tables)
+    assert set(tables) <= set(inspect(migrated).get_table_names())
+    assert schema(migrated, tables) == schema(modelled, tables)
+    assert MIGRATIONS_TABLE in inspect(migrated).get_table_names()
+
+def test_initial_schema_is_frozen(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'initial.db'}")
+    _, _, create_initial_schema, _ = MIGRATIONS[0]
+    with engine.begin() as connection:
+        create_initial_schema(connection)
+    
+    # Columns added by later migrations are left to those migrations
+    columns = {table: {column['name'] for column in inspect(engine).get_columns(table)}
+               for table in ('users', 'tasks', 'chat_jobs', 'stat_counters')}
+    assert 'auth_version' not in columns['users']
+    assert 'overdue_at' not in columns['tasks']
+    assert 'heartbeat_at' not in columns['chat_jobs']
+    assert 'shard' not in columns['stat_counters']
+    assert 'system_prompts' not in inspect(engine).get_table_names()
@@ -0,0 +1,69 @@
+"""Every blueprint's pages stay within their declared query budgets on a user with a long history"""
+from bench.query_budget import seed
+from src.models.user import db, Chat, Task
+import pytest
+
+@pytest.fixture
+def busy_user(app, make_user):
+    """A user with enough chats and tasks that any per-row query shows up as N+1"""
+    client, user_id = make_user()
+    with app.app_context():
+        seed(db, user_id, chats=60, tasks=30)
+    return client, user_id
+
+def test_auth_budget(app, busy_user, within_budget):
+    client, _ = busy_user
+    assert within_budget(app.test_client(), 'GET', '/login').status_code == 200
+    assert within_budget(client, 'GET', '/profile').status_code == 200
+
+def test_chat_budget(app, busy_user, within_budget, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    client, _ = busy_user
+    assert within_budget(client, 'GET', '/chat/').status_code == 200
+    assert within_budget(client, 'GET', '/chat/history').status_code == 200
+    
+    response = within_budget(client, 'POST', '/chat/send', {'message': 'Plan my week'})
+    assert response.status_code == 202
+    assert within_budget(client, 'GET', f"/chat/result/{response.get_json()['chat_id']}").status_code == 200
+
+def test_task_budget(app, busy_user, within_budget):
+    client, user_id = busy_user
+    assert within_budget(client, 'GET', '/task/').status_code == 200
+    assert within_budget(client, 'GET', '/task/api').status_code == 200
+    assert within_budget(client, 'POST', '/task/add', {'description': 'Budget task', 'days': '2'}).status_code == 302
+    
+    with app.app_context():
+        task_id = Task.query.filter_by(user_id=user_id, completed=False).first().id
+    assert within_budget(client, 'POST', f"/task/complete/{task_id}").status_code == 302
+
+def test_events_budget(app, busy_user, within_budget):
+    client, _ = busy_user
+    assert within_budget(client, 'GET', '/events/?wait=0').status_code == 200
+
+def test_admin_budget(app, busy_user, admin_client, within_budget):
+    _, user_id = busy_user
+    for path in ['/admin/', '/admin/users', '/admin/api/users', '/admin/system-prompt', f"/admin/user/{user_id}",
+                 f"/admin/api/user/{user_id}/chats", f"/admin/api/user/{user_id}/archive",
+                 '/admin/search?q=message', '/admin/api/search?q=task&type=tasks']:
+        assert within_budget(admin_client, 'GET', path).status_code == 200
+    
+    response = within_budget(admin_client, 'POST', f"/admin/user/{user_id}/assign-task", {'description': 'Admin task', 'days': '1'})
+    assert response.status_code == 302
+    
+    with app.app_context():
+        chat_id = Chat.query.filter_by(user_id=user_id).first().id
+    assert within_budget(admin_client, 'POST', f"/admin/chat/{chat_id}/delete").status_code == 302
+
+def test_budgets_and_request_metrics_count_the_same_statements(app, busy_user):
+    from src.services.query_budget import count_queries
+    from prometheus_client import REGISTRY
+    
+    client, _ = busy_user
+    def observed():
+        return REGISTRY.get_sample_value('http_request_db_queries_sum', {'endpoint': '/task/api'}) or 0.0
+    
+    before = observed()
+    with count_queries() as log:
+        assert client.get('/task/api').status_code == 200
+    assert log.count > 0
+    assert observed() - before == log.count
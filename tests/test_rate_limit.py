@@ -0,0 +1,109 @@
+"""Per-user chat token bucket and in-flight lease"""
+from src.models.user import db, ChatRateLimit
+from src.services import rate_limit
+from src.services.rate_limit import acquire_chat_slot, release_chat_slot, RateLimited
+from sqlalchemy import update
+from datetime import datetime, timedelta
+import pytest
+
+@pytest.fixture
+def limits(monkeypatch):
+    """Two messages of burst for users and four for admins, refilled at one per minute"""
+    monkeypatch.setattr(rate_limit, 'CHAT_RATE_BURST', 2)
+    monkeypatch.setattr(rate_limit, 'CHAT_RATE_PER_MINUTE', 1)
+    monkeypatch.setattr(rate_limit, 'ADMIN_CHAT_RATE_BURST', 4)
+    monkeypatch.setattr(rate_limit, 'ADMIN_CHAT_RATE_PER_MINUTE', 1)
+
+def send(user_id, is_admin=False):
+    """Take a slot and answer at once, as a completed reply would"""
+    acquire_chat_slot(user_id, is_admin=is_admin)
+    release_chat_slot(user_id)
+    db.session.commit()
+
+def rewind(user_id, seconds):
+    bucket = db.session.get(ChatRateLimit, user_id)
+    bucket.refilled_at -= timedelta(seconds=seconds)
+    db.session.commit()
+
+def test_bucket_empties_and_refills(app, make_user, limits):
+    _, user_id = make_user()
+    with app.app_context():
+        send(user_id)
+        send(user_id)
+        with pytest.raises(RateLimited) as rejected:
+            acquire_chat_slot(user_id)
+        db.session.rollback()
+        assert rejected.value.reason == 'rate'
+        assert 55 <= rejected.value.retry_after <= 60
+        
+        # A minute later one token is back, and only one
+        rewind(user_id, 61)
+        send(user_id)
+        with pytest.raises(RateLimited):
+            acquire_chat_slot(user_id)
+        db.session.rollback()
+
+def test_admins_get_the_admin_burst(app, make_user, limits):
+    _, user_id = make_user()
+    with app.app_context():
+        for _ in range(4):
+            send(user_id, is_admin=True)
+        with pytest.raises(RateLimited):
+            acquire_chat_slot(user_id, is_admin=True)
+        db.session.rollback()
+
+def test_one_reply_in_flight_until_released_or_expired(app, make_user, limits):
+    _, user_id = make_user()
+    with app.app_context():
+        acquire_chat_slot(user_id)
+        db.session.commit()
+        with pytest.raises(RateLimited) as rejected:
+            acquire_chat_slot(user_id)
+        db.session.rollback()
+        assert rejected.value.reason == 'inflight'
+        assert rejected.value.retry_after == rate_limit.INFLIGHT_RETRY_AFTER_SECONDS
+        
+        # A worker that died never releases the lease; it expires instead
+        db.session.execute(update(ChatRateLimit).where(ChatRateLimit.user_id == user_id)
+                           .values(inflight_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        acquire_chat_slot(user_id)
+        db.session.commit()
+
+def test_concurrent_claim_wins_the_compare_and_set(app, make_user, limits, monkeypatch):
+    _, user_id = make_user()
+    real_load_bucket = rate_limit._load_bucket
+    
+    def load_then_lose_the_race(user_id, burst, now):
+        bucket = real_load_bucket(user_id, burst, now)
+        # Another process claims between this read and the conditional update
+        db.session.execute(update(ChatRateLimit).where(ChatRateLimit.user_id == user_id)
+                           .values(refilled_at=now + timedelta(microseconds=1)).execution_options(synchronize_session=False))
+        return bucket
+    
+    with app.app_context():
+        send(user_id)
+        monkeypatch.setattr(rate_limit, '_load_bucket', load_then_lose_the_race)
+        with pytest.raises(RateLimited) as rejected:
+            acquire_chat_slot(user_id)
+        db.session.rollback()
+        assert (rejected.value.reason, rejected.value.retry_after) == ('inflight', 1)
+
+def test_new_bucket_is_not_committed_on_its_own(app, make_user, limits):
+    _, user_id = make_user()
+    with app.app_context():
+        acquire_chat_slot(user_id)
+        assert db.session.get(ChatRateLimit, user_id) is not None
+        # Saving the message failed: the bucket and the claim roll back with it
+        db.session.rollback()
+        assert db.session.get(ChatRateLimit, user_id) is None
+
+def test_send_answers_429_while_a_reply_is_pending(app, make_user, monkeypatch):
+    monkeypatch.setitem(app.config, 'CHAT_QUEUE_ENABLED', True)
+    client, _ = make_user()
+    assert client.post('/chat/send', data={'message': 'First'}).status_code == 202
+    
+    response = client.post('/chat/send', data={'message': 'Second'})
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(rate_limit.INFLIGHT_RETRY_AFTER_SECONDS)
+    assert response.get_json()['error'] == 'Please wait for the previous reply before sending another message'
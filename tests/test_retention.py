@@ -0,0 +1,46 @@
+"""Chat archiving and reading archived history back"""
+from src.models.user import db, Chat, ChatArchiveSegment
+from src.services import retention
+from src.services.retention import archive_old_chats
+from datetime import datetime, timedelta
+import json
+
+def test_archived_chats_round_trip_through_the_archive_view_and_export(app, admin_client, make_user, monkeypatch):
+    monkeypatch.setattr(retention, 'ARCHIVE_SEGMENT_MAX_CHATS', 2)
+    _, user_id = make_user()
+    with app.app_context():
+        # Written newest first, so id order and timestamp order disagree
+        old = datetime.utcnow() - timedelta(days=60)
+        for day in range(5, 0, -1):
+            db.session.add(Chat(user_id=user_id, message=f'Question {day}', response=f'Answer {day}',
+                                timestamp=old + timedelta(days=day)))
+        db.session.add(Chat(user_id=user_id, message='Recent', response='Still hot', timestamp=datetime.utcnow()))
+        db.session.commit()
+        old_ids = [chat.id for chat in Chat.query.filter(Chat.user_id == user_id, Chat.timestamp < old + timedelta(days=10))]
+        
+        assert archive_old_chats(max_age_days=30, batch_size=3) == 5
+        assert [chat.message for chat in Chat.query.filter_by(user_id=user_id)] == ['Recent']
+        assert ChatArchiveSegment.query.filter_by(user_id=user_id).count() == 3
+    
+    # The archive view pages back one segment at a time, newest segment first
+    pages = []
+    cursor = None
+    while True:
+        path = f'/admin/api/user/{user_id}/archive' + (f'?before={cursor}' if cursor else '')
+        body = admin_client.get(path).get_json()
+        pages.append(body['chats'])
+        cursor = body['older_cursor']
+        if cursor is None:
+            break
+    archived = [chat for page in reversed(pages) for chat in page]
+    assert sorted(chat['id'] for chat in archived) == sorted(old_ids)
+    assert {chat['message']: chat['response'] for chat in archived} == {
+        f'Question {day}': f'Answer {day}' for day in range(1, 6)}
+    
+    # Exports list the archived chats before the hot ones
+    response = admin_client.get(f'/admin/export?dataset=chats&format=jsonl&user_id={user_id}')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['archived'] for row in rows] == [True] * 5 + [False]
+    assert sorted(row['id'] for row in rows[:5]) == sorted(old_ids)
+    assert {row['message'] for row in rows[:5]} == {chat['message'] for chat in archived}
+    assert rows[5]['message'] == 'Recent'
@@ -0,0 +1,49 @@
+from src.models.user import db, Chat, StatCounter
+from src.services.stats import get_counters, rebuild_stats, STAT_SHARDS
+from sqlalchemy import func
+from datetime import datetime
+
+def test_counters_spread_writes_over_shards(app, make_user):
+    client, user_id = make_user()
+    
+    with app.app_context():
+        rebuild_stats()
+        before = get_counters()
+        assert db.session.query(func.count()).select_from(StatCounter).filter(StatCounter.shard != 0).scalar() == 0
+        
+        for index in range(40):
+            db.session.add(Chat(user_id=user_id, message=f"message {index}", response='ok', timestamp=datetime.utcnow()))
+            db.session.commit()
+        
+        assert get_counters()['chats'] == before['chats'] + 40
+        shards = db.session.query(StatCounter.shard).filter(StatCounter.name == 'chats', StatCounter.shard != 0).all()
+        assert 1 < len(shards) <= STAT_SHARDS
+        
+        # A rebuild folds the shards back into one base row with the same total
+        rebuild_stats()
+        assert get_counters() == dict(before, chats=before['chats'] + 40)
+        assert StatCounter.query.filter_by(name='chats').count() == 1
+
+def test_counters_not_built_until_rebuild(app):
+    with app.app_context():
+        StatCounter.query.delete()
+        db.session.commit()
+        assert get_counters() is None
+        rebuild_stats()
+        assert get_counters() is not None
+
+def test_dashboard_does_not_rebuild_missing_counters(app, admin_client):
+    with app.app_context():
+        StatCounter.query.delete()
+        db.session.commit()
+    
+    response = admin_client.get('/admin/')
+    assert response.status_code == 200
+    assert b'Totals are not built yet' in response.data
+    with app.app_context():
+        assert get_counters() is None
+    
+    # The deploy step builds them
+    result = app.test_cli_runner().invoke(args=['db', 'setup'])
+    assert 'Built the activity rollups' in result.output
+    assert b'Totals are not built yet' not in admin_client.get('/admin/').data